@@ -0,0 +1,130 @@
+# admin_stats.py
+"""
+Admin dashboard data without loading whole tables.
+
+get_admin_stats() returns every dashboard counter from one aggregate query
+per table. The user, learnership and application tables are served a page
+at a time, filtered in SQL, by the /admin/api/* endpoints in app.py.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import joinedload
+
+from models import db, User, Application, LearnershipEmail, UserActivity
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+# Stand-in pagination for the dashboard's error fallback
+EMPTY_PAGE = SimpleNamespace(items=[], total=0, page=1, pages=0, has_prev=False, has_next=False)
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _row_dict(row):
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+
+def get_premium_stats():
+    now = datetime.utcnow()
+    premium = User.is_premium == True
+    row = db.session.execute(
+        select(
+            func.count(User.id).label('total_users'),
+            _count_if(premium).label('total_premium'),
+            _count_if(premium & (User.premium_expires.is_(None) | (User.premium_expires > now))).label('active_premium'),
+        )
+    ).one()
+    stats = _row_dict(row)
+    stats['expired_premium'] = stats['total_premium'] - stats['active_premium']
+    return stats
+
+
+def get_admin_stats():
+    """Dashboard counters: users, active users, active learnerships, applications"""
+    users = db.session.execute(
+        select(
+            func.count(User.id).label('total_users'),
+            _count_if(User.is_active == True).label('active_users'),
+        )
+    ).one()
+
+    stats = _row_dict(users)
+    stats['total_learnerships'] = db.session.scalar(
+        select(func.count(LearnershipEmail.id)).where(LearnershipEmail.is_active == True)
+    ) or 0
+    stats['total_applications'] = db.session.scalar(select(func.count(Application.id))) or 0
+    return stats
+
+
+def _paginate(query, page, per_page):
+    per_page = max(1, min(int(per_page or DEFAULT_PER_PAGE), MAX_PER_PAGE))
+    return query.paginate(page=max(1, int(page or 1)), per_page=per_page, error_out=False)
+
+
+def _like(search):
+    return f"%{search.strip()}%"
+
+
+def users_page(search=None, page=1, per_page=DEFAULT_PER_PAGE):
+    query = User.query
+    if search and search.strip():
+        pattern = _like(search)
+        query = query.filter(or_(
+            User.email.ilike(pattern),
+            User.full_name.ilike(pattern),
+            User.username.ilike(pattern),
+            User.role.ilike(pattern),
+        ))
+    pagination = _paginate(query.order_by(User.created_at.desc(), User.id.desc()), page, per_page)
+
+    # Last request from each user on this page (session_activity.py), in one query
+    user_ids = [item.id for item in pagination.items]
+    last_active = dict(db.session.execute(
+        select(UserActivity.user_id, UserActivity.last_activity)
+        .where(UserActivity.user_id.in_(user_ids))
+    ).all()) if user_ids else {}
+    for item in pagination.items:
+        item.last_active = last_active.get(item.id)
+    return pagination
+
+
+def learnerships_page(search=None, page=1, per_page=DEFAULT_PER_PAGE):
+    """Active learnership emails, with applications_count set on each item"""
+    query = LearnershipEmail.query.filter(LearnershipEmail.is_active == True)
+    if search and search.strip():
+        pattern = _like(search)
+        query = query.filter(or_(
+            LearnershipEmail.company_name.ilike(pattern),
+            LearnershipEmail.email_address.ilike(pattern),
+        ))
+    pagination = _paginate(query.order_by(LearnershipEmail.created_at.desc(), LearnershipEmail.id.desc()), page, per_page)
+
+    # Applications sent to each address on this page, in one grouped query
+    emails = [item.email_address for item in pagination.items]
+    counts = dict(db.session.execute(
+        select(Application.company_email, func.count(Application.id))
+        .where(Application.company_email.in_(emails))
+        .group_by(Application.company_email)
+    ).all()) if emails else {}
+    for item in pagination.items:
+        item.applications_count = counts.get(item.email_address, 0)
+    return pagination
+
+
+def applications_page(search=None, page=1, per_page=DEFAULT_PER_PAGE):
+    query = Application.query.options(joinedload(Application.user))
+    if search and search.strip():
+        pattern = _like(search)
+        query = query.join(Application.user).filter(or_(
+            Application.company_name.ilike(pattern),
+            Application._learnership_name.ilike(pattern),
+            Application.status.ilike(pattern),
+            User.email.ilike(pattern),
+            User.full_name.ilike(pattern),
+        ))
+    return _paginate(query.order_by(Application.submitted_at.desc(), Application.id.desc()), page, per_page)
@@ -21,7 +21,7 @@ from urllib.parse import quote_plus
 # Flask imports
 from flask import (
     Flask, render_template, redirect, url_for, flash, request,
-    jsonify, session, send_file, g, jsonify
+    jsonify, session, send_file, g, jsonify, Response, stream_with_context
 )
 from flask_login import (
     LoginManager, login_user, logout_user, login_required, current_user
@@ -40,6 +40,7 @@ import uuid
 # Third-party imports
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
+from sqlalchemy.orm import joinedload
 
 # Add these imports at the top of your app.py file (around line 10-20)
 from decorators import admin_required, premium_required, check_application_limit, track_application_usage
@@ -56,7 +57,8 @@ from models import (
     db, User, Application, Document,
     GoogleToken,LearnershipEmail,
     CalendarEvent, ApplicationMessage,
-    Conversation, ConversationMessage,PremiumTransaction
+    Conversation, ConversationMessage,PremiumTransaction,
+    SendJob, has_codecraftco_signature
 )
 from forms import (
     AdminLoginForm, EditProfileForm, ChangePasswordForm,
@@ -64,6 +66,17 @@ from forms import (
 )
 from decorators import admin_required
 from tasks import launch_bulk_send
+from send_jobs import enqueue_email_list_job, get_active_jobs
+from stats_service import get_user_stats
+from application_list import fetch_page, DEFAULT_PAGE_SIZE
+from corporate_rollup import get_corporate_analytics
+from admin_stats import (
+    DEFAULT_PER_PAGE, EMPTY_PAGE, get_admin_stats, get_premium_stats,
+    users_page, learnerships_page, applications_page,
+)
+from inbox_counters import get_badge as get_inbox_badge, not_modified as badge_not_modified
+from user_events import stream as user_event_stream
+from timeseries import current_week_responses as current_week_responses_for, weekly_response_trend
 from security_middleware import add_security_headers
 
 # =============================================================================
@@ -293,7 +306,7 @@ def validate_session():
             flash("Session expired. Please log in again.", "warning")
             return redirect(url_for("login"))
 
-        # DB-side validation
+        # Checked against the already-loaded user row: no extra query, no write
         if not current_user.is_session_valid(session_token, client_ip):
             session.clear()
             logout_user()
@@ -307,7 +320,7 @@ def validate_session():
             flash("Your account has been deactivated.", "error")
             return redirect(url_for("login"))
 
-        # Extend session (auto-refresh)
+        # Extend session (auto-refresh) - only written once it drops below 30 min
         if current_user.session_expires:
             remaining = current_user.session_expires - datetime.utcnow()
             if remaining.total_seconds() < 1800:  # 30 min
@@ -315,6 +328,14 @@ def validate_session():
 
         g.current_user = current_user
 
+        # Unchanged inbox badge polls: answered from memory once the session checks pass
+        if request.endpoint == "inbox_unread_count":
+            etag = badge_not_modified(current_user.id, request.if_none_match)
+            if etag:
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
     else:
         # ✅ FIXED: Only redirect for protected routes, not public ones
         # The excluded check above should handle this, but this is a fallback
@@ -480,177 +501,23 @@ def admin_login():
 # DOMAIN CHECKER SERVICE INSTANCE
 # =============================================================================
 import os
-import smtplib
-import socket
-import time
 from datetime import datetime, timedelta
-import threading
-import json
-
-# Add this after your existing imports
-try:
-    import dns.resolver
-except ImportError:
-    print("⚠️  dnspython not installed. Install with: pip install dnspython")
-    dns = None
-
-# Email checking functions
-def check_email_reachability(email_address):
-    """Check if an email address is reachable via SMTP"""
-    if not dns:
-        return False, None
-        
-    try:
-        start_time = time.time()
-        
-        # Extract domain
-        if '@' not in email_address:
-            return False, None
-            
-        domain = email_address.split('@')[1].lower()
-        
-        # Check MX records
-        try:
-            mx_records = dns.resolver.resolve(domain, 'MX')
-            if not mx_records:
-                return False, None
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, Exception):
-            return False, None
-        
-        # Get the first MX record
-        mx_record = str(mx_records[0].exchange).rstrip('.')
-        
-        # Try SMTP connection
-        try:
-            # Connect to mail server
-            server = smtplib.SMTP(timeout=15)
-            server.connect(mx_record, 25)
-            server.helo('codecraft.co.za')
-            
-            # Test the email
-            server.mail('noreply@codecraft.co.za')
-            code, message = server.rcpt(email_address)
-            server.quit()
-            
-            response_time = time.time() - start_time
-            
-            # Check if email is accepted (codes 250, 251, 252 are usually OK)
-            is_valid = code in [250, 251, 252]
-            
-            return is_valid, response_time
-            
-        except (smtplib.SMTPException, socket.error, ConnectionRefusedError):
-            return False, None
-            
-    except Exception as e:
-        print(f"Error checking {email_address}: {e}")
-        return False, None
 
-def check_email_batch(limit=50):
-    """Check a batch of emails for reachability"""
-    with app.app_context():
-        try:
-            # Get unchecked emails or emails that haven't been checked in 24 hours
-            emails_to_check = LearnershipEmail.query.filter(
-                db.or_(
-                    LearnershipEmail.is_reachable.is_(None),
-                    db.and_(
-                        LearnershipEmail.last_checked.isnot(None),
-                        LearnershipEmail.last_checked < datetime.utcnow() - timedelta(hours=24)
-                    )
-                )
-            ).limit(limit).all()
-            
-            print(f"Checking {len(emails_to_check)} emails...")
-            
-            for i, email in enumerate(emails_to_check):
-                try:
-                    print(f"Checking {i+1}/{len(emails_to_check)}: {email.email_address}")
-                    
-                    is_reachable, response_time = check_email_reachability(email.email_address)
-                    
-                    # Update email record
-                    email.is_reachable = is_reachable
-                    email.response_time = response_time
-                    email.last_checked = datetime.utcnow()
-                    email.check_count = (email.check_count or 0) + 1
-                    
-                    # Commit each update
-                    db.session.commit()
-                    
-                    result = "✓" if is_reachable else "✗"
-                    time_str = f" ({response_time:.2f}s)" if response_time else ""
-                    print(f"  Result: {result}{time_str}")
-                    
-                    # Small delay to avoid being blocked
-                    time.sleep(2)
-                    
-                except Exception as e:
-                    print(f"Error checking {email.email_address}: {e}")
-                    db.session.rollback()
-                    continue
-            
-            print("Email check batch completed!")
-            
-        except Exception as e:
-            print(f"Error in check_email_batch: {e}")
+from domain_checker.email_checker_service import email_checker
+from domain_checker.status import get_status as get_reachability_status
 
 # API Routes
 @app.route('/api/email-status')
 @login_required
 def get_email_status():
-    """API endpoint to get email reachability status"""
+    """
+    Email reachability status: SQL counts plus the reachable list, cached
+    briefly (domain_checker/status.py). Read only - checks run in
+    reachability_worker.py.
+    """
     try:
-        # Get all emails from database
-        emails = LearnershipEmail.query.all()
-        
-        # If no emails have been checked yet, start a background check
-        unchecked_count = LearnershipEmail.query.filter_by(is_reachable=None).count()
-        
-        if unchecked_count > 0:
-            # Start background check for unchecked emails (limit to first 50)
-            threading.Thread(target=check_email_batch, args=(50,), daemon=True).start()
-        
-        # Get reachable emails
-        reachable_emails = LearnershipEmail.query.filter_by(is_reachable=True).all()
-        
-        # Format email data
-        email_list = []
-        for email in reachable_emails:
-            email_list.append({
-                'id': email.id,
-                'company_name': email.company_name,
-                'email_address': email.email_address,
-                'status': 'reachable',
-                'response_time': email.response_time
-            })
-        
-        # Calculate stats
-        total_count = len(emails)
-        reachable_count = len(reachable_emails)
-        checked_count = LearnershipEmail.query.filter(LearnershipEmail.is_reachable.isnot(None)).count()
-        
-        stats = {
-            'total': total_count,
-            'reachable': reachable_count,
-            'unreachable': checked_count - reachable_count,
-            'unchecked': total_count - checked_count
-        }
-        
-        # Get last update time
-        last_checked_email = LearnershipEmail.query.filter(
-            LearnershipEmail.last_checked.isnot(None)
-        ).order_by(LearnershipEmail.last_checked.desc()).first()
-        
-        last_updated = last_checked_email.last_checked.isoformat() if last_checked_email and last_checked_email.last_checked else None
-        
-        return jsonify({
-            'emails': email_list,
-            'stats': stats,
-            'last_updated': last_updated,
-            'status': 'success'
-        })
-        
+        return jsonify({**get_reachability_status(), 'status': 'success'})
+
     except Exception as e:
         print(f"Error in get_email_status: {e}")
         return jsonify({
@@ -669,143 +536,13 @@ def admin_check_emails():
         flash('Access denied.', 'error')
         return redirect(url_for('feed'))
     
-    # Start background email check
-    threading.Thread(target=check_email_batch, args=(100,), daemon=True).start()
+    # Make every active address due; the reachability worker picks them up within a minute
+    queued = email_checker.request_recheck()
     
-    flash('Email checking started in background. Check back in a few minutes.', 'info')
+    flash(f'{queued} emails queued for checking. Check back in a few minutes.', 'info')
     return redirect(url_for('admin_dashboard'))
 
 
-# Add these imports at the top if not already present
-import threading
-try:
-    import dns.resolver
-except ImportError:
-    print("⚠️  dnspython not installed. Install with: pip install dnspython")
-    dns = None
-
-# Add these functions (only if they don't exist already)
-def check_email_reachability(email_address):
-    """Check if an email address is reachable via SMTP"""
-    if not dns:
-        return True, None  # Default to True if DNS checking is unavailable
-        
-    try:
-        start_time = time.time()
-        
-        if '@' not in email_address:
-            return False, None
-            
-        domain = email_address.split('@')[1].lower()
-        
-        # Check MX records
-        try:
-            mx_records = dns.resolver.resolve(domain, 'MX')
-            if not mx_records:
-                return False, None
-        except:
-            return False, None
-        
-        response_time = time.time() - start_time
-        return True, response_time  # Simplified - assume reachable if MX exists
-            
-    except Exception as e:
-        print(f"Error checking {email_address}: {e}")
-        return False, None
-
-def check_email_batch_background(limit=20):
-    """Check a batch of emails for reachability in background"""
-    with app.app_context():
-        try:
-            # Get unchecked emails
-            emails_to_check = LearnershipEmail.query.filter_by(is_reachable=None).limit(limit).all()
-            
-            print(f"Background checking {len(emails_to_check)} emails...")
-            
-            for email in emails_to_check:
-                try:
-                    is_reachable, response_time = check_email_reachability(email.email_address)
-                    
-                    email.is_reachable = is_reachable
-                    email.response_time = response_time
-                    email.last_checked = datetime.utcnow()
-                    email.check_count = (email.check_count or 0) + 1
-                    
-                    db.session.commit()
-                    
-                    time.sleep(1)  # Small delay
-                    
-                except Exception as e:
-                    print(f"Error checking {email.email_address}: {e}")
-                    db.session.rollback()
-                    continue
-            
-            print(f"Completed background email check")
-            
-        except Exception as e:
-            print(f"Error in background email check: {e}")
-
-# Add ONLY this new route (with unique name)
-@app.route('/api/email-status')
-@login_required
-def api_email_status():
-    """API endpoint to get email reachability status"""
-    try:
-        # Get all emails
-        emails = LearnershipEmail.query.all()
-        
-        # Start background check if needed
-        unchecked_count = LearnershipEmail.query.filter_by(is_reachable=None).count()
-        if unchecked_count > 0:
-            threading.Thread(target=check_email_batch_background, args=(50,), daemon=True).start()
-        
-        # Get reachable emails
-        reachable_emails = LearnershipEmail.query.filter_by(is_reachable=True).all()
-        
-        # Format email data
-        email_list = []
-        for email in reachable_emails:
-            email_list.append({
-                'id': email.id,
-                'company_name': email.company_name,
-                'email_address': email.email_address,
-                'status': 'reachable',
-                'response_time': email.response_time
-            })
-        
-        # Calculate stats
-        total_count = len(emails)
-        reachable_count = len(reachable_emails)
-        checked_count = LearnershipEmail.query.filter(LearnershipEmail.is_reachable.isnot(None)).count()
-        
-        stats = {
-            'total': total_count,
-            'reachable': reachable_count,
-            'unreachable': checked_count - reachable_count,
-            'unchecked': total_count - checked_count
-        }
-        
-        # Get last update time
-        last_checked_email = LearnershipEmail.query.filter(
-            LearnershipEmail.last_checked.isnot(None)
-        ).order_by(LearnershipEmail.last_checked.desc()).first()
-        
-        last_updated = last_checked_email.last_checked.isoformat() if last_checked_email and last_checked_email.last_checked else None
-        
-        return jsonify({
-            'emails': email_list,
-            'stats': stats,
-            'last_updated': last_updated,
-            'status': 'success'
-        })
-        
-    except Exception as e:
-        print(f"Error in api_email_status: {e}")
-        return jsonify({
-            'emails': [],
-            'stats': {'total': 0, 'reachable': 0, 'unreachable': 0},
-            'error': str(e)
-        }), 500
 # =============================================================================
 # GOOGLE LOGIN
 # =============================================================================
@@ -931,6 +668,10 @@ def google_callback():
 
         google_token = GoogleToken.query.filter_by(user_id=user.id).first()
 
+        if google_token and not token_data["refresh_token"]:
+            # Google only returns a refresh token on first consent; keep the stored one
+            token_data["refresh_token"] = json.loads(google_token.token_json or '{}').get("refresh_token")
+
         if google_token:
             google_token.token_json = json.dumps(token_data)
             google_token.refreshed_at = datetime.utcnow()
@@ -1008,45 +749,24 @@ def user_dashboard():
             .all()
         )
 
-        # Get documents count
-        doc_count = Document.query.filter_by(
-            user_id=current_user.id, is_active=True
-        ).count()
-
-        # Get application statistics
-        total_apps = Application.query.filter_by(user_id=current_user.id).count()
-        pending_apps = Application.query.filter_by(
-            user_id=current_user.id, status="pending"
-        ).count()
-        submitted_apps = Application.query.filter_by(
-            user_id=current_user.id, status="submitted"
-        ).count()
-        responded = Application.query.filter_by(
-            user_id=current_user.id, has_response=True  # Fixed: use has_response instead of email_status
-        ).count()
+        # All counters from one cached aggregate query (stats_service.py)
+        counts = get_user_stats(current_user.id)
+        doc_count = counts["documents"]
+        total_apps = counts["total"]
 
         # Calculate response rate
-        response_rate = round((responded / total_apps * 100) if total_apps > 0 else 0)
+        response_rate = round((counts["responses"] / total_apps * 100) if total_apps > 0 else 0)
 
         stats = {
             "total": total_apps,
-            "pending": pending_apps,
-            "submitted": submitted_apps,  # Added submitted count
-            "responses": responded,
-            "response_rate": response_rate,  # Fixed: calculate actual rate
+            "pending": counts["pending"],
+            "submitted": counts["submitted"],
+            "responses": counts["responses"],
+            "response_rate": response_rate,
         }
 
         profile_completion = calculate_profile_completion(current_user)
 
-        # Debug output
-        print(f"📊 Dashboard Stats for user {current_user.id}:")
-        print(f"   Total Applications: {total_apps}")
-        print(f"   Pending: {pending_apps}")
-        print(f"   Submitted: {submitted_apps}")
-        print(f"   Responses: {responded}")
-        print(f"   Documents: {doc_count}")
-        print(f"   Profile Completion: {profile_completion}%")
-
         # Enhanced applications - Fixed to work with your Application model
         enhanced = []
         for app_item in recent_apps:
@@ -1165,7 +885,7 @@ def sync_filtered_inbox():
     try:
         # Get Gmail service - you'll need to implement this
         gmail_service = get_gmail_service_for_user(current_user)
-        filtered_inbox = FilteredInboxService(gmail_service)
+        filtered_inbox = FilteredInboxService(gmail_service, user_id=current_user.id)
         
         synced_count = filtered_inbox.sync_codecraftco_conversations_only(current_user.id)
         
@@ -1179,36 +899,19 @@ def sync_filtered_inbox():
 
 def has_codecraftco_signature_check(message_body):
     """Helper function to check for CodeCraftCo signature"""
-    if not message_body:
-        return False
-    
-    codecraftco_signatures = [
-        'codecraftco',
-        'codecraft',
-        'code craft',
-        'codecraft.co.za',
-        '@codecraftco',
-        'best regards,\ncodecraftco',
-        'kind regards,\ncodecraftco',
-        'sent from codecraftco',
-        'codecraftco team'
-    ]
-    
-    message_lower = message_body.lower()
-    return any(signature.lower() in message_lower for signature in codecraftco_signatures)
+    return has_codecraftco_signature(message_body)
 
 def get_gmail_service_for_user(user):
-    """Get Gmail service for specific user - implement based on your OAuth setup"""
+    """Get the cached Gmail service for a specific user"""
     try:
-        # This depends on how you store OAuth tokens
-        # You'll need to adapt this to your OAuth implementation
-        token = GoogleToken.query.filter_by(user_id=user.id).first()
-        if not token:
+        from credentials_manager import get_credentials
+        from gmail_client import get_gmail_service
+
+        credentials = get_credentials(user.id)
+        if not credentials:
             return None
         
-        # Reconstruct credentials and return service
-        # Implementation depends on your OAuth setup
-        pass
+        return get_gmail_service(user.id, credentials)
     except Exception as e:
         print(f"Error getting Gmail service: {e}")
         return None
@@ -1219,29 +922,19 @@ def get_gmail_service_for_user(user):
 # Add these functions to your gmail_service.py or create a new file
 
 class FilteredInboxService:
-    def __init__(self, gmail_service):
+    def __init__(self, gmail_service, user_id=None):
         self.service = gmail_service
-        self.codecraftco_signatures = [
-            'codecraftco',
-            'codecraft',
-            'code craft',
-            'codecraft.co.za',
-            '@codecraftco',
-            'best regards,\ncodecraftco',
-            'kind regards,\ncodecraftco'
-        ]
+        self.user_id = user_id
     
     def has_codecraftco_signature(self, message_body):
         """Check if email contains CodeCraftCo signature"""
-        if not message_body:
-            return False
-        
-        message_lower = message_body.lower()
-        return any(signature.lower() in message_lower for signature in self.codecraftco_signatures)
+        return has_codecraftco_signature(message_body)
     
     def get_filtered_thread_messages(self, thread_id):
         """Get only messages with CodeCraftCo signature from a thread"""
         try:
+            from quota import acquire
+            acquire('threads.get', self.user_id)
             thread = self.service.users().threads().get(
                 userId='me', 
                 id=thread_id,
@@ -1495,101 +1188,23 @@ def complete_calendar_event(event_id):
 @app.route('/corporate/analytics')
 @corporate_required
 def corporate_analytics():
-    """Calculate analytics data for this corporate user"""
-    # Get applications managed by this corporate user
-    applications = Application.query.filter_by(
-        corporate_user_id=current_user.id
-    ).all()
-    
-    # Application stages distribution
-    stage_counts = {}
-    for app in applications:
-        stage = app.application_stage or 'applied'
-        stage_counts[stage] = stage_counts.get(stage, 0) + 1
-    
-    application_stages = [
-        {'label': 'Applied', 'value': stage_counts.get('applied', 0)},
-        {'label': 'Reviewed', 'value': stage_counts.get('reviewed', 0)},
-        {'label': 'Interview', 'value': stage_counts.get('interview_scheduled', 0)},
-        {'label': 'Completed', 'value': stage_counts.get('interview_completed', 0)},
-        {'label': 'Accepted', 'value': stage_counts.get('accepted', 0)},
-        {'label': 'Rejected', 'value': stage_counts.get('rejected', 0)},
-    ]
-    
-    # Weekly trends (last 7 days)
-    weekly_trends = []
-    for i in range(7):
-        day = datetime.utcnow() - timedelta(days=6-i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        day_count = len([app for app in applications if 
-                        app.submitted_at and day_start <= app.submitted_at < day_end])
-        weekly_trends.append(day_count)
-    
-    # Opportunity performance
-    opportunities = LearnearshipOpportunity.query.filter_by(
-        company_id=current_user.id
-    ).all()
-    
-    active_ops = len([op for op in opportunities if op.is_active])
-    inactive_ops = len([op for op in opportunities if not op.is_active])
-    expired_ops = len([op for op in opportunities if op.is_expired()])
-    
-    opportunity_performance = [
-        {'label': 'Active', 'value': active_ops},
-        {'label': 'Inactive', 'value': inactive_ops},
-        {'label': 'Expired', 'value': expired_ops}
-    ]
-    
-    # Calculate metrics
-    total_opportunities = len(opportunities)
-    total_applications = len(applications)
-    interviews_scheduled = len([app for app in applications if app.application_stage == 'interview_scheduled'])
-    candidates_hired = len([app for app in applications if app.application_stage == 'hired'])
-    
-    # Calculate changes
-    this_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    new_opportunities_this_month = len([op for op in opportunities if 
-                                      op.created_at and op.created_at >= this_month])
-    
-    this_week = datetime.utcnow() - timedelta(days=7)
-    applications_this_week = len([app for app in applications if 
-                                 app.submitted_at and app.submitted_at >= this_week])
-    
-    upcoming_interviews = CalendarEvent.query.filter(
-        CalendarEvent.corporate_user_id == current_user.id,
-        CalendarEvent.start_datetime > datetime.utcnow(),
-        CalendarEvent.event_type == 'interview'
-    ).count()
-    
-    hire_rate = round((candidates_hired / max(total_applications, 1)) * 100, 1)
-    
+    """Analytics for this corporate user, served from the daily rollup (corporate_rollup.py)"""
     return render_template('corporate_analytics.html',
-                         application_stages=application_stages,
-                         weekly_trends=weekly_trends,
-                         opportunity_performance=opportunity_performance,
-                         total_opportunities=total_opportunities,
-                         total_applications=total_applications,
-                         interviews_scheduled=interviews_scheduled,
-                         candidates_hired=candidates_hired,
-                         new_opportunities_this_month=new_opportunities_this_month,
-                         applications_this_week=applications_this_week,
-                         upcoming_interviews=upcoming_interviews,
-                         hire_rate=hire_rate)
+                         **get_corporate_analytics(current_user.id))
 
 @app.route('/corporate/analytics/data')
 @corporate_required
 def corporate_analytics_data():
     """API endpoint for real-time analytics data"""
-    # Same calculation as above, return JSON
-    # This allows for auto-refresh without page reload
-    # ... implement similar logic as corporate_analytics route
+    analytics = get_corporate_analytics(current_user.id)
     return {
         'success': True,
-        'application_stages': [],  # calculated data
-        'weekly_trends': [],       # calculated data  
-        'opportunity_performance': []  # calculated data
+        'application_stages': analytics['application_stages'],
+        'weekly_trends': analytics['weekly_trends'],
+        'opportunity_performance': analytics['opportunity_performance'],
+        'total_applications': analytics['total_applications'],
+        'interviews_scheduled': analytics['interviews_scheduled'],
+        'upcoming_interviews': analytics['upcoming_interviews'],
     }
 
 
@@ -1788,33 +1403,30 @@ def get_calendar_events():
 
 # Add these routes to your app.py
 
+INBOX_PAGE_SIZE = 25
+
 @app.route('/corporate/inbox')
 @corporate_required
 def corporate_inbox():
     """Corporate inbox showing only CodeCraftCo conversations"""
-    conversations = Conversation.query.filter_by(
-        corporate_user_id=current_user.id,
-        is_active=True
-    ).order_by(Conversation.last_message_at.desc()).all()
-    
-    # Filter to only show conversations with CodeCraftCo signature
-    filtered_conversations = []
-    for conv in conversations:
-        # Check if conversation has any CodeCraftCo messages
-        codecraftco_messages = ConversationMessage.query.filter_by(
-            conversation_id=conv.id
-        ).all()
-        
-        has_codecraftco_signature = False
-        for msg in codecraftco_messages:
-            if has_codecraftco_signature_check(msg.body):
-                has_codecraftco_signature = True
-                break
-        
-        if has_codecraftco_signature:
-            filtered_conversations.append(conv)
+    # Signature messages are counted as they are stored, so this is one paginated query
+    conversations = (
+        Conversation.query.options(
+            joinedload(Conversation.applicant),
+            joinedload(Conversation.application),
+        )
+        .filter(
+            Conversation.corporate_user_id == current_user.id,
+            Conversation.is_active == True,
+            Conversation.signature_message_count > 0,
+        )
+        .order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+        .paginate(page=request.args.get('page', 1, type=int), per_page=INBOX_PAGE_SIZE, error_out=False)
+    )
     
-    return render_template('corporate/inbox.html', conversations=filtered_conversations)
+    return render_template('corporate/inbox.html',
+                         conversations=conversations.items,
+                         pagination=conversations)
 
 
 @app.route('/conversation/<int:conversation_id>')
@@ -1955,31 +1567,6 @@ def api_get_conversation_messages(conversation_id):  # Renamed to avoid conflict
         app.logger.error(f'Error fetching messages: {str(e)}')
         return jsonify({'error': 'Failed to fetch messages'}), 500
 
-@app.route('/api/user/inbox/unread-count')
-@login_required  
-def api_get_inbox_unread_count():  # Renamed to avoid conflict
-    try:
-        # Count unread conversations for current user
-        if current_user.role == 'corporate':
-            # Corporate user - count conversations where they have unread messages
-            unread_count = Conversation.query.filter_by(
-                corporate_user_id=current_user.id
-            ).filter(Conversation.corporate_unread_count > 0).count()
-        else:
-            # Regular user (applicant) - count conversations where they have unread messages
-            unread_count = Conversation.query.filter_by(
-                applicant_user_id=current_user.id
-            ).filter(Conversation.applicant_unread_count > 0).count()
-        
-        return jsonify({'unread_count': unread_count})
-        
-    except Exception as e:
-        app.logger.error(f'Error getting unread count: {str(e)}')
-        return jsonify({'unread_count': 0})
-    
-
-
-
 @app.route('/api/conversations/<int:conversation_id>/messages')
 @login_required
 def get_conversation_messages(conversation_id):
@@ -2028,27 +1615,6 @@ def get_conversation_messages(conversation_id):
         app.logger.error(f'Error fetching messages: {str(e)}')
         return jsonify({'error': 'Failed to fetch messages'}), 500
 
-@app.route('/api/user/inbox/unread-count')
-@login_required
-def get_inbox_unread_count():
-    try:
-        # Count unread conversations for current user
-        if current_user.role == 'corporate':
-            # Corporate user - count conversations where they have unread messages
-            unread_count = Conversation.query.filter_by(
-                corporate_user_id=current_user.id
-            ).filter(Conversation.corporate_unread_count > 0).count()
-        else:
-            # Regular user (applicant) - count conversations where they have unread messages
-            unread_count = Conversation.query.filter_by(
-                applicant_user_id=current_user.id
-            ).filter(Conversation.applicant_unread_count > 0).count()
-        
-        return jsonify({'unread_count': unread_count})
-        
-    except Exception as e:
-        app.logger.error(f'Error getting unread count: {str(e)}')
-        return jsonify({'unread_count': 0})
 @app.route('/user/inbox')
 @login_required
 def user_inbox():
@@ -2190,20 +1756,6 @@ def sync_inbox():
     
     return redirect(url_for('corporate_inbox'))
 
-@app.route('/api/user/inbox/unread-count')
-@login_required
-def get_unread_count():
-    try:
-        # Use your existing unread count column
-        unread_count = Conversation.query.filter_by(
-            applicant_user_id=current_user.id,
-        ).filter(Conversation.applicant_unread_count > 0).count()
-        
-        return jsonify({'unread_count': unread_count})
-    except Exception as e:
-        app.logger.error(f"Error getting unread count: {str(e)}")
-        return jsonify({'unread_count': 0})
-
 from models import LearnearshipOpportunity
 
 @app.route('/corporate/application/<int:app_id>/status', methods=['POST'])
@@ -2437,27 +1989,10 @@ def calculate_profile_completion(user):
 @login_required
 def api_dashboard_stats():
     try:
-        total = Application.query.filter_by(user_id=current_user.id).count()
-        pending = Application.query.filter_by(
-            user_id=current_user.id, status="pending"
-        ).count()
-
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent = Application.query.filter(
-            Application.user_id == current_user.id,
-            Application.created_at >= week_ago
-        ).count()
-
-        responses = Application.query.filter_by(
-            user_id=current_user.id, email_status="responded"
-        ).count()
+        counts = get_user_stats(current_user.id)
 
-        sent_count = Application.query.filter(
-            Application.user_id == current_user.id,
-            Application.email_status.in_(
-                ["sent", "delivered", "read", "responded"]
-            ),
-        ).count()
+        responses = counts["email_responded"]
+        sent_count = counts["email_sent"]
 
         response_rate = (responses / sent_count * 100) if sent_count else 0
         profile_completion = calculate_profile_completion(current_user)
@@ -2465,9 +2000,9 @@ def api_dashboard_stats():
         return jsonify(
             success=True,
             stats={
-                "total": total,
-                "pending": pending,
-                "recent_count": recent,
+                "total": counts["total"],
+                "pending": counts["pending"],
+                "recent_count": counts["created_last_7_days"],
                 "responses": responses,
                 "response_rate": response_rate,
                 "profile_completion": profile_completion,
@@ -2901,27 +2436,18 @@ def user_inbox_sync():
         return jsonify({'error': 'Sync failed'}), 500
 
 
+@app.route('/api/inbox/unread-count')
 @app.route('/api/user/inbox/unread-count')
+@app.route('/api/corporate/inbox/unread-count')
 @login_required
-def api_user_inbox_unread_count():
-    """Get unread conversation count for current user"""
+def inbox_unread_count():
+    """
+    Unread conversations for the inbox badge, from the user's counter row
+    (inbox_counters.py). Polls sending the current ETag are answered with 304
+    in validate_session, after the session checks and without a counter read.
+    """
     try:
-        from models import Conversation
-        from sqlalchemy import func
-        
-        # Sum all unread counts for this user's conversations
-        total_unread = db.session.query(
-            func.coalesce(func.sum(Conversation.applicant_unread_count), 0)
-        ).filter(
-            Conversation.applicant_user_id == current_user.id,
-            Conversation.is_active == True
-        ).scalar()
-        
-        return jsonify({
-            'unread_count': int(total_unread or 0),
-            'status': 'success'
-        })
-        
+        unread_count, etag = get_inbox_badge(current_user.id)
     except Exception as e:
         app.logger.error(f"Error getting unread count: {e}")
         return jsonify({
@@ -2930,6 +2456,34 @@ def api_user_inbox_unread_count():
             'message': str(e)
         })
 
+    response = jsonify({
+        'unread_count': unread_count,
+        'status': 'success'
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.route('/api/events')
+@login_required
+def user_events():
+    """
+    Server-sent events for the signed-in user: new conversation messages and
+    application email status changes (user_events.py). Pages subscribe via
+    static/js/live_events.js; EventSource resends Last-Event-ID on reconnect,
+    and the page passes last_event_id when it reopens a stream itself.
+    """
+    user_id = current_user.id
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(
+        stream_with_context(user_event_stream(user_id, last_event_id)),
+        mimetype='text/event-stream',
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy hold events back
+    return response
+
 
 @app.route('/api/user/inbox/conversations')
 @login_required
@@ -3002,12 +2556,12 @@ def api_mark_all_conversations_read():
                 'is_read_by_applicant': True
             }, synchronize_session=False)
             
-            # Reset all unread counts
-            Conversation.query.filter_by(
-                applicant_user_id=current_user.id
-            ).update({
-                'applicant_unread_count': 0
-            })
+            # Reset all unread counts (through the ORM so inbox_counters sees it)
+            for conversation in Conversation.query.filter(
+                Conversation.applicant_user_id == current_user.id,
+                Conversation.applicant_unread_count > 0
+            ):
+                conversation.applicant_unread_count = 0
             
             db.session.commit()
         
@@ -3209,30 +2763,35 @@ def apply_learnership():
 
     if form.validate_on_submit():
         created = []
+        queued_learnerships = []
         applications_sent = 0  # ADD THIS COUNTER
 
         for lr in selected_learnerships:
+            # Taken atomically, so parallel requests can't exceed the daily limit
+            if not current_user.use_application():
+                flash("Daily application limit reached. Upgrade to premium!", "warning")
+                break
+
             try:
                 app_record = Application(
                     user_id=current_user.id,
-                    learnership_id=lr.get("id"),
                     learnership_name=lr.get("title", "Unknown"),
                     company_name=lr.get("company", "Unknown"),
+                    company_email=lr.get("apply_email"),
                     status="pending",
                 )
                 db.session.add(app_record)
                 db.session.commit()
 
                 created.append(app_record)
-                
-                # ADD THIS: Track each application
-                current_user.use_application()
+                queued_learnerships.append(lr)
                 applications_sent += 1
                 print(f"📊 Application #{applications_sent} counted for user")
                 
             except Exception as e:
                 print("Error creating application:", e)
                 db.session.rollback()
+                current_user.release_application()
 
         if created:
             try:
@@ -3240,17 +2799,22 @@ def apply_learnership():
                 if hasattr(form, "attachments"):
                     attachment_ids = [int(x) for x in form.attachments.data]
 
-                current_user.email_body = form.email_body.data
-
-                launch_bulk_send(current_user, selected_learnerships, attachment_ids)
+                job = launch_bulk_send(
+                    current_user,
+                    queued_learnerships,
+                    attachment_ids,
+                    applications=created,
+                    email_body=form.email_body.data,
+                )
 
                 # ADD PREMIUM MESSAGE
                 remaining_today = current_user.get_remaining_applications()
-                success_msg = f"Created {len(created)} applications. Sending emails..."
+                success_msg = f"Created {len(created)} applications. Sending emails in the background..."
                 if not current_user.is_premium_active():
                     success_msg += f" You have {remaining_today} applications remaining today."
                 
                 flash(success_msg, "success")
+                return redirect(url_for("my_applications", job=job.id))
                 
             except Exception as e:
                 flash(f"Applications created but email sending failed: {e}", "warning")
@@ -3275,88 +2839,84 @@ def apply_learnership():
 def my_applications():
     """Display user's applications with Gmail tracking information."""
     
-    applications = (
-        Application.query.filter_by(user_id=current_user.id)
-        .order_by(Application.updated_at.desc())
-        .all()
-    )
-
-    grouped_status = {
-        "pending": [],
-        "submitted": [],
-        "reviewed": [],
-        "accepted": [],
-        "rejected": [],
-    }
-
-    email_groups = {
-        "draft": [],
-        "sent": [],
-        "delivered": [],
-        "read": [],
-        "responded": [],
-        "failed": [],
-    }
+    # First page only; further pages and other tabs come from /api/applications
+    applications, next_cursor = fetch_page(current_user.id)
 
+    counts = get_user_stats(current_user.id)
     stats = {
-        "total": len(applications),
-        "sent_emails": 0,
-        "responses_received": 0,
-        "pending_responses": 0,
-        "gmail_tracked": 0,
-        "failed_emails": 0,
-        "recent_activity": 0,
+        "total": counts["total"],
+        "sent_emails": counts["sent_emails"],
+        "responses_received": counts["responses"],
+        "pending_responses": counts["pending_responses"],
+        "gmail_tracked": counts["gmail_tracked"],
+        "failed_emails": counts["failed_emails"],
+        "recent_activity": counts["sent_last_7_days"],
+        "email_sent_no_reply": counts["email_sent_no_reply"],
+        "email_responded": counts["email_responded"],
+        "pending": counts["pending"],
     }
 
-    for app_item in applications:
-
-        # Application status grouping
-        if app_item.status in grouped_status:
-            grouped_status[app_item.status].append(app_item)
+    # Applications that may need a Gmail status update
+    needs_update = counts["needs_status_update"]
 
-        # Email status grouping
-        es = app_item.email_status or "draft"
-        if es in email_groups:
-            email_groups[es].append(app_item)
+    # Bulk sends still being delivered by the send worker
+    send_jobs = get_active_jobs(current_user.id)
+    requested_job = request.args.get("job", type=int)
+    if requested_job and requested_job not in {j.id for j in send_jobs}:
+        job = SendJob.query.filter_by(id=requested_job, user_id=current_user.id).first()
+        if job:
+            send_jobs.append(job)
 
-        # Stats
-        if app_item.sent_at:
-            stats["sent_emails"] += 1
-
-        if app_item.has_response:
-            stats["responses_received"] += 1
+    return render_template(
+        "my_applications.html",
+        applications=applications,
+        next_cursor=next_cursor,
+        stats=stats,
+        needs_update=needs_update,
+        send_jobs=[j.to_dict() for j in send_jobs],
+    )
 
-        if app_item.gmail_message_id:
-            stats["gmail_tracked"] += 1
 
-        if es == "failed":
-            stats["failed_emails"] += 1
+@app.route("/api/applications")
+@login_required
+def api_applications():
+    """Next page of my_applications cards for a tab (keyset cursor)"""
+    try:
+        applications, next_cursor = fetch_page(
+            current_user.id,
+            tab=request.args.get("tab", "all"),
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", DEFAULT_PAGE_SIZE, type=int),
+            status=request.args.get("status"),
+            email_status=request.args.get("email_status"),
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
-        if es == "sent" and not app_item.has_response:
-            stats["pending_responses"] += 1
+    html = "".join(
+        render_template("application_card.html", app=app_item)
+        for app_item in applications
+    )
+    return jsonify({
+        "success": True,
+        "html": html,
+        "count": len(applications),
+        "next_cursor": next_cursor,
+    })
 
-        if app_item.is_recent(7):
-            stats["recent_activity"] += 1
 
-    # Check if some applications need status updates
-    recent_cutoff = datetime.utcnow() - timedelta(days=30)
+# =============================================================================
+# API: BULK SEND JOB PROGRESS
+# =============================================================================
 
-    needs_update = (
-        Application.query.filter_by(user_id=current_user.id)
-        .filter(Application.gmail_message_id.isnot(None))
-        .filter(Application.sent_at >= recent_cutoff)
-        .filter(Application.email_status.in_(["sent", "delivered"]))
-        .count()
-    )
+@app.route("/api/send-jobs/<int:job_id>")
+@login_required
+def api_send_job_status(job_id):
+    job = SendJob.query.filter_by(
+        id=job_id, user_id=current_user.id
+    ).first_or_404()
 
-    return render_template(
-        "my_applications.html",
-        applications=applications,
-        grouped_applications=grouped_status,
-        email_status_groups=email_groups,
-        stats=stats,
-        needs_update=needs_update,
-    )
+    return jsonify(success=True, job=job.to_dict())
 
 
 # =============================================================================
@@ -3456,15 +3016,16 @@ def auto_update_gmail_status():
         checker = GmailStatusChecker(current_user.id)
         updated_count = 0
 
+        # One batched Gmail round trip per 50 applications
+        status_infos = checker.check_message_statuses(recent_apps)
+
         for app_item in recent_apps:
             try:
-                status_info = checker.check_message_status(app_item.gmail_message_id)
+                status_info = status_infos.get(app_item.id)
                 if status_info:
                     app_item.update_from_gmail_status(status_info)
                     updated_count += 1
 
-                time.sleep(0.2)
-
             except Exception as e:
                 print("Error updating:", e)
 
@@ -3559,58 +3120,39 @@ def gmail_status_dashboard():
 # =============================================================================
 # EMAIL SENDING HELPERS (GMAIL API)
 # =============================================================================
-def send_application_email(recipient_email, company_name, user):
+def build_application_message_template(user):
     """
-    Send an application email with plain text body and HTML signature
+    Load documents, build the body and render the HTML signature once.
+
+    The returned MessageTemplate is reused for every recipient of a bulk send.
     """
-    from mailer import (
-        build_credentials,
-        create_message_with_attachments,
-        send_gmail_message,
-    )
-    from models import GoogleToken
+    from mailer import MessageTemplate
     from flask import render_template
-    from socket import timeout
     import os
 
-    result = {
-        "success": False,
-        "message": "",
-        "gmail_data": {}
-    }
-
     subject = f"Application for Learnership Opportunity - {user.full_name or user.email}"
 
-    try:
-        token_row = GoogleToken.query.filter_by(user_id=user.id).first()
-        if not token_row:
-            print("No Google token found.")
-            result["message"] = "Google authentication required."  
-            return result
-
-        credentials = build_credentials(token_row.token_json)
+    # Get documents
+    docs = Document.query.filter_by(user_id=user.id, is_active=True).all()
+    file_paths = []
 
-        # Get documents
-        docs = Document.query.filter_by(user_id=user.id, is_active=True).all()
-        file_paths = []
-
-        for doc in docs:
-            if doc.file_path and isinstance(doc.file_path, str) and os.path.exists(doc.file_path):
-                file_paths.append({
-                    "path": doc.file_path,
-                    "filename": doc.original_filename
-                })
+    for doc in docs:
+        if doc.file_path and isinstance(doc.file_path, str) and os.path.exists(doc.file_path):
+            file_paths.append({
+                "path": doc.file_path,
+                "filename": doc.original_filename
+            })
 
-        print(f"📎 Found {len(file_paths)} valid documents to attach")
+    print(f"📎 Found {len(file_paths)} valid documents to attach")
 
-        # Document status for plain text
-        if file_paths:
-            docs_plain = f"✓ Documents Attached: {len(file_paths)} file(s)\n"
-        else:
-            docs_plain = "⚠️ No Documents Attached\nPlease reply with your CV, resume, and supporting documents to strengthen your application.\n"
+    # Document status for plain text
+    if file_paths:
+        docs_plain = f"✓ Documents Attached: {len(file_paths)} file(s)\n"
+    else:
+        docs_plain = "⚠️ No Documents Attached\nPlease reply with your CV, resume, and supporting documents to strengthen your application.\n"
 
-        # ✅ PLAIN TEXT BODY
-        body = f"""Dear Hiring Team,
+    # ✅ PLAIN TEXT BODY
+    body = f"""Dear Hiring Team,
 
 I hope this message finds you well. I am writing to express my genuine interest in learnership opportunities within your organization.
 
@@ -3628,11 +3170,11 @@ Kind regards,
 {user.full_name or user.email}
 """
 
-        # ✅ GET HTML SIGNATURE
-        signature_html = render_template('emails/email_signature.html')
-        
-        # ✅ COMBINE BODY + SIGNATURE IN HTML - LEFT ALIGNED
-        html_body = f"""<!DOCTYPE html>
+    # ✅ GET HTML SIGNATURE
+    signature_html = render_template('emails/email_signature.html')
+    
+    # ✅ COMBINE BODY + SIGNATURE IN HTML - LEFT ALIGNED
+    html_body = f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -3644,22 +3186,48 @@ Kind regards,
 </body>
 </html>"""
 
-        message = create_message_with_attachments(
-            user.email,
-            recipient_email,
-            subject,
-            body,
-            file_paths,
-            html_body=html_body
-        )
+    return MessageTemplate(user.email, subject, body, file_paths, html_body=html_body)
+
+
+def send_application_email(recipient_email, company_name, user, template=None, headers=None):
+    """
+    Send an application email with plain text body and HTML signature.
+
+    Pass a template from build_application_message_template() when sending
+    to many recipients so attachments are only read and encoded once.
+    `headers` are extra message headers (e.g. the send_ledger send key).
+    """
+    from mailer import send_gmail_message
+    from credentials_manager import get_credentials
+    from send_ledger import refused
+    from socket import timeout
+
+    result = {
+        "success": False,
+        "message": "",
+        "gmail_data": {}
+    }
+
+    try:
+        credentials = get_credentials(user.id)
+        if not credentials:
+            print("No Google token found.")
+            result["message"] = "Google authentication required."  
+            result["refused"] = True
+            return result
+
+        if template is None:
+            template = build_application_message_template(user)
+
+        message = template.render(recipient_email, headers=headers)
 
         try:
-            sent_message = send_gmail_message(credentials, message)
+            sent_message = send_gmail_message(credentials, message, user_id=user.id)
             
             if sent_message:
                 gmail_id = sent_message.get('id')
                 thread_id = sent_message.get('threadId')
-                doc_count = len(file_paths)
+                doc_count = template.attachment_count
                 
                 print(f"✅ Email sent to {recipient_email}")
                 print(f"   📎 Documents attached: {doc_count}")
@@ -3683,21 +3251,24 @@ Kind regards,
         except Exception as e:
             print("Gmail API error:", e)
             result["message"] = f"Email sending error: {e}"
+            # Tells the send ledger whether Gmail may still have sent it
+            result["refused"] = refused(e)
             return result
 
     except Exception as e:
         print("Error sending Gmail:", e)
         result["message"] = f"Error preparing email: {e}"
+        result["refused"] = True  # Never reached Gmail
         return result
 # =============================================================================
 # BULK EMAIL WRAPPER (adds Gmail tracking)
 # =============================================================================
 
-def send_application_email_with_gmail(recipient_email, company_name, user):
+def send_application_email_with_gmail(recipient_email, company_name, user, template=None, headers=None):
     """
     Wrapper that ensures consistent return format with Gmail tracking data
     """
-    result = send_application_email(recipient_email, company_name, user)
+    result = send_application_email(recipient_email, company_name, user, template=template, headers=headers)
     
     # Result is now always a dict with the correct structure
     if isinstance(result, dict):
@@ -3770,180 +3341,16 @@ def apply_bulk_email():
             flash("No valid email addresses selected.", "error")
             return redirect(url_for("learnerships"))
 
-        successful = []
-        failed = []
-        timeout_list = []
-        reapplied = []
-        gmail_tracked = 0
-        applications_sent = 0
-
-        for entry in email_entries:
-            print(f"\n{'='*50}")
-            print(f"📧 Processing: {entry.company_name} - {entry.email_address}")
-            
-            # Check if user already applied to this company
-            existing = Application.query.filter_by(
-                user_id=current_user.id, 
-                company_email=entry.email_address
-            ).first()
-
-            # ✅ HANDLE RE-APPLICATIONS - COMPLETE FIX WITH PROPER CASCADE ORDER
-            if existing:
-                if str(entry.id) not in reapply_ids:
-                    print(f"   ⚠️ Already applied to {entry.company_name} (skipped)")
-                    continue
-                else:
-                    print(f"   🔄 Re-applying to {entry.company_name}")
-                    
-                    # ✅ DELETE ALL RELATED RECORDS IN CORRECT CASCADE ORDER
-                    try:
-                        application_id = existing.id
-                        print(f"   🔍 Deleting all records for application_id: {application_id}")
-                        
-                        # 1. Delete ConversationMessage records first (deepest level)
-                        conversation_messages_deleted = 0
-                        conversations = Conversation.query.filter_by(application_id=application_id).all()
-                        for conversation in conversations:
-                            messages = ConversationMessage.query.filter_by(conversation_id=conversation.id).all()
-                            for message in messages:
-                                db.session.delete(message)
-                                conversation_messages_deleted += 1
-                        print(f"   🗑️ Deleted {conversation_messages_deleted} conversation messages")
-                        
-                        # 2. Delete Conversation records
-                        conversations_deleted = len(conversations)
-                        for conversation in conversations:
-                            db.session.delete(conversation)
-                        print(f"   🗑️ Deleted {conversations_deleted} conversations")
-                        
-                        # 3. Delete CalendarEvent records
-                        calendar_events = CalendarEvent.query.filter_by(application_id=application_id).all()
-                        for event in calendar_events:
-                            db.session.delete(event)
-                        print(f"   🗑️ Deleted {len(calendar_events)} calendar events")
-                        
-                        # 4. Delete ApplicationMessage records
-                        app_messages = ApplicationMessage.query.filter_by(application_id=application_id).all()
-                        for msg in app_messages:
-                            db.session.delete(msg)
-                        print(f"   🗑️ Deleted {len(app_messages)} application messages")
-                        
-                        # 5. Delete any other related records that reference application_id
-                        # Add any other models that have foreign keys to Application here if needed
-                        
-                        # 6. Finally delete the Application itself
-                        db.session.delete(existing)
-                        
-                        # Commit all deletions
-                        db.session.commit()
-                        print(f"   ✅ Successfully deleted application {application_id} and all related data")
-                        
-                    except Exception as delete_error:
-                        print(f"   ❌ Error deleting existing application: {delete_error}")
-                        import traceback
-                        traceback.print_exc()
-                        db.session.rollback()
-                        failed.append(entry.company_name)
-                        continue
-                    
-            try:
-                # Send email with documents
-                result = send_application_email_with_gmail(
-                    entry.email_address, entry.company_name, current_user
-                )
-                
-                print(f"DEBUG: Email result: {result}")
-
-                success = result.get("success", False)
-                message = result.get("message", "")
-                gmail_data = result.get("gmail_data", {})
-                
-                if gmail_data:
-                    print(f"   📬 Gmail ID: {gmail_data.get('id')}")
-                    print(f"   🧵 Thread ID: {gmail_data.get('threadId')}")
-
-                # Create NEW Application record
-                application = Application(
-                    user_id=current_user.id,
-                    company_name=entry.company_name,
-                    company_email=entry.email_address,
-                    learnership_name="Email Application",
-                    status="submitted" if success else "pending",
-                )
-
-                if success:
-                    application.email_status = "sent"
-                    application.sent_at = datetime.utcnow()
-                    application.gmail_message_id = gmail_data.get("id")
-                    application.gmail_thread_id = gmail_data.get("threadId")
-                    application.has_response = False
-                    application.documents_attached = len(valid_docs)
-                    
-                    current_user.use_application()
-                    applications_sent += 1
-                    
-                    print(f"   ✅ Creating new Application")
-                else:
-                    application.email_status = "failed"
-                    print(f"   ❌ Email failed: {message}")
-
-                db.session.add(application)
-                db.session.commit()  # ✅ Commit immediately after adding new application
-
-                if success:
-                    successful.append(entry.company_name)
-                    if str(entry.id) in reapply_ids:
-                        reapplied.append(entry.company_name)
-                    if gmail_data.get("id"):
-                        gmail_tracked += 1
-                else:
-                    if "timeout" in message.lower():
-                        timeout_list.append(entry.company_name)
-                    else:
-                        failed.append(entry.company_name)
-
-                print(f"   💾 Saved to database")
-
-            except Exception as e:
-                print(f"❌ Error for {entry.company_name}: {e}")
-                import traceback
-                traceback.print_exc()
-                db.session.rollback()
-                failed.append(entry.company_name)
-
-        # Summary
-        print(f"\n{'='*50}")
-        print(f"📊 BULK SEND SUMMARY:")
-        print(f"   ✅ New applications: {len(successful) - len(reapplied)}")
-        print(f"   🔄 Re-applications: {len(reapplied)}")
-        print(f"   🎯 Gmail tracked: {gmail_tracked}")
-        print(f"   📎 Documents per application: {len(valid_docs)}")
-        print(f"   ❌ Failed: {len(failed)}")
-        print(f"{'='*50}\n")
-
-        # Flash messages
-        if successful:
-            new_count = len(successful) - len(reapplied)
-            
-            msg = f"✅ Successfully sent {len(successful)} application(s) with {len(valid_docs)} document(s)!"
-            
-            if new_count > 0:
-                msg += f"\n   📝 New: {new_count}"
-            if reapplied:
-                msg += f"\n   🔄 Re-applied: {len(reapplied)}"
-            
-            if gmail_tracked:
-                msg += f"\n🎯 {gmail_tracked} application(s) tracked for responses"
-            
-            flash(msg, "success")
-
-        if timeout_list:
-            flash(f"⏱️ Network timeout for: {', '.join(timeout_list)}", "warning")
+        # ✅ QUEUE THE SENDS - the send worker delivers them (see send_jobs.py)
+        job = enqueue_email_list_job(current_user, email_entries, reapply_ids)
 
-        if failed:
-            flash(f"❌ Failed: {', '.join(failed)}", "error")
+        flash(
+            f"📤 Queued {len(email_entries)} application(s) with {len(valid_docs)} document(s). "
+            f"Emails are being sent in the background - progress is shown below.",
+            "success"
+        )
 
-        return redirect(url_for("my_applications"))
+        return redirect(url_for("my_applications", job=job.id))
 
     except Exception as e:
         print(f"Fatal error: {e}")
@@ -4013,20 +3420,10 @@ from datetime import datetime, timedelta
 def premium_management():
     """Premium management dashboard"""
     users = User.query.all()
-    premium_users = User.query.filter_by(is_premium=True).all()
     transactions = PremiumTransaction.query.order_by(PremiumTransaction.created_at.desc()).limit(50).all()
     
-    # Statistics
-    total_premium = len(premium_users)
-    expired_premium = sum(1 for user in premium_users if user.premium_expires and user.premium_expires <= datetime.now())
-    active_premium = total_premium - expired_premium
-    
-    stats = {
-        'total_premium': total_premium,
-        'active_premium': active_premium,
-        'expired_premium': expired_premium,
-        'total_users': User.query.count()
-    }
+    # Statistics (SQL aggregates, admin_stats.py)
+    stats = get_premium_stats()
     
     return render_template('admin_premium.html', 
                          users=users, 
@@ -4097,23 +3494,9 @@ def bulk_premium():
 def premium_stats():
     """Get updated premium statistics"""
     try:
-        users = User.query.all()
-        total_users = len(users)
-        premium_users = [u for u in users if u.is_premium]
-        total_premium = len(premium_users)
-        
-        now = datetime.utcnow()
-        active_premium = sum(1 for u in premium_users if not u.premium_expires or u.premium_expires > now)
-        expired_premium = total_premium - active_premium
-        
         return jsonify({
             'success': True,
-            'stats': {
-                'total_users': total_users,
-                'total_premium': total_premium,
-                'active_premium': active_premium,
-                'expired_premium': expired_premium
-            }
+            'stats': get_premium_stats()
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -4179,17 +3562,6 @@ from sqlalchemy import func
 from datetime import datetime, timedelta
 import os
 
-def get_week_format(date_column):
-    """Database-agnostic week formatting"""
-    database_url = os.environ.get("DATABASE_URL", "")
-    
-    if database_url.startswith(("postgresql://", "postgres://")):
-        # PostgreSQL version - returns YYYY-WW format
-        return func.to_char(date_column, 'YYYY-WW').label("week")
-    else:
-        # SQLite version
-        return func.strftime("%Y-%W", date_column).label("week")
-
 @app.route("/user/applications/analytics", endpoint="application_analytics")
 @login_required
 def analytics_dashboard_user_live():
@@ -4221,52 +3593,11 @@ def analytics_dashboard_user_live():
         })
 
     # ✅ CURRENT WEEK RESPONSES (Monday to Sunday) -----------
-    now = datetime.utcnow()
-    days_since_monday = now.weekday()
-    monday = now - timedelta(days=days_since_monday)
-    monday = monday.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    current_week_responses = []
-    
-    for i in range(7):  # Monday (0) to Sunday (6)
-        day_start = monday + timedelta(days=i)
-        day_end = day_start + timedelta(days=1)
-        
-        # Count responses received on this day
-        daily_responses = (
-            db.session.query(func.count(Application.id))
-            .filter(
-                Application.user_id == user_id,
-                Application.response_received_at.isnot(None),
-                Application.response_received_at >= day_start,
-                Application.response_received_at < day_end
-            )
-            .scalar() or 0
-        )
-        current_week_responses.append(daily_responses)
+    # One GROUP BY each, cached briefly for the page's auto-refresh (timeseries.py)
+    monday, current_week_responses = current_week_responses_for(user_id)
 
-    # --- WEEKLY RESPONSE TREND (FIXED) -------------------------------------
-    ten_weeks_ago = datetime.utcnow() - timedelta(weeks=10)
-    
-    try:
-        weekly_responses = (
-            db.session.query(
-                get_week_format(Application.response_received_at),  # 🔧 FIXED: Database-agnostic
-                func.count(Application.id)
-            )
-            .filter(
-                Application.user_id == user_id,
-                Application.response_received_at.isnot(None),
-                Application.response_received_at >= ten_weeks_ago
-            )
-            .group_by(get_week_format(Application.response_received_at))  # 🔧 FIXED: Database-agnostic
-            .order_by(get_week_format(Application.response_received_at))  # 🔧 FIXED: Database-agnostic
-            .all()
-        )
-        response_trend = [r[1] for r in weekly_responses]
-    except Exception as e:
-        print(f"❌ Weekly trend error: {e}")
-        response_trend = []  # Fallback to empty trend
+    # --- WEEKLY RESPONSE TREND (last 10 weeks, empty weeks as 0) -----
+    response_trend = weekly_response_trend(user_id)
 
     # --- RECENT APPLICATIONS ---------------------------------------
     recent_apps = (
@@ -4284,12 +3615,6 @@ def analytics_dashboard_user_live():
             "status": app_obj.email_status or "pending"
         })
 
-    # ✅ Debug output
-    print(f"📊 Current Week Responses (Mon-Sun): {current_week_responses}")
-    print(f"📅 Week starting: {monday.strftime('%Y-%m-%d')}")
-    print(f"📈 Status Summary: {[s['label'] + ': ' + str(s['value']) for s in status_summary]}")
-    print(f"📈 Response Trend: {response_trend}")
-
     # --- RENDER TEMPLATE -------------------------------------------
     return render_template(
         "analytics_dashboard.html",
@@ -4304,33 +3629,11 @@ def analytics_dashboard_user_live():
 @app.route('/api/current-week-responses')
 @login_required
 def get_current_week_responses():
-    """API endpoint for real-time current week responses data"""
+    """Current week responses, refetched by the analytics page on application_status events"""
     try:
         user_id = current_user.id
         
-        # Get Monday of current week
-        now = datetime.utcnow()
-        days_since_monday = now.weekday()
-        monday = now - timedelta(days=days_since_monday)
-        monday = monday.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        current_week_responses = []
-        
-        for i in range(7):
-            day_start = monday + timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-            
-            daily_responses = (
-                db.session.query(func.count(Application.id))
-                .filter(
-                    Application.user_id == user_id,
-                    Application.response_received_at.isnot(None),
-                    Application.response_received_at >= day_start,
-                    Application.response_received_at < day_end
-                )
-                .scalar() or 0
-            )
-            current_week_responses.append(daily_responses)
+        monday, current_week_responses = current_week_responses_for(user_id, fresh=True)
         
         return jsonify({
             'success': True,
@@ -4358,22 +3661,9 @@ def admin_dashboard():
     try:
         print("=== ADMIN DASHBOARD ===")
 
-        # Fetch all system data
-        users = User.query.all()
-        applications = Application.query.all()
-        learnerships = LearnershipEmail.query.filter_by(is_active=True).all()
-
-        print(f"Users: {len(users)}")
-        print(f"Learnership emails: {len(learnerships)}")
-        print(f"Applications: {len(applications)}")
-
-        # Stats summary
-        stats = {
-            "total_users": len(users),
-            "active_users": sum(1 for u in users if u.is_active),
-            "total_learnerships": len(learnerships),
-            "total_applications": len(applications),
-        }
+        # Counters from SQL aggregates; tables show their first page and
+        # load the rest from the /admin/api endpoints (admin_stats.py)
+        stats = get_admin_stats()
 
         # Recent items
         recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
@@ -4386,19 +3676,13 @@ def admin_dashboard():
         recent_applications = (
             Application.query.order_by(Application.submitted_at.desc()).limit(5).all()
         )
-        premium_users = User.query.filter_by(is_premium=True).all()
-
-        premium_stats = {
-            'total_premium': len(premium_users),
-            'active_premium': sum(1 for user in premium_users 
-                                if not user.premium_expires or user.premium_expires > datetime.now())
-        }
+        premium_stats = get_premium_stats()
 
         return render_template(
             "admin_dashboard.html",
-            users=users,
-            learnerships=learnerships,
-            applications=applications,
+            user_page=users_page(),
+            learnership_page=learnerships_page(),
+            application_page=applications_page(),
             stats=stats,
             recent_users=recent_users,
             recent_learnerships=recent_learnerships,
@@ -4414,11 +3698,12 @@ def admin_dashboard():
         traceback.print_exc()
 
         # fallback
+        premium_stats = {'total_premium': 0, 'active_premium': 0}
         return render_template(
             "admin_dashboard.html",
-            users=[],
-            learnerships=[],
-            applications=[],
+            user_page=EMPTY_PAGE,
+            learnership_page=EMPTY_PAGE,
+            application_page=EMPTY_PAGE,
             stats={
                 "total_users": 0,
                 "active_users": 0,
@@ -4434,6 +3719,52 @@ def admin_dashboard():
         )
 
 
+# =============================================================================
+# ADMIN TABLE APIS (paginated, searched in SQL)
+# =============================================================================
+
+def _admin_table_page(fetch_page, template, item_name):
+    pagination = fetch_page(
+        search=request.args.get("q"),
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", DEFAULT_PER_PAGE, type=int),
+    )
+    html = "".join(
+        render_template(template, **{item_name: item}) for item in pagination.items
+    )
+    return jsonify({
+        "success": True,
+        "html": html,
+        "count": len(pagination.items),
+        "total": pagination.total,
+        "page": pagination.page,
+        "pages": pagination.pages,
+        "has_prev": pagination.has_prev,
+        "has_next": pagination.has_next,
+    })
+
+
+@app.route("/admin/api/users")
+@login_required
+@admin_required
+def admin_api_users():
+    return _admin_table_page(users_page, "admin_user_row.html", "user")
+
+
+@app.route("/admin/api/learnerships")
+@login_required
+@admin_required
+def admin_api_learnerships():
+    return _admin_table_page(learnerships_page, "admin_learnership_row.html", "learnership")
+
+
+@app.route("/admin/api/applications")
+@login_required
+@admin_required
+def admin_api_applications():
+    return _admin_table_page(applications_page, "admin_application_row.html", "application")
+
+
 # =============================================================================
 # ADMIN USER MANAGEMENT
 # =============================================================================
@@ -4545,9 +3876,30 @@ def delete_user(user_id):
                 except Exception as e:
                     print("Error deleting file:", doc.file_path, e)
 
-        # Delete DB records
-        Application.query.filter_by(user_id=user_id).delete()
-        Document.query.filter_by(user_id=user_id).delete()
+        # Delete DB records, including every table with a foreign key to the user
+        from sqlalchemy import delete, select
+        from models import (
+            CorporateStageDaily, GmailSyncCursor, InboxCounter, SendJobItem,
+            SendLedger, UserActivity, UserEvent,
+        )
+        from send_jobs import delete_applications_cascade
+
+        delete_applications_cascade(
+            db.session.scalars(select(Application.id).where(Application.user_id == user_id)).all()
+        )
+        job_ids = select(SendJob.id).where(SendJob.user_id == user_id)
+        for statement in (
+            delete(Document).where(Document.user_id == user_id),
+            delete(SendJobItem).where(SendJobItem.job_id.in_(job_ids)),
+            delete(SendJob).where(SendJob.user_id == user_id),
+            delete(SendLedger).where(SendLedger.user_id == user_id),
+            delete(GmailSyncCursor).where(GmailSyncCursor.user_id == user_id),
+            delete(InboxCounter).where(InboxCounter.user_id == user_id),
+            delete(UserEvent).where(UserEvent.user_id == user_id),
+            delete(UserActivity).where(UserActivity.user_id == user_id),
+            delete(CorporateStageDaily).where(CorporateStageDaily.corporate_user_id == user_id),
+        ):
+            db.session.execute(statement.execution_options(synchronize_session=False))
 
         db.session.delete(user)
         db.session.commit()
@@ -4984,7 +4336,9 @@ def delete_application(application_id):
     application = Application.query.get_or_404(application_id)
 
     try:
-        db.session.delete(application)
+        from send_jobs import delete_applications_cascade
+
+        delete_applications_cascade([application.id])
         db.session.commit()
         flash("Application deleted successfully.", "success")
 
@@ -5129,14 +4483,10 @@ def filesize_filter(size):
 
 @app.before_request
 def before_request():
-    """Update the user's last activity timestamp on every request."""
+    """Record the user's last activity (buffered, written in batches - see session_activity.py)."""
     if current_user.is_authenticated:
-        current_user.last_activity = datetime.utcnow()
-        try:
-            db.session.commit()
-        except Exception as e:
-            print("Error updating last activity:", e)
-            db.session.rollback()
+        from session_activity import record_activity
+        record_activity(current_user.id)
 
 
 # =============================================================================
@@ -5148,37 +4498,13 @@ from db_data_update_prod.learnership_emails import learnership_email_data
 def init_learnership_emails():
     """Initialize the database with unique learnership email entries."""
     with app.app_context():
-        # Get existing emails (case-insensitive)
-        existing_emails = {
-            e.email.lower() for e in LearnershipEmail.query.all()
-        }
-        
-        added = 0
-        skipped = 0
-        
-        for entry in learnership_email_data:
-            email_lower = entry["email"].lower()
-            
-            if email_lower in existing_emails:
-                skipped += 1
-                continue  # Skip duplicates
-            
-            # Add new entry
-            email_entry = LearnershipEmail(
-                company_name=entry["company_name"],
-                email=entry["email"],
-                is_active=True
-            )
-            db.session.add(email_entry)
-            existing_emails.add(email_lower)  # Track it
-            added += 1
-        
         try:
+            added, updated = email_checker.sync_addresses(learnership_email_data)
             db.session.commit()
-            if added > 0:
-                print(f"✅ Added {added} new learnership emails. Skipped {skipped} duplicates.")
+            if added or updated:
+                print(f"✅ Added {added} new learnership emails. Updated {updated} company names.")
             else:
-                print(f"No new emails to add. {skipped} already exist.")
+                print(f"No new emails to add. {len(learnership_email_data)} already exist.")
         except Exception as e:
             print("Error adding learnership emails:", e)
             db.session.rollback()
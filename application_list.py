@@ -0,0 +1,85 @@
+# application_list.py
+"""
+Keyset-paginated application lists for my_applications.
+
+Pages are ordered by (updated_at DESC, id DESC), with submitted_at standing
+in for updated_at on legacy rows that never had it set (SORT_AT); a row with
+neither timestamp is left out. The cursor encodes the last row of the
+previous page, so page N costs the same as page 1 however many applications
+a user has. Tab filters run in SQL; their counts come from stats_service.
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from models import Application
+
+# Matches the ix_application_user_id_sort_at expression index
+SORT_AT = func.coalesce(Application.updated_at, Application.submitted_at)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# my_applications tab -> SQL filter
+TAB_FILTERS = {
+    'all': None,
+    'sent': Application.email_status.in_(('sent', 'delivered', 'read')),
+    'responded': Application.email_status == 'responded',
+    'pending': Application.status == 'pending',
+    'failed': Application.email_status == 'failed',
+}
+
+
+def encode_cursor(application):
+    sort_at = application.updated_at or application.submitted_at
+    raw = f"{sort_at.isoformat()}|{application.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(sort time, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        updated_at, app_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(updated_at), int(app_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def fetch_page(user_id, tab='all', cursor=None, limit=DEFAULT_PAGE_SIZE,
+               status=None, email_status=None):
+    """
+    One page of a user's applications, optionally narrowed to an application
+    status and/or email status on top of the tab filter.
+    Returns (applications, next_cursor); next_cursor is None on the last page.
+    """
+    if tab not in TAB_FILTERS:
+        raise ValueError(f"Unknown tab: {tab}")
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    query = Application.query.filter(Application.user_id == user_id, SORT_AT.isnot(None))
+
+    if TAB_FILTERS[tab] is not None:
+        query = query.filter(TAB_FILTERS[tab])
+    if status:
+        query = query.filter(Application.status == status)
+    if email_status:
+        query = query.filter(Application.email_status == email_status)
+
+    if cursor:
+        sort_at, app_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            SORT_AT < sort_at,
+            and_(SORT_AT == sort_at, Application.id < app_id),
+        ))
+
+    # One extra row tells us whether there is another page
+    rows = (
+        query.order_by(SORT_AT.desc(), Application.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    applications = rows[:limit]
+    next_cursor = encode_cursor(applications[-1]) if len(rows) > limit else None
+    return applications, next_cursor
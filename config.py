@@ -38,6 +38,21 @@ class Config:
         'https://www.googleapis.com/auth/userinfo.email'        # User email
     ]
 
+    # Gmail API quota - shared token buckets, see quota.py
+    GMAIL_QUOTA_STORE = os.environ.get("GMAIL_QUOTA_STORE", "database")  # 'database' or 'local'
+    GMAIL_USER_QUOTA_PER_SECOND = int(os.environ.get("GMAIL_USER_QUOTA_PER_SECOND", 250))
+    GMAIL_PROJECT_QUOTA_PER_SECOND = int(os.environ.get("GMAIL_PROJECT_QUOTA_PER_SECOND", 20000))
+
+    # Concurrent sends, see send_pool.py
+    SEND_WORKERS_PER_USER = int(os.environ.get("SEND_WORKERS_PER_USER", 4))
+    SEND_MAX_CONCURRENCY = int(os.environ.get("SEND_MAX_CONCURRENCY", 16))
+
+    # Seconds between batched writes of user activity (session_activity.py)
+    ACTIVITY_FLUSH_SECONDS = int(os.environ.get("ACTIVITY_FLUSH_SECONDS", 60))
+
+    # Total attachment size per message, checked before encoding (mime_stream.py)
+    MAX_ATTACHMENT_BYTES = int(os.environ.get("MAX_ATTACHMENT_BYTES", 18 * 1024 * 1024))
+
     APPLICATION_EMAIL = os.environ.get("APPLICATION_EMAIL")
     APPLICATION_EMAIL_PASSWORD = os.environ.get("APPLICATION_EMAIL_PASSWORD")
 
@@ -0,0 +1,299 @@
+# corporate_rollup.py
+"""
+Corporate analytics served from the corporate_stage_daily rollup.
+
+Whenever a flush adds, deletes, reassigns or re-stages an Application that
+belongs to a corporate user (Application.update_stage, schedule_interview,
+or a route setting application_stage directly), the matching rollup rows are
+adjusted in the same transaction. The analytics page and its polling
+endpoint then read a handful of small rows instead of every application:
+
+    current stage count  = SUM(entered - exited) per stage
+    applications per day = SUM(received) per day
+
+rebuild() recomputes the rollup from the application table (see
+scripts_/backfill_corporate_rollup.py).
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db, Application, CorporateStageDaily, LearnearshipOpportunity, CalendarEvent
+
+# Stages shown on the analytics chart, in pipeline order
+STAGE_LABELS = [
+    ('applied', 'Applied'),
+    ('reviewed', 'Reviewed'),
+    ('interview_scheduled', 'Interview'),
+    ('interview_completed', 'Completed'),
+    ('accepted', 'Accepted'),
+    ('rejected', 'Rejected'),
+]
+
+TREND_DAYS = 7
+
+
+def _day(value):
+    """A date from a datetime, a date, or SQLite's 'YYYY-MM-DD' string"""
+    if value is None:
+        return datetime.utcnow().date()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _apply(connection, deltas):
+    """Add (corporate_user_id, day, stage) -> {column: n} deltas to the rollup"""
+    rows = [
+        {'corporate_user_id': corporate_user_id, 'day': day, 'stage': stage,
+         'received': counts['received'], 'entered': counts['entered'], 'exited': counts['exited']}
+        for (corporate_user_id, day, stage), counts in deltas.items()
+        if any(counts.values())
+    ]
+    if not rows:
+        return
+
+    table = CorporateStageDaily.__table__
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['corporate_user_id', 'day', 'stage'],
+        set_={
+            column: table.c[column] + statement.excluded[column]
+            for column in ('received', 'entered', 'exited')
+        },
+    )
+    connection.execute(statement, rows)
+
+
+def _move(deltas, before, after):
+    """
+    Record one application going from `before` to `after`, each a
+    (corporate_user_id, stage, submitted_at) tuple or None.
+    """
+    today = datetime.utcnow().date()
+
+    def bump(corporate_user_id, day, stage, column, n):
+        deltas.setdefault((corporate_user_id, day, stage), Counter())[column] += n
+
+    if before and after and before[:2] == after[:2]:
+        return
+
+    if before:
+        corporate_user_id, stage, submitted_at = before
+        bump(corporate_user_id, today, stage, 'exited', 1)
+        if not after or after[0] != corporate_user_id:
+            bump(corporate_user_id, _day(submitted_at), stage, 'received', -1)
+
+    if after:
+        corporate_user_id, stage, submitted_at = after
+        bump(corporate_user_id, today, stage, 'entered', 1)
+        if not before or before[0] != corporate_user_id:
+            bump(corporate_user_id, _day(submitted_at), stage, 'received', 1)
+
+
+def _membership(corporate_user_id, stage, submitted_at):
+    if not corporate_user_id:
+        return None
+    return corporate_user_id, stage or 'applied', submitted_at
+
+
+def _stored_memberships(connection, application_ids):
+    """Pipeline membership of applications as currently stored"""
+    if not application_ids:
+        return {}
+    rows = connection.execute(
+        select(
+            Application.id,
+            Application.corporate_user_id,
+            Application.application_stage,
+            Application.submitted_at,
+        ).where(Application.id.in_(application_ids))
+    ).all()
+    return {row.id: _membership(row.corporate_user_id, row.application_stage, row.submitted_at) for row in rows}
+
+
+def remove_applications(application_ids):
+    """Take applications out of the rollup before a set-based delete (no commit)"""
+    connection = db.session.connection()
+    deltas = {}
+    for before in _stored_memberships(connection, list(application_ids)).values():
+        if before:
+            _move(deltas, before, None)
+    _apply(connection, deltas)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_pipeline_changes(session, flush_context, instances):
+    new = [obj for obj in session.new if isinstance(obj, Application)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Application)]
+    changed = []
+    for obj in session.dirty:
+        if isinstance(obj, Application):
+            attrs = inspect(obj).attrs
+            if attrs.application_stage.history.has_changes() or attrs.corporate_user_id.history.has_changes():
+                changed.append(obj)
+
+    if not (deleted or changed or any(obj.corporate_user_id for obj in new)):
+        return
+
+    connection = session.connection()
+    # The database still holds the pre-flush values, loaded or not
+    stored = _stored_memberships(connection, [obj.id for obj in changed + deleted])
+
+    deltas = {}
+    for obj in new:
+        _move(deltas, None, _membership(obj.corporate_user_id, obj.application_stage, obj.submitted_at))
+    for obj in changed:
+        _move(deltas, stored.get(obj.id), _membership(obj.corporate_user_id, obj.application_stage, obj.submitted_at))
+    for obj in deleted:
+        _move(deltas, stored.get(obj.id), None)
+
+    _apply(connection, deltas)
+
+
+# =============================================================================
+# READ SIDE
+# =============================================================================
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def stage_counts(corporate_user_id):
+    rows = db.session.execute(
+        select(
+            CorporateStageDaily.stage,
+            func.sum(CorporateStageDaily.entered - CorporateStageDaily.exited),
+        )
+        .where(CorporateStageDaily.corporate_user_id == corporate_user_id)
+        .group_by(CorporateStageDaily.stage)
+    ).all()
+    return {stage: int(count or 0) for stage, count in rows}
+
+
+def daily_received(corporate_user_id, days=TREND_DAYS):
+    """Applications received on each of the last `days` days, oldest first"""
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    rows = db.session.execute(
+        select(CorporateStageDaily.day, func.sum(CorporateStageDaily.received))
+        .where(
+            CorporateStageDaily.corporate_user_id == corporate_user_id,
+            CorporateStageDaily.day >= start,
+        )
+        .group_by(CorporateStageDaily.day)
+    ).all()
+    by_day = {_day(day): int(count or 0) for day, count in rows}
+    return [by_day.get(start + timedelta(days=i), 0) for i in range(days)]
+
+
+def total_received(corporate_user_id):
+    return int(db.session.scalar(
+        select(func.coalesce(func.sum(CorporateStageDaily.received), 0))
+        .where(CorporateStageDaily.corporate_user_id == corporate_user_id)
+    ) or 0)
+
+
+def opportunity_counts(corporate_user_id):
+    now = datetime.utcnow()
+    this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    row = db.session.execute(
+        select(
+            func.count(LearnearshipOpportunity.id).label('total'),
+            _count_if(LearnearshipOpportunity.is_active == True).label('active'),
+            _count_if(func.coalesce(LearnearshipOpportunity.is_active, False) == False).label('inactive'),
+            _count_if(LearnearshipOpportunity.expire_date <= now).label('expired'),
+            _count_if(LearnearshipOpportunity.created_at >= this_month).label('new_this_month'),
+        ).where(LearnearshipOpportunity.company_id == corporate_user_id)
+    ).one()
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+
+def get_corporate_analytics(corporate_user_id):
+    """Everything corporate_analytics.html needs, from the rollup and two aggregate queries"""
+    stages = stage_counts(corporate_user_id)
+    weekly_trends = daily_received(corporate_user_id)
+    opportunities = opportunity_counts(corporate_user_id)
+    total_applications = total_received(corporate_user_id)
+
+    upcoming_interviews = CalendarEvent.query.filter(
+        CalendarEvent.corporate_user_id == corporate_user_id,
+        CalendarEvent.start_datetime > datetime.utcnow(),
+        CalendarEvent.event_type == 'interview'
+    ).count()
+
+    candidates_hired = stages.get('hired', 0)
+
+    return {
+        'application_stages': [
+            {'label': label, 'value': stages.get(stage, 0)} for stage, label in STAGE_LABELS
+        ],
+        'weekly_trends': weekly_trends,
+        'opportunity_performance': [
+            {'label': 'Active', 'value': opportunities['active']},
+            {'label': 'Inactive', 'value': opportunities['inactive']},
+            {'label': 'Expired', 'value': opportunities['expired']},
+        ],
+        'total_opportunities': opportunities['total'],
+        'total_applications': total_applications,
+        'interviews_scheduled': stages.get('interview_scheduled', 0),
+        'candidates_hired': candidates_hired,
+        'new_opportunities_this_month': opportunities['new_this_month'],
+        'applications_this_week': sum(weekly_trends),
+        'upcoming_interviews': upcoming_interviews,
+        'hire_rate': round((candidates_hired / max(total_applications, 1)) * 100, 1),
+    }
+
+
+# =============================================================================
+# REBUILD
+# =============================================================================
+
+def rebuild(corporate_user_id=None):
+    """Recompute the rollup from the application table (one user or everyone). Returns rows written."""
+    stage = func.coalesce(Application.application_stage, 'applied')
+    managed = [Application.corporate_user_id.isnot(None)]
+    if corporate_user_id is not None:
+        managed.append(Application.corporate_user_id == corporate_user_id)
+
+    deltas = {}
+
+    def bump(key, column, n):
+        deltas.setdefault(key, Counter())[column] += n
+
+    received = db.session.execute(
+        select(Application.corporate_user_id, func.date(Application.submitted_at), stage, func.count())
+        .where(*managed)
+        .group_by(Application.corporate_user_id, func.date(Application.submitted_at), stage)
+    ).all()
+    for owner, day, app_stage, count in received:
+        bump((owner, _day(day), app_stage), 'received', count)
+
+    # Stage history is not stored, so each application entered its current
+    # stage on the day of the last corporate action
+    entered_on = func.date(func.coalesce(Application.last_corporate_action, Application.submitted_at))
+    entered = db.session.execute(
+        select(Application.corporate_user_id, entered_on, stage, func.count())
+        .where(*managed)
+        .group_by(Application.corporate_user_id, entered_on, stage)
+    ).all()
+    for owner, day, app_stage, count in entered:
+        bump((owner, _day(day), app_stage), 'entered', count)
+
+    clear = delete(CorporateStageDaily)
+    if corporate_user_id is not None:
+        clear = clear.where(CorporateStageDaily.corporate_user_id == corporate_user_id)
+    db.session.execute(clear.execution_options(synchronize_session=False))
+
+    _apply(db.session.connection(), deltas)
+    db.session.commit()
+    return len(deltas)
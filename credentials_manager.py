@@ -0,0 +1,182 @@
+# credentials_manager.py
+"""
+One place to turn a user's GoogleToken row into usable Google credentials.
+
+- Decoded Credentials are cached per user and reused until the row's
+  refreshed_at changes (new login, or a refresh by another worker).
+- Access tokens are refreshed REFRESH_MARGIN before they expire, not after a
+  request has already failed.
+- Refresh is single-flight: one thread per process (threading lock) and one
+  process overall (row lock on google_token), with a re-check after each lock
+  so waiters pick up the token the winner just stored.
+- The refreshed token is written back with a compare-and-set on refreshed_at.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from sqlalchemy import select, update
+
+logger = logging.getLogger(__name__)
+
+REFRESH_MARGIN = timedelta(minutes=5)
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+_cache_lock = threading.Lock()
+_cache = {}  # user_id -> (refreshed_at, Credentials)
+_refresh_locks = defaultdict(threading.Lock)
+
+
+def parse_token_data(token_json):
+    """Normalise stored token JSON (Authlib or google-auth shaped) into one dict"""
+    token_data = json.loads(token_json) if isinstance(token_json, str) else dict(token_json or {})
+
+    if not token_data.get('client_id'):
+        token_data['client_id'] = current_app.config.get('GOOGLE_CLIENT_ID')
+    if not token_data.get('client_secret'):
+        token_data['client_secret'] = current_app.config.get('GOOGLE_CLIENT_SECRET')
+    if not token_data.get('token_uri'):
+        token_data['token_uri'] = TOKEN_URI
+
+    # Handle different token formats (Authlib vs. standard)
+    access_token = token_data.get('access_token') or token_data.get('token')
+    token_data['access_token'] = token_data['token'] = access_token
+
+    missing = [f for f in ('token', 'refresh_token', 'client_id', 'client_secret') if not token_data.get(f)]
+    if missing:
+        logger.error(f"Missing required credential fields: {missing}")
+
+    return token_data
+
+
+def credentials_from_token_data(token_data):
+    """Credentials with expiry set from the stored expires_at (epoch seconds)"""
+    scopes = token_data.get('scopes') or current_app.config.get('GOOGLE_OAUTH_SCOPES', [
+        'https://www.googleapis.com/auth/gmail.send',
+        'https://www.googleapis.com/auth/gmail.readonly',
+        'https://www.googleapis.com/auth/gmail.modify'
+    ])
+
+    expiry = None
+    if token_data.get('expires_at'):
+        # google-auth compares expiry against naive UTC
+        expiry = datetime.utcfromtimestamp(float(token_data['expires_at']))
+
+    return Credentials(
+        token=token_data.get('token'),
+        refresh_token=token_data.get('refresh_token'),
+        token_uri=token_data.get('token_uri'),
+        client_id=token_data.get('client_id'),
+        client_secret=token_data.get('client_secret'),
+        scopes=scopes,
+        expiry=expiry,
+    )
+
+
+def needs_refresh(credentials):
+    """True when the token is missing, has no known expiry, or expires within REFRESH_MARGIN"""
+    if not credentials.refresh_token:
+        return False
+    if not credentials.token or credentials.expiry is None:
+        return True
+    return credentials.expiry - REFRESH_MARGIN <= datetime.utcnow()
+
+
+def _remember(user_id, refreshed_at, credentials):
+    with _cache_lock:
+        _cache[user_id] = (refreshed_at, credentials)
+
+
+def invalidate(user_id):
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
+
+def get_credentials(user_id):
+    """Fresh Credentials for a user, or None if they never connected Google"""
+    from models import db, GoogleToken
+
+    row = db.session.execute(
+        select(GoogleToken.refreshed_at, GoogleToken.token_json)
+        .where(GoogleToken.user_id == user_id)
+    ).first()
+    if row is None or not row.token_json:
+        return None
+
+    with _cache_lock:
+        cached = _cache.get(user_id)
+
+    if cached and cached[0] == row.refreshed_at:
+        credentials = cached[1]
+    else:
+        credentials = credentials_from_token_data(parse_token_data(row.token_json))
+        _remember(user_id, row.refreshed_at, credentials)
+
+    return ensure_fresh(user_id, credentials)
+
+
+def ensure_fresh(user_id, credentials):
+    """Return credentials that are good for at least REFRESH_MARGIN"""
+    if not needs_refresh(credentials):
+        return credentials
+
+    with _refresh_locks[user_id]:
+        # Another thread in this process may have refreshed while we waited
+        with _cache_lock:
+            cached = _cache.get(user_id)
+        if cached and not needs_refresh(cached[1]):
+            return cached[1]
+
+        return _refresh_and_store(user_id)
+
+
+def _refresh_and_store(user_id):
+    from models import db, GoogleToken
+
+    table = GoogleToken.__table__
+
+    # Separate connection + row lock: other processes wait here, then see our token
+    with db.engine.begin() as conn:
+        row = conn.execute(
+            select(table.c.token_json, table.c.refreshed_at)
+            .where(table.c.user_id == user_id)
+            .with_for_update()
+        ).first()
+        if row is None:
+            return None
+
+        token_data = parse_token_data(row.token_json)
+        credentials = credentials_from_token_data(token_data)
+
+        if not needs_refresh(credentials):
+            _remember(user_id, row.refreshed_at, credentials)
+            return credentials
+
+        credentials.refresh(Request())
+        logger.info(f"🔄 Refreshed Google token for user {user_id}")
+
+        token_data['access_token'] = token_data['token'] = credentials.token
+        if credentials.refresh_token:
+            token_data['refresh_token'] = credentials.refresh_token
+        if credentials.expiry:
+            token_data['expires_at'] = int((credentials.expiry - datetime(1970, 1, 1)).total_seconds())
+
+        refreshed_at = datetime.utcnow()
+        result = conn.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.refreshed_at == row.refreshed_at)
+            .values(token_json=json.dumps(token_data), refreshed_at=refreshed_at)
+        )
+        if not result.rowcount:
+            # Row changed under us (e.g. the user just logged in again); keep theirs
+            logger.info(f"Token for user {user_id} changed during refresh, not overwriting")
+            invalidate(user_id)
+            return credentials
+
+    _remember(user_id, refreshed_at, credentials)
+    return credentials
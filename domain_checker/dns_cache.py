@@ -0,0 +1,70 @@
+# dns_cache.py
+"""
+Domain-keyed cache of mail host lookups, stored in domain_dns_cache.
+
+ReachabilityChecker resolves each domain at most once per pass and reports
+what it found; store() keeps it until the record's TTL runs out (capped at
+MAX_TTL), so the next pass only resolves domains whose entry has expired.
+NXDOMAIN and "no MX and no A record" are cached for NEGATIVE_TTL. Timeouts
+and server failures are not cached.
+"""
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import db, DomainDnsCache
+
+MIN_TTL = 60
+MAX_TTL = 24 * 3600
+NEGATIVE_TTL = 3600
+
+# status: 'mx', 'a', 'nxdomain' or 'no_mail'; hosts: mail hosts by preference
+Resolution = namedtuple('Resolution', 'status hosts ttl')
+
+
+def cached_hosts(domains):
+    """{domain: hosts} for the domains with an unexpired entry (hosts is [] for negative entries)"""
+    if not domains:
+        return {}
+    rows = db.session.execute(
+        select(DomainDnsCache.domain, DomainDnsCache.hosts)
+        .where(
+            DomainDnsCache.domain.in_(list(domains)),
+            DomainDnsCache.expires_at > datetime.utcnow(),
+        )
+    ).all()
+    return {domain: json.loads(hosts) for domain, hosts in rows}
+
+
+def store(resolutions):
+    """Upsert {domain: Resolution} into the cache (no commit)"""
+    if not resolutions:
+        return
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            'domain': domain,
+            'status': resolution.status,
+            'hosts': json.dumps(resolution.hosts),
+            'resolved_at': now,
+            'expires_at': now + timedelta(seconds=max(MIN_TTL, min(resolution.ttl, MAX_TTL))),
+        }
+        for domain, resolution in resolutions.items()
+    ]
+
+    table = DomainDnsCache.__table__
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['domain'],
+        set_={column: statement.excluded[column] for column in ('status', 'hosts', 'resolved_at', 'expires_at')},
+    )
+    connection.execute(statement, rows)
@@ -1,60 +1,115 @@
 # email_checker_service.py
-import smtplib
-import socket
-import dns.resolver
-import threading
-import time
-import schedule
-from datetime import datetime, timedelta
-from learnership_emails import learnership_email_data, update_email_status
-import logging
-
-class EmailReachabilityChecker:
-    def __init__(self):
-        self.check_interval = 86400  # 24 hours in seconds
-        self.is_running = False
-        self.checker_thread = None
-        self.logger = logging.getLogger(__name__)
-        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-    def check_mx_record(self, domain):
-        try: dns.resolver.resolve(domain, 'MX'); return True
-        except: return False
-
-    def check_smtp_connection(self, email):
-        domain = email.split('@')[1]; start_time = time.time()
-        try:
-            if not self.check_mx_record(domain): return {"email": email, "status": "unreachable", "reason": "No MX record", "response_time": time.time() - start_time}
-            mx_records = dns.resolver.resolve(domain, 'MX'); mx_record = str(mx_records[0].exchange).rstrip('.')
-            with smtplib.SMTP(timeout=10) as server:
-                server.connect(mx_record, 25); code, message = server.helo()
-                if code == 250: code, message = server.mail('test@example.com'); return {"email": email, "status": "reachable" if code == 250 else "unreachable", "reason": f"SMTP code: {code}", "response_time": time.time() - start_time}
-                return {"email": email, "status": "unreachable", "reason": f"HELO failed: {code}", "response_time": time.time() - start_time}
-        except Exception as e: return {"email": email, "status": "error", "reason": str(e), "response_time": time.time() - start_time}
-
-    def check_all_emails(self):
-        self.logger.info("Starting 24-hour email reachability check...")
-        for item in learnership_email_data:
-            try:
-                result = self.check_smtp_connection(item["email"]); update_email_status(item["email"], result["status"], result["response_time"]); self.logger.info(f"Checked {item['email']}: {result['status']}"); time.sleep(2)
-            except Exception as e: self.logger.error(f"Error checking {item['email']}: {e}"); update_email_status(item["email"], "error", None)
-        self.logger.info("24-hour email check completed.")
-
-    def start_24h_checker(self):
-        if self.is_running: return
-        self.is_running = True; schedule.every(24).hours.do(self.check_all_emails); self.check_all_emails()
-        def run_scheduler():
-            while self.is_running: schedule.run_pending(); time.sleep(3600)
-        self.checker_thread = threading.Thread(target=run_scheduler, daemon=True); self.checker_thread.start(); self.logger.info("24-hour email checker started")
-
-    def stop_checker(self):
-        self.is_running = False; schedule.clear(); self.logger.info("Email checker stopped")
+"""
+Email reachability service over the LearnershipEmail table.
 
-    def get_reachable_learnerships(self):
-        return [item for item in learnership_email_data if item["status"] == "reachable"]
+Everything lives in the database: the addresses, each check's result and
+when to check again (recheck.py). Checks run in reachability_worker.py,
+which calls run_worker() / run_pass() from scheduler.py; the web app only
+reads stats and the reachable list, and can ask for a recheck.
+
+    sync_addresses(entries)       bulk upsert of {"company_name", "email"} entries
+    get_stats()                   counts from one aggregate query
+    get_reachable_learnerships()  active reachable addresses
+    request_recheck()             make every active address due now
+"""
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, update
+
+from models import db, LearnershipEmail
+from domain_checker import scheduler
+from domain_checker.status import load_counts
+
+
+class EmailReachabilityService:
+    def sync_addresses(self, entries):
+        """
+        Insert the addresses not in the table yet and refresh the company name
+        of those that are (matched case-insensitively). One select, one bulk
+        insert, one bulk update; no commit. Returns (added, updated).
+        """
+        existing = {
+            address.lower(): (row_id, company_name)
+            for row_id, address, company_name in db.session.execute(
+                select(LearnershipEmail.id, LearnershipEmail.email_address, LearnershipEmail.company_name)
+            )
+        }
+
+        new_rows, renamed, seen = [], [], set()
+        for entry in entries:
+            address = entry["email"].strip()
+            key = address.lower()
+            if not address or key in seen:
+                continue
+            seen.add(key)
+
+            if key not in existing:
+                new_rows.append({
+                    'company_name': entry["company_name"],
+                    'email_address': address,
+                    'is_active': True,
+                    'next_check_at': datetime.utcnow(),
+                })
+            elif existing[key][1] != entry["company_name"]:
+                renamed.append({'id': existing[key][0], 'company_name': entry["company_name"]})
+
+        if new_rows:
+            db.session.execute(insert(LearnershipEmail), new_rows)
+        if renamed:
+            db.session.execute(update(LearnershipEmail), renamed)
+        return len(new_rows), len(renamed)
 
     def get_stats(self):
-        total = len(learnership_email_data); reachable = len([item for item in learnership_email_data if item["status"] == "reachable"]); unreachable = len([item for item in learnership_email_data if item["status"] in ["unreachable", "error"]]); checking = len([item for item in learnership_email_data if item["status"] == "checking"])
-        return {"total": total, "reachable": reachable, "unreachable": unreachable, "checking": checking}
+        counts = load_counts()
+        total, reachable, checked = int(counts.total or 0), int(counts.reachable or 0), int(counts.checked or 0)
+        return {
+            'total': total,
+            'reachable': reachable,
+            'unreachable': checked - reachable,
+            'unchecked': total - checked,
+            'due': int(counts.due or 0),
+            'last_checked': counts.last_checked.isoformat() if counts.last_checked else None,
+        }
+
+    def get_reachable_learnerships(self):
+        rows = db.session.execute(
+            select(
+                LearnershipEmail.id,
+                LearnershipEmail.company_name,
+                LearnershipEmail.email_address,
+                LearnershipEmail.response_time,
+                LearnershipEmail.last_checked,
+            )
+            .where(LearnershipEmail.is_reachable == True, LearnershipEmail.is_active == True)
+            .order_by(func.lower(LearnershipEmail.company_name))
+        ).all()
+        return [
+            {
+                'id': row.id,
+                'company_name': row.company_name,
+                'email': row.email_address,
+                'status': 'reachable',
+                'response_time': row.response_time,
+                'last_checked': row.last_checked,
+            }
+            for row in rows
+        ]
+
+    def request_recheck(self):
+        """Make every active address due now; the worker picks them up on its next poll"""
+        result = db.session.execute(
+            update(LearnershipEmail)
+            .where(LearnershipEmail.is_active == True)
+            .values(next_check_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def run_pass(self, app):
+        return scheduler.run_pass(app)
+
+    def run_worker(self, app, stop_event=None):
+        scheduler.run_worker(app, stop_event=stop_event)
+
 
-email_checker = EmailReachabilityChecker()
\ No newline at end of file
+email_checker = EmailReachabilityService()
@@ -0,0 +1,307 @@
+# reachability.py
+"""
+Concurrent reachability checks for LearnershipEmail addresses.
+
+Two strategies, chosen explicitly:
+
+    MxStrategy         reachable if the domain has a mail host (its MX
+                       records, or its A record when it has no MX)
+    SmtpProbeStrategy  the first MX host must also accept RCPT TO for the
+                       address (connects to port 25, sends no mail)
+
+ReachabilityChecker runs every address in a batch on one asyncio loop. Each
+domain's mail hosts are resolved once per batch (MX, falling back to the A
+record), at most MAX_OPEN_SOCKETS lookups or SMTP connections are open at a
+time, and at most PER_HOST_LIMIT of those go to the same MX host, so large
+providers aren't hammered.
+
+check_batch() picks the addresses whose next_check_at has passed, takes
+the domains it can from the DNS cache (dns_cache.py), checks them, and
+writes every result, next check time (recheck.py) and new DNS entry back in
+one commit. A lookup that failed (timeout, SERVFAIL) says nothing about the
+address: its result is unknown (is_reachable None), and only its next check
+is moved, RETRY_UNKNOWN_INTERVAL out.
+"""
+import asyncio
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from models import db, LearnershipEmail
+from domain_checker import dns_cache, recheck
+from domain_checker.dns_cache import NEGATIVE_TTL, Resolution
+
+try:
+    import dns.asyncresolver
+    import dns.exception
+    import dns.resolver
+except ImportError:
+    print("⚠️  dnspython not installed. Install with: pip install dnspython")
+    dns = None
+
+MAX_OPEN_SOCKETS = 50
+PER_HOST_LIMIT = 2
+DNS_TIMEOUT = 10
+SMTP_TIMEOUT = 15
+
+DEFAULT_BATCH = 200
+
+HELO_HOST = 'codecraft.co.za'
+MAIL_FROM = 'noreply@codecraft.co.za'
+
+# is_reachable is None when the domain's lookup failed
+Reachability = namedtuple('Reachability', 'address is_reachable response_time')
+
+
+# =============================================================================
+# STRATEGIES
+# =============================================================================
+
+class MxStrategy:
+    """Reachable if the domain has a mail host"""
+    name = 'mx'
+
+    async def check(self, checker, address, mx_hosts):
+        return bool(mx_hosts)
+
+
+class SmtpProbeStrategy:
+    """Reachable if the first MX host accepts RCPT TO for the address"""
+    name = 'smtp'
+
+    def __init__(self, helo_host=HELO_HOST, mail_from=MAIL_FROM, timeout=SMTP_TIMEOUT):
+        self.helo_host = helo_host
+        self.mail_from = mail_from
+        self.timeout = timeout
+
+    async def check(self, checker, address, mx_hosts):
+        if not mx_hosts:
+            return False
+        host = mx_hosts[0]
+        async with checker.connection_slot(host):
+            try:
+                return await asyncio.wait_for(self._probe(host, address), self.timeout)
+            except (OSError, asyncio.TimeoutError, ValueError):
+                return False
+
+    async def _probe(self, host, address):
+        reader, writer = await asyncio.open_connection(host, 25)
+        try:
+            if await _smtp_reply(reader) != 220:
+                return False
+            if await _smtp_command(reader, writer, f"HELO {self.helo_host}") != 250:
+                return False
+            if await _smtp_command(reader, writer, f"MAIL FROM:<{self.mail_from}>") != 250:
+                return False
+            code = await _smtp_command(reader, writer, f"RCPT TO:<{address}>")
+            await _smtp_command(reader, writer, "QUIT")
+            return code in (250, 251, 252)
+        finally:
+            writer.close()
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (MxStrategy, SmtpProbeStrategy)}
+
+
+def get_strategy(name):
+    """A strategy instance by name ('mx' or 'smtp')"""
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown reachability strategy: {name}")
+
+
+async def _smtp_reply(reader):
+    """Final reply code, skipping '250-' continuation lines"""
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("SMTP connection closed")
+        if line[3:4] != b'-':
+            return int(line[:3])
+
+
+async def _smtp_command(reader, writer, command):
+    writer.write(command.encode() + b"\r\n")
+    await writer.drain()
+    return await _smtp_reply(reader)
+
+
+# =============================================================================
+# ENGINE
+# =============================================================================
+
+def domain_of(address):
+    return address.rsplit('@', 1)[1].lower() if '@' in address else None
+
+
+class ReachabilityChecker:
+    """
+    known_hosts: {domain: mail hosts} already resolved (from the DNS cache).
+    After run(), resolved holds a Resolution for every domain looked up.
+    """
+    def __init__(self, strategy=None, max_sockets=MAX_OPEN_SOCKETS, per_host=PER_HOST_LIMIT, known_hosts=None):
+        self.strategy = strategy or MxStrategy()
+        self.max_sockets = max_sockets
+        self.per_host = per_host
+        self.known_hosts = dict(known_hosts or {})
+        self.resolved = {}
+
+    def run(self, addresses):
+        """Check addresses concurrently; returns a Reachability per address, in order"""
+        if not addresses:
+            return []
+        if not dns:
+            return [Reachability(address, None, None) for address in addresses]
+        return asyncio.run(self._check_all(list(addresses)))
+
+    async def _check_all(self, addresses):
+        # Limits and caches live for one run, on its event loop
+        self._sockets = asyncio.Semaphore(self.max_sockets)
+        self._hosts = {}
+        self._mx = {}
+        self._resolver = dns.asyncresolver.Resolver()
+
+        loop = asyncio.get_running_loop()
+        for domain, hosts in self.known_hosts.items():
+            self._mx[domain] = loop.create_future()
+            self._mx[domain].set_result(hosts)
+
+        checks = {address: asyncio.ensure_future(self._check(address)) for address in set(addresses)}
+        await asyncio.gather(*checks.values())
+        return [checks[address].result() for address in addresses]
+
+    @asynccontextmanager
+    async def connection_slot(self, host):
+        """Hold one of the host's slots and one of the global socket slots"""
+        host_slots = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with host_slots:
+            async with self._sockets:
+                yield
+
+    def _mx_hosts(self, domain):
+        """Mail hosts by preference, looked up once per domain per run"""
+        if domain not in self._mx:
+            self._mx[domain] = asyncio.ensure_future(self._resolve_mail_hosts(domain))
+        return self._mx[domain]
+
+    async def _resolve_mail_hosts(self, domain):
+        """Mail hosts, or None if the lookup failed (timeout, SERVFAIL; not cached)"""
+        resolution = await self._resolve(domain)
+        if resolution is None:
+            return None
+        self.resolved[domain] = resolution
+        return resolution.hosts
+
+    async def _resolve(self, domain):
+        async with self._sockets:
+            try:
+                answer = await self._resolver.resolve(domain, 'MX', lifetime=DNS_TIMEOUT)
+                records = sorted(answer, key=lambda record: record.preference)
+                hosts = [str(record.exchange).rstrip('.') for record in records]
+                # A lone "MX ." (RFC 7505) means the domain accepts no mail
+                hosts = [host for host in hosts if host]
+                return Resolution('mx' if hosts else 'no_mail', hosts, answer.rrset.ttl)
+            except dns.resolver.NXDOMAIN:
+                return Resolution('nxdomain', [], NEGATIVE_TTL)
+            except dns.resolver.NoAnswer:
+                pass
+            except dns.exception.DNSException:
+                return None
+
+            # No MX: mail goes to the domain itself if it has an address (RFC 5321 5.1)
+            try:
+                answer = await self._resolver.resolve(domain, 'A', lifetime=DNS_TIMEOUT)
+                return Resolution('a', [domain], answer.rrset.ttl)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                return Resolution('no_mail', [], NEGATIVE_TTL)
+            except dns.exception.DNSException:
+                return None
+
+    async def _check(self, address):
+        start_time = time.monotonic()
+        domain = domain_of(address)
+        if not domain:
+            return Reachability(address, False, None)
+
+        try:
+            mx_hosts = await self._mx_hosts(domain)
+            if mx_hosts is None:
+                return Reachability(address, None, None)
+            is_reachable = await self.strategy.check(self, address, mx_hosts)
+        except Exception as e:
+            print(f"Error checking {address}: {e}")
+            is_reachable = False
+
+        response_time = time.monotonic() - start_time if is_reachable else None
+        return Reachability(address, is_reachable, response_time)
+
+
+# =============================================================================
+# DATABASE
+# =============================================================================
+
+def addresses_due(limit=DEFAULT_BATCH):
+    """Active addresses whose next check is due, most overdue first"""
+    return db.session.execute(
+        select(
+            LearnershipEmail.id,
+            LearnershipEmail.email_address,
+            LearnershipEmail.check_count,
+            LearnershipEmail.check_history,
+        )
+        .where(
+            LearnershipEmail.is_active == True,
+            LearnershipEmail.next_check_at <= datetime.utcnow(),
+        )
+        .order_by(LearnershipEmail.next_check_at)
+        .limit(limit)
+    ).all()
+
+
+def _scheduled(row, result, now):
+    if result.is_reachable is None:
+        # Unknown: keep the last known result and history, just try again soon
+        return {'id': row.id, 'next_check_at': recheck.retry_unknown_at(now)}
+
+    history = recheck.record_outcome(row.check_history, result.is_reachable)
+    check_count = (row.check_count or 0) + 1
+    return {
+        'id': row.id,
+        'is_reachable': result.is_reachable,
+        'response_time': result.response_time,
+        'last_checked': now,
+        'check_count': check_count,
+        'check_history': history,
+        'next_check_at': recheck.next_check_at(now, history, check_count, result.response_time),
+    }
+
+
+def check_batch(limit=DEFAULT_BATCH, strategy=None):
+    """Check the addresses due and store the results in one commit. Returns (checked, reachable)."""
+    rows = addresses_due(limit)
+    if not rows:
+        return 0, 0
+
+    domains = {domain_of(row.email_address) for row in rows} - {None}
+    checker = ReachabilityChecker(strategy, known_hosts=dns_cache.cached_hosts(domains))
+    print(f"Checking {len(rows)} emails across {len(domains)} domains "
+          f"({len(checker.known_hosts)} cached, {checker.strategy.name})...")
+    results = checker.run([row.email_address for row in rows])
+
+    dns_cache.store(checker.resolved)
+
+    now = datetime.utcnow()
+    db.session.execute(update(LearnershipEmail), [
+        _scheduled(row, result, now) for row, result in zip(rows, results)
+    ])
+    db.session.commit()
+
+    reachable = sum(1 for result in results if result.is_reachable)
+    unknown = sum(1 for result in results if result.is_reachable is None)
+    print(f"Email check batch completed: {reachable}/{len(rows)} reachable, {unknown} lookups failed")
+    return len(rows), reachable
+
@@ -0,0 +1,85 @@
+# recheck.py
+"""
+When to check each LearnershipEmail address again.
+
+Every check appends its outcome to the address's check_history (newest
+last, HISTORY_LENGTH kept). The next check is then scheduled from the
+current streak of identical outcomes:
+
+    outcome just changed, or fewer than
+    MIN_CHECKS_BEFORE_BACKOFF checks so far    FLAPPING_INTERVAL / BASE_INTERVAL
+    stable streak of n                         BASE_INTERVAL * 2 ** (n - 1)
+                                               capped at MAX_REACHABLE_INTERVAL,
+                                               or MAX_UNREACHABLE_INTERVAL
+
+A slow reachable answer (over SLOW_RESPONSE_SECONDS) halves the interval,
+and every interval gets up to JITTER of random spread so addresses first
+checked together don't stay in lockstep.
+
+A check whose DNS lookup failed records nothing; it is retried after
+RETRY_UNKNOWN_INTERVAL.
+"""
+import random
+from datetime import timedelta
+
+HISTORY_LENGTH = 32
+
+BASE_INTERVAL = timedelta(hours=24)
+FLAPPING_INTERVAL = timedelta(hours=6)
+RETRY_UNKNOWN_INTERVAL = timedelta(hours=1)
+MAX_REACHABLE_INTERVAL = timedelta(days=30)
+MAX_UNREACHABLE_INTERVAL = timedelta(days=7)  # Give dead addresses a chance to come back
+
+MIN_CHECKS_BEFORE_BACKOFF = 3
+SLOW_RESPONSE_SECONDS = 5.0
+JITTER = 0.1
+
+REACHABLE = 'R'
+UNREACHABLE = 'U'
+
+
+def record_outcome(history, is_reachable):
+    """history with this check's outcome appended"""
+    history = (history or '') + (REACHABLE if is_reachable else UNREACHABLE)
+    return history[-HISTORY_LENGTH:]
+
+
+def streak(history):
+    """How many of the latest outcomes are the same as the last one"""
+    if not history:
+        return 0
+    last = history[-1]
+    return len(history) - len(history.rstrip(last))
+
+
+def recheck_interval(history, check_count, response_time=None):
+    """Time until the next check, after the outcome at the end of `history`"""
+    run = streak(history)
+    if not history:
+        return BASE_INTERVAL
+    if run == 1 and len(history) > 1:
+        return FLAPPING_INTERVAL
+    if (check_count or 0) < MIN_CHECKS_BEFORE_BACKOFF:
+        return BASE_INTERVAL
+
+    reachable = history[-1] == REACHABLE
+    cap = MAX_REACHABLE_INTERVAL if reachable else MAX_UNREACHABLE_INTERVAL
+    # 2 ** 5 days already exceeds either cap
+    interval = min(BASE_INTERVAL * 2 ** min(run - 1, 5), cap)
+
+    if reachable and response_time and response_time > SLOW_RESPONSE_SECONDS:
+        interval /= 2
+    return interval
+
+
+def _jittered(now, interval):
+    return now + interval * (1 + random.uniform(-JITTER, JITTER))
+
+
+def next_check_at(now, history, check_count, response_time=None):
+    return _jittered(now, recheck_interval(history, check_count, response_time))
+
+
+def retry_unknown_at(now):
+    """Next check after a failed lookup; history and check count are unchanged"""
+    return _jittered(now, RETRY_UNKNOWN_INTERVAL)
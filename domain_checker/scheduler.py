@@ -0,0 +1,76 @@
+# scheduler.py
+"""
+Singleton reachability passes.
+
+run_worker() is the loop behind reachability_worker.py. Every POLL_INTERVAL
+seconds it looks for addresses whose next check is due and, if there are
+any, tries to take the 'reachability' job lease. Whichever process gets it
+checks the due addresses batch after batch, renewing the lease between
+batches, then releases it. Any other copy of the worker skips that pass, so
+only one pass runs cluster-wide and no two passes probe the same addresses.
+"""
+import time
+
+from job_lease import acquire, holder_id, release
+from models import db
+from domain_checker.reachability import DEFAULT_BATCH, addresses_due, check_batch
+
+LEASE_NAME = 'reachability'
+LEASE_SECONDS = 15 * 60  # Longer than one batch; renewed between batches
+POLL_INTERVAL = 60
+
+
+def run_pass(app, holder=None):
+    """One lease-guarded pass over the addresses due. Returns addresses checked (0 if another process holds the lease)."""
+    holder = holder or holder_id()
+    checked = 0
+
+    with app.app_context():
+        try:
+            if not acquire(LEASE_NAME, holder, LEASE_SECONDS):
+                return 0
+            try:
+                while True:
+                    batch_checked, _ = check_batch(DEFAULT_BATCH)
+                    checked += batch_checked
+                    if batch_checked < DEFAULT_BATCH or not acquire(LEASE_NAME, holder, LEASE_SECONDS):
+                        break
+            except Exception:
+                # A failed statement leaves the session unusable; release needs it
+                db.session.rollback()
+                raise
+            finally:
+                release(LEASE_NAME, holder)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Reachability pass error: {e}")
+        finally:
+            db.session.remove()
+
+    return checked
+
+
+def _has_due(app):
+    with app.app_context():
+        try:
+            return bool(addresses_due(limit=1))
+        finally:
+            db.session.remove()
+
+
+def run_worker(app, poll_interval=POLL_INTERVAL, stop_event=None):
+    """Run reachability passes forever (or until stop_event is set)"""
+    holder = holder_id()
+    print(f"📡 Reachability worker {holder} started")
+
+    while not (stop_event and stop_event.is_set()):
+        try:
+            if _has_due(app):
+                run_pass(app, holder)
+        except Exception as e:
+            print(f"Reachability worker error: {e}")
+
+        if stop_event:
+            stop_event.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
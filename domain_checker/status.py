@@ -0,0 +1,92 @@
+# status.py
+"""
+Read-only reachability summary for /api/email-status.
+
+The counts come from one aggregate query, the reachable list from one
+narrow select, and the whole payload is cached in this process for
+STATUS_CACHE_SECONDS; checks themselves only run in reachability_worker.py.
+"""
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, select
+
+from job_lease import is_held
+from models import db, LearnershipEmail
+from domain_checker.scheduler import LEASE_NAME
+
+STATUS_CACHE_SECONDS = 60
+
+_lock = threading.Lock()
+_cache = None  # (expires_at, status)
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def load_counts():
+    """Total, reachable, checked, due and the latest check time, in one aggregate query"""
+    return db.session.execute(
+        select(
+            func.count(LearnershipEmail.id).label('total'),
+            _count_if(LearnershipEmail.is_reachable == True).label('reachable'),
+            _count_if(LearnershipEmail.is_reachable.isnot(None)).label('checked'),
+            _count_if(and_(
+                LearnershipEmail.is_active == True,
+                LearnershipEmail.next_check_at <= datetime.utcnow(),
+            )).label('due'),
+            func.max(LearnershipEmail.last_checked).label('last_checked'),
+        )
+    ).one()
+
+
+def _load_status():
+    counts = load_counts()
+
+    reachable = db.session.execute(
+        select(
+            LearnershipEmail.id,
+            LearnershipEmail.company_name,
+            LearnershipEmail.email_address,
+            LearnershipEmail.response_time,
+        ).where(LearnershipEmail.is_reachable == True)
+    ).all()
+
+    total, reachable_count, checked = int(counts.total or 0), int(counts.reachable or 0), int(counts.checked or 0)
+    return {
+        'emails': [
+            {
+                'id': row.id,
+                'company_name': row.company_name,
+                'email_address': row.email_address,
+                'status': 'reachable',
+                'response_time': row.response_time,
+            }
+            for row in reachable
+        ],
+        'stats': {
+            'total': total,
+            'reachable': reachable_count,
+            'unreachable': checked - reachable_count,
+            'unchecked': total - checked,
+        },
+        'last_updated': counts.last_checked.isoformat() if counts.last_checked else None,
+        'checking': is_held(LEASE_NAME),
+    }
+
+
+def get_status():
+    """The /api/email-status payload (without 'status'), at most STATUS_CACHE_SECONDS old"""
+    global _cache
+    now = time.monotonic()
+    with _lock:
+        cached = _cache
+    if cached and cached[0] > now:
+        return cached[1]
+
+    status = _load_status()
+    with _lock:
+        _cache = (now + STATUS_CACHE_SECONDS, status)
+    return status
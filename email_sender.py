@@ -12,11 +12,9 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from flask import current_app
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 # Configure logging
@@ -34,7 +32,9 @@ def is_valid_email(email):
 
 
 def create_application_email(sender_email, to_email, subject, body, attachments=None):
-    """Create a MIME message with attachments"""
+    """Create a MIME message with attachments (used for the SMTP fallback)"""
+    from mime_stream import check_attachment_budget, iter_base64_lines
+    
     msg = MIMEMultipart()
     msg['From'] = sender_email
     msg['To'] = to_email
@@ -43,20 +43,22 @@ def create_application_email(sender_email, to_email, subject, body, attachments=
 
     # Add attachments
     if attachments:
+        check_attachment_budget([a['path'] for a in attachments])
+        
         for attachment in attachments:
             if not os.path.exists(attachment['path']):
                 logger.error(f"Attachment file not found: {attachment['path']}")
                 continue
                 
-            with open(attachment['path'], "rb") as file:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(file.read())
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename="{attachment["filename"]}"'
-                )
-                msg.attach(part)
+            # Chunked read + encode: the raw file is never held in memory whole
+            part = MIMEBase('application', 'octet-stream')
+            part['Content-Transfer-Encoding'] = 'base64'
+            part.set_payload(b''.join(iter_base64_lines(attachment['path'])).decode('ascii'))
+            part.add_header(
+                'Content-Disposition',
+                f'attachment; filename="{attachment["filename"]}"'
+            )
+            msg.attach(part)
                 
     return msg
 
@@ -64,48 +66,15 @@ def create_application_email(sender_email, to_email, subject, body, attachments=
 def get_gmail_service(user_id):
     """Get authenticated Gmail service for a user"""
     try:
-        from models import GoogleToken
+        from credentials_manager import get_credentials
         
-        google_token = GoogleToken.query.filter_by(user_id=user_id).first()
-        if not google_token:
+        credentials = get_credentials(user_id)
+        if not credentials:
             logger.error(f"No Google token found for user {user_id}")
             return None
         
-        token_data = json.loads(google_token.token_json)
-        
-        # Get client credentials from config or token
-        client_id = token_data.get('client_id') or current_app.config.get('GOOGLE_CLIENT_ID')
-        client_secret = token_data.get('client_secret') or current_app.config.get('GOOGLE_CLIENT_SECRET')
-        
-        credentials = Credentials(
-            token=token_data.get('access_token') or token_data.get('token'),
-            refresh_token=token_data.get('refresh_token'),
-            token_uri=token_data.get('token_uri', 'https://oauth2.googleapis.com/token'),
-            client_id=client_id,
-            client_secret=client_secret,
-            scopes=token_data.get('scopes', [
-                'https://www.googleapis.com/auth/gmail.send',
-                'https://www.googleapis.com/auth/gmail.readonly',
-                'https://www.googleapis.com/auth/gmail.modify'
-            ])
-        )
-        
-        # Refresh if expired
-        if credentials.expired and credentials.refresh_token:
-            from google.auth.transport.requests import Request
-            credentials.refresh(Request())
-            
-            # Update stored token
-            token_data['access_token'] = credentials.token
-            token_data['token'] = credentials.token
-            google_token.token_json = json.dumps(token_data)
-            
-            from models import db
-            db.session.commit()
-            logger.info(f"Refreshed token for user {user_id}")
-        
-        service = build('gmail', 'v1', credentials=credentials)
-        return service
+        from gmail_client import get_gmail_service as get_cached_gmail_service
+        return get_cached_gmail_service(user_id, credentials)
         
     except Exception as e:
         logger.error(f"Error creating Gmail service for user {user_id}: {e}")
@@ -153,16 +122,16 @@ def send_email_via_gmail_api(user_id, to_email, subject, body, attachments=None)
         
         sender_email = user.email
         
-        # Create MIME message
-        msg = create_application_email(sender_email, to_email, subject, body, attachments)
-        
-        # Encode for Gmail API
-        raw_message = base64.urlsafe_b64encode(msg.as_bytes()).decode('utf-8')
+        # Stream attachments straight into the Gmail API payload
+        from mailer import MessageTemplate
+        message = MessageTemplate(sender_email, subject, body, attachments).render(to_email)
         
-        # Send via Gmail API
+        # Send via Gmail API (waits for per-user / project quota first)
+        from quota import acquire
+        acquire('messages.send', user_id)
         sent_message = service.users().messages().send(
             userId='me',
-            body={'raw': raw_message}
+            body=message
         ).execute()
         
         # Extract tracking IDs
@@ -363,7 +332,10 @@ def send_bulk_applications_with_tracking(user, email_entries, documents=None):
     logger.info(f"📧 Starting bulk send to {len(email_entries)} recipients")
     logger.info(f"📎 Attachments: {len(attachments)}")
     
-    for entry in email_entries:
+    # Details stay in entry order even though sends finish out of order
+    details = [None] * len(email_entries)
+    tasks = []
+    for index, entry in enumerate(email_entries):
         # Get email and company name from entry
         to_email = entry.email if hasattr(entry, 'email') else entry.get('email')
         company_name = entry.company_name if hasattr(entry, 'company_name') else entry.get('company_name', 'Unknown Company')
@@ -371,29 +343,40 @@ def send_bulk_applications_with_tracking(user, email_entries, documents=None):
         if not to_email:
             logger.warning(f"⚠️ Skipping entry with no email: {entry}")
             results['failed'] += 1
-            results['details'].append({
+            details[index] = {
                 'company_name': company_name,
                 'to_email': None,
                 'success': False,
                 'message': 'No email address provided',
                 'timestamp': datetime.utcnow()
-            })
+            }
             continue
         
-        logger.info(f"📤 Sending to {company_name} ({to_email})...")
+        tasks.append({'index': index, 'to_email': to_email, 'company_name': company_name})
+    
+    user_id = user.id
+    
+    def send_one(task):
+        # Runs on a send_pool thread with its own app context and session
+        from models import User
         
-        # Send email
-        send_result = send_single_application_with_tracking(
-            user=user,
-            to_email=to_email,
-            company_name=company_name,
+        logger.info(f"📤 Sending to {task['company_name']} ({task['to_email']})...")
+        return send_single_application_with_tracking(
+            user=db.session.get(User, user_id),
+            to_email=task['to_email'],
+            company_name=task['company_name'],
             attachments=attachments
         )
+    
+    from send_pool import run_sends
+    
+    for task, send_result in zip(tasks, run_sends(user_id, tasks, send_one)):
+        company_name = task['company_name']
         
         # Record result
         detail = {
             'company_name': company_name,
-            'to_email': to_email,
+            'to_email': task['to_email'],
             'success': send_result['success'],
             'message': send_result['message'],
             'gmail_message_id': send_result.get('gmail_message_id'),
@@ -402,7 +385,7 @@ def send_bulk_applications_with_tracking(user, email_entries, documents=None):
             'timestamp': datetime.utcnow()
         }
         
-        results['details'].append(detail)
+        details[task['index']] = detail
         
         if send_result['success']:
             results['successful'] += 1
@@ -412,9 +395,8 @@ def send_bulk_applications_with_tracking(user, email_entries, documents=None):
         else:
             results['failed'] += 1
             logger.error(f"❌ Failed: {company_name} - {send_result['message']}")
-        
-        # Small delay to avoid rate limiting
-        time.sleep(0.5)
+    
+    results['details'] = details
     
     logger.info(f"📊 Bulk send complete: {results['successful']}/{results['total']} successful")
     
@@ -477,32 +459,25 @@ Kind regards,
     }
     
     from models import Application, db
+    from send_pool import run_sends
+    
+    user_id = user.id
     
-    for task in tasks:
+    def send_one(task):
+        # Runs on a send_pool thread with its own app context and session
         send_result = send_email_via_gmail_api(
-            user_id=user.id,
+            user_id=user_id,
             to_email=task['to_email'],
             subject=task['subject'],
             body=task['body'],
             attachments=attachments
         )
         
-        result = {
-            'learnership_id': task['learnership_id'],
-            'to_email': task['to_email'],
-            'success': send_result['success'],
-            'message': send_result['message'],
-            'gmail_message_id': send_result.get('gmail_message_id'),
-            'timestamp': datetime.utcnow()
-        }
-        
         if send_result['success']:
-            results['successful'] += 1
-            
             # Create application record with tracking
             try:
                 application = Application(
-                    user_id=user.id,
+                    user_id=user_id,
                     learnership_id=task['learnership_id'],
                     company_name=task['company_name'],
                     status='submitted',
@@ -513,15 +488,31 @@ Kind regards,
                 )
                 db.session.add(application)
                 db.session.commit()
-                result['application_id'] = application.id
+                send_result['application_id'] = application.id
             except Exception as e:
                 logger.error(f"Error saving application: {e}")
                 db.session.rollback()
+        
+        return send_result
+    
+    for task, send_result in zip(tasks, run_sends(user_id, tasks, send_one)):
+        result = {
+            'learnership_id': task['learnership_id'],
+            'to_email': task['to_email'],
+            'success': send_result['success'],
+            'message': send_result['message'],
+            'gmail_message_id': send_result.get('gmail_message_id'),
+            'timestamp': datetime.utcnow()
+        }
+        
+        if send_result['success']:
+            results['successful'] += 1
+            if send_result.get('application_id'):
+                result['application_id'] = send_result['application_id']
         else:
             results['failed'] += 1
             
         results['details'].append(result)
-        time.sleep(0.3)
     
     return results
 
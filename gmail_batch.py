@@ -0,0 +1,195 @@
+# gmail_batch.py
+"""
+Batch Gmail API reads through the HTTP batch endpoint.
+
+One BatchHttpRequest carries up to GMAIL_BATCH_LIMIT calls in a single round
+trip. Google recommends staying at or below 50 per batch because larger batches
+are more likely to be throttled, so that is the default. Each call still costs
+its own quota units, so every batch first acquires them from quota.py.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+GMAIL_BATCH_LIMIT = 100
+DEFAULT_BATCH_SIZE = 50
+MAX_BATCH_RETRIES = 3
+RETRYABLE_STATUSES = {429, 500, 503}
+
+def execute_batched(service, requests, method, batch_size=DEFAULT_BATCH_SIZE, user_id=None):
+    """
+    Run many Gmail requests through the batch endpoint.
+
+    `requests` is a list of (key, HttpRequest) pairs, `method` a quota.QUOTA_UNITS key.
+    Returns {key: response}; keys whose call failed map to the HttpError.
+    Throttled/5xx calls inside a batch are retried with backoff.
+    """
+    from quota import acquire
+
+    batch_size = max(1, min(batch_size, GMAIL_BATCH_LIMIT))
+
+    pending = dict(requests)
+    results = {}
+    batches = 0
+
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        if not pending:
+            break
+
+        if attempt:
+            delay = 2 ** attempt
+            logger.info(f"⏳ Retrying {len(pending)} throttled {method} call(s) in {delay}s")
+            time.sleep(delay)
+
+        retry = {}
+        keys = list(pending)
+
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+
+            def callback(request_id, response, exception):
+                key = key_by_id[request_id]
+                if exception is not None:
+                    status = getattr(getattr(exception, 'resp', None), 'status', None)
+                    if status in RETRYABLE_STATUSES and attempt < MAX_BATCH_RETRIES:
+                        retry[key] = pending[key]
+                    results[key] = exception
+                else:
+                    results[key] = response
+
+            key_by_id = {str(i): key for i, key in enumerate(chunk)}
+            batch = service.new_batch_http_request(callback=callback)
+            for request_id, key in key_by_id.items():
+                batch.add(pending[key], request_id=request_id)
+
+            acquire(method, user_id, count=len(chunk))
+            batch.execute()
+            batches += 1
+
+        # HttpRequest objects can be re-added to a new batch as-is
+        pending = retry
+
+    logger.info(f"📦 {method}: {len(results)} call(s) in {batches} batch(es)")
+    return results
+
+
+def _message_time(message):
+    internal_date = int(message.get('internalDate', 0) or 0)
+    return datetime.fromtimestamp(internal_date / 1000) if internal_date else None
+
+
+def status_info_from_thread(message_id, thread):
+    """
+    Build the GmailStatusChecker status_info dict for `message_id` from a
+    single threads.get(format='metadata') response.
+    """
+    messages = thread.get('messages', []) or []
+
+    original = next((m for m in messages if m.get('id') == message_id), None)
+    if original is None:
+        return {'status': 'failed', 'error': 'Message not found'}
+
+    labels = original.get('labelIds', [])
+    if 'DRAFT' in labels:
+        return {'status': 'draft', 'timestamp': None, 'delivered': False, 'read': False}
+    if 'SENT' not in labels:
+        return {'status': 'pending', 'timestamp': None, 'delivered': False, 'read': False}
+
+    sent_time = _message_time(original)
+    message_count = len(messages)
+    has_responses = message_count > 1
+
+    # Gmail exposes no read receipts; same heuristics as before
+    read = False
+    read_time = None
+    if sent_time:
+        if has_responses or datetime.utcnow() - sent_time > timedelta(hours=4):
+            read = True
+            read_time = sent_time + timedelta(hours=2)
+
+    thread_info = {
+        'has_responses': has_responses,
+        'message_count': message_count,
+        'response_count': message_count - 1 if has_responses else 0,
+        'latest_response_time': _message_time(messages[-1]) if has_responses else None,
+    }
+
+    final_status = 'delivered'
+    if read:
+        final_status = 'read'
+    if has_responses:
+        final_status = 'responded'
+
+    return {
+        'status': final_status,
+        'timestamp': sent_time,
+        'delivered': True,
+        'read': read,
+        'read_time': read_time,
+        'thread_info': thread_info,
+    }
+
+
+def _is_not_found(response):
+    return isinstance(response, HttpError) and getattr(response.resp, 'status', None) == 404
+
+
+def fetch_status_infos(service, messages, user_id=None):
+    """
+    Status for many sent messages at once.
+
+    `messages` is a list of (message_id, thread_id or None). Messages without
+    a thread id are resolved first with batched messages.get(format='minimal'),
+    then every thread is read once with batched threads.get(format='metadata').
+
+    Returns {message_id: status_info}. Calls that failed transiently are left
+    out; 404s map to the same 'failed' dict check_message_status returns.
+    """
+    users = service.users()
+    not_found = {'status': 'failed', 'error': 'Message not found'}
+
+    results = {}
+    thread_of = {}
+
+    missing = [mid for mid, tid in messages if not tid]
+    lookups = execute_batched(
+        service,
+        [(mid, users.messages().get(userId='me', id=mid, format='minimal')) for mid in missing],
+        'messages.get',
+        user_id=user_id,
+    ) if missing else {}
+
+    for mid, tid in messages:
+        if tid:
+            thread_of[mid] = tid
+            continue
+        response = lookups.get(mid)
+        if _is_not_found(response):
+            results[mid] = dict(not_found)
+        elif isinstance(response, dict) and response.get('threadId'):
+            thread_of[mid] = response['threadId']
+
+    threads = execute_batched(
+        service,
+        [(tid, users.threads().get(
+            userId='me', id=tid, format='metadata',
+            metadataHeaders=['From', 'Subject', 'Date']
+        )) for tid in set(thread_of.values())],
+        'threads.get',
+        user_id=user_id,
+    )
+
+    for mid, tid in thread_of.items():
+        thread = threads.get(tid)
+        if _is_not_found(thread):
+            results[mid] = dict(not_found)
+        elif isinstance(thread, dict):
+            info = status_info_from_thread(mid, thread)
+            info['thread_id'] = tid
+            results[mid] = info
+
+    return results
@@ -0,0 +1,94 @@
+# gmail_client.py
+"""
+Shared Gmail API client factory.
+
+googleapiclient's build() fetches and parses the discovery document and opens
+a fresh HTTP connection every time it is called. Here the Gmail v1 discovery
+document bundled with google-api-python-client is parsed once, and built
+service objects are kept in a small LRU cache so their keep-alive connections
+to gmail.googleapis.com are reused across sends.
+
+httplib2 connections are not thread-safe, so clients are cached per
+(user, thread) rather than per user.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import googleapiclient
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_CLIENTS = 256
+HTTP_TIMEOUT = 60
+
+DISCOVERY_DOCUMENT_PATH = os.path.join(
+    os.path.dirname(googleapiclient.__file__),
+    'discovery_cache', 'documents', 'gmail.v1.json'
+)
+
+_lock = threading.Lock()
+_discovery_document = None
+_clients = OrderedDict()  # (user_id, thread ident) -> (service, authorized http)
+
+
+def get_discovery_document():
+    """Parsed Gmail v1 discovery document, loaded from disk once per process"""
+    global _discovery_document
+    if _discovery_document is None:
+        with _lock:
+            if _discovery_document is None:
+                with open(DISCOVERY_DOCUMENT_PATH) as f:
+                    _discovery_document = json.load(f)
+    return _discovery_document
+
+
+def _build_service(credentials):
+    http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    service = build_from_document(get_discovery_document(), http=http)
+    return service, http
+
+
+def get_gmail_service(user_id, credentials):
+    """
+    Return an authorized Gmail service for this user and thread.
+
+    A cached client is re-pointed at `credentials`, so callers can keep
+    passing freshly refreshed credentials without rebuilding anything.
+    """
+    if user_id is None:
+        return _build_service(credentials)[0]
+
+    key = (user_id, threading.get_ident())
+
+    with _lock:
+        entry = _clients.get(key)
+        if entry is not None:
+            _clients.move_to_end(key)
+
+    if entry is not None:
+        service, http = entry
+        http.credentials = credentials
+        return service
+
+    service, http = _build_service(credentials)
+    logger.info(f"🔧 Built Gmail client for user {user_id}")
+
+    with _lock:
+        _clients[key] = (service, http)
+        while len(_clients) > MAX_CACHED_CLIENTS:
+            _clients.popitem(last=False)
+
+    return service
+
+
+def invalidate_user(user_id):
+    """Drop every cached client for a user (e.g. after they disconnect Google)"""
+    with _lock:
+        for key in [k for k in _clients if k[0] == user_id]:
+            del _clients[key]
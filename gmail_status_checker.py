@@ -1,10 +1,6 @@
 # gmail_status_checker.py
-import json
-import time
 import logging
 from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 # Set up logging
@@ -171,6 +167,7 @@ class GmailStatusChecker:
     def __init__(self, user_id):
         self.user_id = user_id
         self.service = None
+        self.changed_thread_ids = None
         logger.info(f"🔧 Initializing GmailStatusChecker for user {user_id}")
         
     def get_gmail_service(self):
@@ -178,50 +175,19 @@ class GmailStatusChecker:
         try:
             logger.info(f"📧 Creating Gmail service for user {self.user_id}")
             
-            from models import GoogleToken
+            from credentials_manager import get_credentials
             
-            google_token = GoogleToken.query.filter_by(user_id=self.user_id).first()
-            if not google_token:
+            credentials = get_credentials(self.user_id)
+            if not credentials:
                 logger.error(f"❌ No Google token found for user {self.user_id}")
                 print(f"❌ No Google token found for user {self.user_id}")
                 return None
             
             logger.info(f"✅ Found Google token for user {self.user_id}")
             
-            token_data = json.loads(google_token.token_json)
-            logger.info(f"🔑 Token scopes: {token_data.get('scopes', [])}")
-            
-            # Get client credentials
-            from flask import current_app
-            client_id = token_data.get('client_id') or current_app.config.get('GOOGLE_CLIENT_ID')
-            client_secret = token_data.get('client_secret') or current_app.config.get('GOOGLE_CLIENT_SECRET')
-            
-            credentials = Credentials(
-                token=token_data.get('access_token') or token_data.get('token'),
-                refresh_token=token_data.get('refresh_token'),
-                token_uri=token_data.get('token_uri', 'https://oauth2.googleapis.com/token'),
-                client_id=client_id,
-                client_secret=client_secret,
-                scopes=token_data.get('scopes', [])
-            )
-            
-            # Refresh if expired
-            if credentials.expired and credentials.refresh_token:
-                from google.auth.transport.requests import Request
-                credentials.refresh(Request())
-                logger.info("🔄 Token refreshed")
-                
-                # Update stored token
-                token_data['access_token'] = credentials.token
-                token_data['token'] = credentials.token
-                google_token.token_json = json.dumps(token_data)
-                
-                from models import db
-                db.session.commit()
-            
-            logger.info("🔧 Building Gmail service...")
-            self.service = build('gmail', 'v1', credentials=credentials)
-            logger.info("✅ Gmail service created successfully")
+            from gmail_client import get_gmail_service
+            self.service = get_gmail_service(self.user_id, credentials)
+            logger.info("✅ Gmail service ready")
             return self.service
             
         except Exception as e:
@@ -242,154 +208,51 @@ class GmailStatusChecker:
             return None
             
         try:
-            # Get message details
-            message = self.service.users().messages().get(
-                userId='me', 
-                id=gmail_message_id,
-                format='full'
-            ).execute()
-            
-            logger.info(f"✅ Successfully fetched message {gmail_message_id}")
-            
-            # Check labels
-            labels = message.get('labelIds', [])
-            logger.info(f"🏷️ Message labels: {labels}")
-            
-            is_sent = 'SENT' in labels
-            is_draft = 'DRAFT' in labels
-            
-            if is_draft:
-                return {'status': 'draft', 'timestamp': None, 'delivered': False, 'read': False}
-            
-            if not is_sent:
-                return {'status': 'pending', 'timestamp': None, 'delivered': False, 'read': False}
-            
-            # Get timestamp
-            internal_date = int(message.get('internalDate', 0))
-            sent_time = datetime.fromtimestamp(internal_date / 1000) if internal_date else None
-            
-            # Check thread activity
-            thread_id = gmail_thread_id or message.get('threadId')
-            delivery_status = self.check_delivery_and_read_status(gmail_message_id, thread_id)
-            thread_info = self.check_thread_activity(thread_id)
-            
-            # Determine final status
-            final_status = 'sent'
-            if delivery_status.get('delivered'):
-                final_status = 'delivered'
-            if delivery_status.get('read'):
-                final_status = 'read'
-            if thread_info.get('has_responses'):
-                final_status = 'responded'
-            
-            return {
-                'status': final_status,
-                'timestamp': sent_time,
-                'delivered': delivery_status.get('delivered', True),
-                'read': delivery_status.get('read', False),
-                'read_time': delivery_status.get('read_time'),
-                'thread_info': thread_info
-            }
-            
-        except HttpError as error:
-            if error.resp.status == 404:
-                logger.error(f"❌ Message {gmail_message_id} not found")
-                return {'status': 'failed', 'error': 'Message not found'}
-            logger.error(f"❌ Gmail API error: {error}")
-            return None
+            from gmail_batch import fetch_status_infos
+            results = fetch_status_infos(
+                self.service, [(gmail_message_id, gmail_thread_id)], user_id=self.user_id
+            )
+            return results.get(gmail_message_id)
         except Exception as e:
             logger.error(f"❌ Error checking message status: {e}")
             return None
     
-    def check_delivery_and_read_status(self, message_id, thread_id):
-        """Check delivery and read status"""
-        try:
-            if not thread_id:
-                return {'delivered': True, 'read': False}
-            
-            thread = self.service.users().threads().get(
-                userId='me',
-                id=thread_id,
-                format='full'
-            ).execute()
-            
-            messages = thread.get('messages', [])
-            
-            # Find original message
-            original_message = None
-            for msg in messages:
-                if msg['id'] == message_id:
-                    original_message = msg
-                    break
-            
-            if not original_message:
-                return {'delivered': True, 'read': False}
-            
-            delivered = True
-            has_replies = len(messages) > 1
-            
-            internal_date = int(original_message.get('internalDate', 0))
-            sent_time = datetime.fromtimestamp(internal_date / 1000) if internal_date else None
-            
-            read_status = False
-            read_time = None
-            
-            if sent_time:
-                time_since_sent = datetime.utcnow() - sent_time
-                
-                if time_since_sent > timedelta(hours=1):
-                    delivered = True
-                
-                if has_replies or time_since_sent > timedelta(hours=4):
-                    read_status = True
-                    read_time = sent_time + timedelta(hours=2)
-            
-            return {
-                'delivered': delivered,
-                'read': read_status,
-                'read_time': read_time,
-                'has_replies': has_replies
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Error checking delivery status: {e}")
-            return {'delivered': True, 'read': False}
-    
-    def check_thread_activity(self, thread_id):
-        """Check for responses in the thread"""
-        try:
-            thread = self.service.users().threads().get(
-                userId='me',
-                id=thread_id,
-                format='metadata'
-            ).execute()
-            
-            messages = thread.get('messages', [])
-            message_count = len(messages)
-            has_responses = message_count > 1
-            
-            latest_response_time = None
-            response_count = 0
-            
-            if has_responses:
-                response_count = message_count - 1
-                latest_message = messages[-1]
-                internal_date = int(latest_message.get('internalDate', 0))
-                latest_response_time = datetime.fromtimestamp(internal_date / 1000) if internal_date else None
-            
-            return {
-                'has_responses': has_responses,
-                'message_count': message_count,
-                'response_count': response_count,
-                'latest_response_time': latest_response_time
-            }
+    def check_message_statuses(self, applications):
+        """
+        Check many applications at once through the Gmail batch endpoint.
+
+        Returns {application_id: status_info}; applications whose lookup failed
+        transiently are left out.
+        """
+        if not self.service:
+            self.service = self.get_gmail_service()
             
-        except Exception as e:
-            logger.error(f"❌ Error checking thread activity: {e}")
-            return {'has_responses': False, 'message_count': 1, 'response_count': 0, 'latest_response_time': None}
+        if not self.service:
+            logger.error("❌ Could not create Gmail service")
+            return {}
+        
+        from gmail_batch import fetch_status_infos
+        
+        tracked = [a for a in applications if a.gmail_message_id]
+        infos = fetch_status_infos(
+            self.service,
+            [(a.gmail_message_id, a.gmail_thread_id) for a in tracked],
+            user_id=self.user_id
+        )
+        
+        return {
+            a.id: infos[a.gmail_message_id]
+            for a in tracked
+            if a.gmail_message_id in infos
+        }
     
-    def update_application_statuses(self):
-        """Update statuses for all applications with Gmail IDs"""
+    def update_application_statuses(self, changed_thread_ids=None):
+        """
+        Update statuses for all applications with Gmail IDs.
+
+        With changed_thread_ids (from an incremental sync) only applications in
+        those threads, or still 'sent'/'delivered', are re-checked.
+        """
         logger.info(f"🔄 Starting status update for user {self.user_id}")
         print(f"🔄 Starting status update for user {self.user_id}")
         
@@ -401,7 +264,17 @@ class GmailStatusChecker:
             user_id=self.user_id
         ).filter(
             Application.gmail_message_id.isnot(None)
-        ).all()
+        )
+        
+        if changed_thread_ids is not None:
+            from sqlalchemy import or_
+            applications = applications.filter(or_(
+                Application.gmail_thread_id.in_(changed_thread_ids or ['']),
+                Application.gmail_thread_id.is_(None),
+                Application.email_status.in_(['sent', 'delivered'])
+            ))
+        
+        applications = applications.all()
         
         # Also log applications WITHOUT gmail_message_id for debugging
         apps_without_id = Application.query.filter_by(
@@ -425,13 +298,20 @@ class GmailStatusChecker:
         
         updated_count = 0
         
+        try:
+            status_infos = self.check_message_statuses(applications)
+        except Exception as e:
+            logger.error(f"❌ Error checking statuses: {e}")
+            return 0
+        
         for app in applications:
             try:
-                logger.info(f"🔍 Checking application {app.id}, Gmail ID: {app.gmail_message_id[:20]}...")
-                
-                status_info = self.check_message_status(app.gmail_message_id, app.gmail_thread_id)
+                status_info = status_infos.get(app.id)
                 
                 if status_info and 'error' not in status_info:
+                    if status_info.get('thread_id') and not app.gmail_thread_id:
+                        app.gmail_thread_id = status_info['thread_id']
+                    
                     old_status = app.email_status
                     
                     if status_info['timestamp'] and not app.sent_at:
@@ -465,8 +345,6 @@ class GmailStatusChecker:
                         app.email_status = 'failed'
                         updated_count += 1
                 
-                time.sleep(0.2)
-                
             except Exception as e:
                 logger.error(f"❌ Error updating application {app.id}: {e}")
                 continue
@@ -499,10 +377,17 @@ class GmailStatusChecker:
         
         responses_found = 0
         
+        try:
+            status_infos = self.check_message_statuses(recent_apps)
+        except Exception as e:
+            logger.error(f"❌ Error checking responses: {e}")
+            return 0
+        
         for app in recent_apps:
             try:
-                if app.gmail_thread_id:
-                    thread_info = self.check_thread_activity(app.gmail_thread_id)
+                status_info = status_infos.get(app.id)
+                if status_info and 'error' not in status_info:
+                    thread_info = status_info.get('thread_info', {})
                     if thread_info.get('has_responses'):
                         app.email_status = 'responded'
                         app.has_response = True
@@ -511,8 +396,6 @@ class GmailStatusChecker:
                         app.updated_at = datetime.utcnow()
                         responses_found += 1
                         logger.info(f"✅ Found response for application {app.id}")
-                
-                time.sleep(0.2)
             except Exception as e:
                 logger.error(f"❌ Error checking app {app.id}: {e}")
                 continue
@@ -582,16 +465,145 @@ class GmailStatusChecker:
             logger.error(f"❌ Error: {e}")
             return {'error': str(e)}
     
+    def _tracked_thread_ids(self):
+        """Gmail thread ids of this user's applications"""
+        from models import Application, db
+
+        rows = db.session.query(Application.gmail_thread_id).filter(
+            Application.user_id == self.user_id,
+            Application.gmail_thread_id.isnot(None)
+        ).all()
+        return {row[0] for row in rows}
+
+    def _process_incoming_messages(self, message_ids):
+        """Fetch (batched, format='full') and store incoming messages not seen yet"""
+        from models import ConversationMessage, db
+        from gmail_batch import execute_batched
+
+        if not message_ids:
+            return False
+
+        known = {
+            row[0] for row in db.session.query(ConversationMessage.gmail_message_id)
+            .filter(ConversationMessage.gmail_message_id.in_(message_ids)).all()
+        }
+        new_ids = [mid for mid in message_ids if mid not in known]
+        if not new_ids:
+            return False
+
+        users = self.service.users()
+        messages = execute_batched(
+            self.service,
+            [(mid, users.messages().get(userId='me', id=mid, format='full')) for mid in new_ids],
+            'messages.get',
+            user_id=self.user_id,
+        )
+
+        processed_any = False
+        for mid in new_ids:
+            msg = messages.get(mid)
+            if not isinstance(msg, dict):
+                continue
+            labels = msg.get('labelIds', [])
+            if 'SENT' in labels or 'DRAFT' in labels:
+                continue
+            if process_incoming_gmail_message_for_user(msg):
+                processed_any = True
+
+        return processed_any
+
+    def _sync_from_history(self, start_history_id, tracked_threads):
+        """
+        Walk users.history.list from the stored cursor.
+
+        Returns (changed_thread_ids, latest_history_id, processed_any). Raises
+        HttpError 404 when the cursor is too old for Gmail to replay.
+        """
+        from quota import acquire
+
+        changed_threads = set()
+        incoming_ids = []
+        latest_history_id = start_history_id
+        page_token = None
+
+        while True:
+            acquire('history.list', self.user_id)
+            response = self.service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                pageToken=page_token
+            ).execute()
+
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    msg = added.get('message', {})
+                    thread_id = msg.get('threadId')
+                    if thread_id not in tracked_threads:
+                        continue
+                    changed_threads.add(thread_id)
+
+                    labels = msg.get('labelIds', [])
+                    if 'SENT' not in labels and 'DRAFT' not in labels:
+                        incoming_ids.append(msg['id'])
+
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        logger.info(f"📜 History since {start_history_id}: {len(changed_threads)} changed thread(s), {len(incoming_ids)} incoming message(s)")
+        processed_any = self._process_incoming_messages(list(dict.fromkeys(incoming_ids)))
+        return changed_threads, latest_history_id, processed_any
+
+    def _full_resync(self, tracked_threads):
+        """Re-read every tracked thread. Returns (changed_thread_ids, history_id, processed_any)."""
+        from gmail_batch import execute_batched
+        from quota import acquire
+
+        # Take the cursor before scanning so nothing that arrives mid-scan is missed
+        acquire('getProfile', self.user_id)
+        profile = self.service.users().getProfile(userId='me').execute()
+        history_id = profile.get('historyId')
+
+        users = self.service.users()
+        threads = execute_batched(
+            self.service,
+            [(tid, users.threads().get(userId='me', id=tid, format='minimal')) for tid in tracked_threads],
+            'threads.get',
+            user_id=self.user_id,
+        )
+
+        incoming_ids = []
+        for tid, thread in threads.items():
+            if not isinstance(thread, dict):
+                logger.error(f"❌ Error syncing thread {tid}: {thread}")
+                continue
+            for msg in thread.get('messages', []):
+                labels = msg.get('labelIds', [])
+                # Skip our own sent/draft messages; we only want incoming replies
+                if 'SENT' in labels or 'DRAFT' in labels:
+                    continue
+                incoming_ids.append(msg['id'])
+
+        processed_any = self._process_incoming_messages(incoming_ids)
+        return set(tracked_threads), history_id, processed_any
+
     def sync_conversation_messages(self):
         """
-        Fetch full threads for this user's applications and sync incoming messages
-        into ConversationMessage for the user inbox.
+        Sync incoming messages into ConversationMessage for the user inbox.
 
-        Returns True if any new messages were added.
+        Uses the stored Gmail historyId to fetch only what was added since the
+        last sync; falls back to a full resync when there is no cursor yet or
+        Gmail no longer has history that old (404).
+
+        Returns True if any new messages were added. The threads that changed
+        are left in self.changed_thread_ids (None after a full resync).
         """
-        from models import Application
+        from models import GmailSyncCursor, db
 
         logger.info(f"🔄 Syncing conversation messages for user {self.user_id}")
+        self.changed_thread_ids = None
 
         if not self.service:
             self.service = self.get_gmail_service()
@@ -599,42 +611,32 @@ class GmailStatusChecker:
             logger.error("❌ Could not create Gmail service for syncing conversations")
             return False
 
-        # All apps for this user that have a Gmail thread
-        apps = Application.query.filter_by(user_id=self.user_id)\
-            .filter(Application.gmail_thread_id.isnot(None))\
-            .all()
-
-        logger.info(f"📋 Found {len(apps)} applications with Gmail threads")
+        tracked_threads = self._tracked_thread_ids()
+        logger.info(f"📋 Found {len(tracked_threads)} application threads")
 
-        processed_any = False
-
-        for app in apps:
-            if not app.gmail_thread_id:
-                continue
+        cursor = GmailSyncCursor.query.filter_by(user_id=self.user_id).first()
+        if not cursor:
+            cursor = GmailSyncCursor(user_id=self.user_id)
+            db.session.add(cursor)
 
+        full_sync = True
+        if cursor.history_id:
             try:
-                thread = self.service.users().threads().get(
-                    userId='me',
-                    id=app.gmail_thread_id,
-                    format='full'
-                ).execute()
-
-                messages = thread.get('messages', [])
-                logger.info(f"   🧵 App {app.id}: thread {app.gmail_thread_id} has {len(messages)} messages")
+                changed, history_id, processed_any = self._sync_from_history(cursor.history_id, tracked_threads)
+                self.changed_thread_ids = changed
+                full_sync = False
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                logger.info(f"⚠️ History cursor {cursor.history_id} expired, doing a full resync")
 
-                for msg in messages:
-                    labels = msg.get('labelIds', [])
-                    # Skip our own sent/draft messages; we only want incoming replies
-                    if 'SENT' in labels or 'DRAFT' in labels:
-                        continue
+        if full_sync:
+            changed, history_id, processed_any = self._full_resync(tracked_threads)
+            cursor.last_full_sync_at = datetime.utcnow()
 
-                    # Process incoming message
-                    if process_incoming_gmail_message_for_user(msg):
-                        processed_any = True
-
-            except Exception as e:
-                logger.error(f"❌ Error syncing thread {app.gmail_thread_id} for application {app.id}: {e}")
-                continue
+        cursor.history_id = str(history_id) if history_id else cursor.history_id
+        cursor.last_synced_at = datetime.utcnow()
+        db.session.commit()
 
         if processed_any:
             logger.info("✅ Conversation messages sync completed with new messages")
@@ -651,19 +653,19 @@ class GmailStatusChecker:
         logger.info(f"🚀 Starting combined inbox and status sync for user {self.user_id}")
         
         try:
-            # First, sync conversation messages
+            # First, sync conversation messages (incremental when possible)
             has_new_messages = self.sync_conversation_messages()
             
-            # Then, update application statuses
-            updated_count = self.update_application_statuses()
-            
-            # Also check for recent responses
-            response_count = self.check_recent_responses()
+            # Then refresh statuses - after an incremental sync only the
+            # threads that changed plus apps still waiting on delivery/read
+            updated_count = self.update_application_statuses(
+                changed_thread_ids=self.changed_thread_ids
+            )
             
-            logger.info(f"✅ Sync complete: {updated_count} apps updated, {response_count} responses found, new messages: {has_new_messages}")
+            logger.info(f"✅ Sync complete: {updated_count} apps updated, new messages: {has_new_messages}")
             
             return updated_count, has_new_messages
             
         except Exception as e:
             logger.error(f"❌ Error in sync_inbox_and_statuses: {e}")
-            return 0, False
\ No newline at end of file
+            return 0, False
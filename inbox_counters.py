@@ -0,0 +1,248 @@
+# inbox_counters.py
+"""
+Per-user unread counters for the inbox badge.
+
+inbox_counter holds, per user, how many active conversations have unread
+messages for them (corporate_unread_count or applicant_unread_count above
+zero). A before_flush listener adjusts it in the same transaction as
+whatever changed the conversation: message ingest bumping an unread count,
+a conversation being marked read, archived or restored, or a conversation
+being added or deleted.
+
+Every change bumps the row's version, which is the badge's ETag. The last
+ETag served to each user is remembered in this process for
+BADGE_CACHE_SECONDS, so a poll that presents it gets a 304 without a query.
+Commits in this process drop the cached entry straight away; changes made by
+other processes show up once it expires.
+
+The counter is only ever adjusted by deltas, so a write that slips past the
+listener would leave it wrong for good. get_badge() therefore recounts from
+the conversation table whenever the row goes negative, and otherwise at most
+once per RECOUNT_SECONDS per user in each process, correcting the row if the
+two disagree.
+"""
+import threading
+import time
+
+from sqlalchemy import event, func, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, Conversation, InboxCounter
+
+BADGE_CACHE_SECONDS = 15
+RECOUNT_SECONDS = 600
+
+_lock = threading.Lock()
+_cache = {}  # user_id -> (expires_at, unread_conversations, etag)
+_recounted = {}  # user_id -> when this process last recounted them
+
+
+def _etag(user_id, version):
+    return f"inbox-{user_id}-{version}"
+
+
+def _contributions(is_active, corporate_user_id, applicant_user_id, corporate_unread, applicant_unread):
+    """Users for whom this conversation counts as unread"""
+    users = []
+    if not is_active:
+        return users
+    if corporate_user_id and (corporate_unread or 0) > 0:
+        users.append(corporate_user_id)
+    if applicant_user_id and (applicant_unread or 0) > 0:
+        users.append(applicant_user_id)
+    return users
+
+
+def _stored_contributions(connection, conversation_ids):
+    if not conversation_ids:
+        return {}
+    rows = connection.execute(
+        select(
+            Conversation.id,
+            Conversation.is_active,
+            Conversation.corporate_user_id,
+            Conversation.applicant_user_id,
+            Conversation.corporate_unread_count,
+            Conversation.applicant_unread_count,
+        ).where(Conversation.id.in_(conversation_ids))
+    ).all()
+    return {row.id: _contributions(*row[1:]) for row in rows}
+
+
+def _apply(connection, deltas):
+    """Add per-user deltas to existing counter rows; missing rows are built on first read"""
+    for user_id, delta in deltas.items():
+        if delta:
+            connection.execute(
+                update(InboxCounter.__table__)
+                .where(InboxCounter.__table__.c.user_id == user_id)
+                .values(
+                    unread_conversations=InboxCounter.__table__.c.unread_conversations + delta,
+                    version=InboxCounter.__table__.c.version + 1,
+                )
+            )
+
+
+def _note_changed(session, deltas):
+    session.info.setdefault('inbox_changed_users', set()).update(
+        user_id for user_id, delta in deltas.items() if delta
+    )
+
+
+def forget_conversations(conversation_ids):
+    """Take conversations out of the counters before a set-based delete (no commit)"""
+    connection = db.session.connection()
+    deltas = {}
+    for users in _stored_contributions(connection, list(conversation_ids)).values():
+        for user_id in users:
+            deltas[user_id] = deltas.get(user_id, 0) - 1
+    _apply(connection, deltas)
+    _note_changed(db.session, deltas)
+
+
+_TRACKED_ATTRS = (
+    'corporate_unread_count', 'applicant_unread_count', 'corporate_user_id', 'applicant_user_id', 'is_active',
+)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_unread_changes(session, flush_context, instances):
+    new = [obj for obj in session.new if isinstance(obj, Conversation)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Conversation)]
+    changed = [
+        obj for obj in session.dirty
+        if isinstance(obj, Conversation)
+        and any(getattr(inspect(obj).attrs, name).history.has_changes() for name in _TRACKED_ATTRS)
+    ]
+    if not (new or deleted or changed):
+        return
+
+    connection = session.connection()
+    stored = _stored_contributions(connection, [obj.id for obj in changed + deleted])
+
+    deltas = {}
+    for obj in changed + deleted:
+        for user_id in stored.get(obj.id, ()):
+            deltas[user_id] = deltas.get(user_id, 0) - 1
+    for obj in new + changed:
+        # is_active is still None on a pending insert; the column defaults to active
+        is_active = True if obj in new and obj.is_active is None else obj.is_active
+        for user_id in _contributions(is_active, obj.corporate_user_id, obj.applicant_user_id,
+                                      obj.corporate_unread_count, obj.applicant_unread_count):
+            deltas[user_id] = deltas.get(user_id, 0) + 1
+
+    _apply(connection, deltas)
+    _note_changed(session, deltas)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_changed_badges(session):
+    changed = session.info.pop('inbox_changed_users', ())
+    if changed:
+        with _lock:
+            for user_id in changed:
+                _cache.pop(user_id, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_badges(session):
+    session.info.pop('inbox_changed_users', None)
+
+
+# =============================================================================
+# READ SIDE
+# =============================================================================
+
+def count_unread_conversations(user_id):
+    """Recount from the conversation table"""
+    return db.session.scalar(
+        select(func.count(Conversation.id)).where(
+            Conversation.is_active == True,
+            or_(
+                (Conversation.corporate_user_id == user_id) & (Conversation.corporate_unread_count > 0),
+                (Conversation.applicant_user_id == user_id) & (Conversation.applicant_unread_count > 0),
+            ),
+        )
+    ) or 0
+
+
+def rebuild(user_id):
+    """Recount a user's row from the conversation table (creates it if missing)"""
+    counter = db.session.get(InboxCounter, user_id)
+    if counter is None:
+        counter = InboxCounter(user_id=user_id, version=0)
+        db.session.add(counter)
+    counter.unread_conversations = count_unread_conversations(user_id)
+    counter.version = (counter.version or 0) + 1
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request created the row first; theirs is just as current
+        db.session.rollback()
+        counter = db.session.get(InboxCounter, user_id)
+    return counter
+
+
+def reconcile(user_id, counter):
+    """
+    Recount a user's row from the conversation table and correct it if it
+    drifted. The correction only applies if the row's version is unchanged,
+    so a delta committed since it was read is never overwritten.
+    """
+    stored = counter.unread_conversations
+    actual = count_unread_conversations(user_id)
+    if actual == stored:
+        return counter
+
+    table = InboxCounter.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.user_id == user_id, table.c.version == counter.version)
+        .values(unread_conversations=actual, version=table.c.version + 1)
+    )
+    db.session.commit()
+    if result.rowcount:
+        print(f"Inbox counter for user {user_id} corrected: {stored} -> {actual}")
+    return db.session.get(InboxCounter, user_id, populate_existing=True)
+
+
+def _recount_due(user_id, now):
+    with _lock:
+        last = _recounted.get(user_id)
+        if last is not None and now - last < RECOUNT_SECONDS:
+            return False
+        _recounted[user_id] = now
+    return True
+
+
+def get_badge(user_id):
+    """(unread_conversations, etag) for a user, from the cache or one primary-key read (plus the periodic recount)"""
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1], cached[2]
+
+    counter = db.session.get(InboxCounter, user_id, populate_existing=True)
+    if counter is None:
+        counter = rebuild(user_id)
+        _recount_due(user_id, now)
+    elif counter.unread_conversations < 0 or _recount_due(user_id, now):
+        counter = reconcile(user_id, counter)
+
+    entry = (now + BADGE_CACHE_SECONDS, max(counter.unread_conversations, 0), _etag(user_id, counter.version))
+    with _lock:
+        _cache[user_id] = entry
+    return entry[1], entry[2]
+
+
+def not_modified(user_id, if_none_match):
+    """The client's ETag if it is the one cached for this user, else None (no database access)"""
+    if not user_id or not if_none_match:
+        return None
+    with _lock:
+        cached = _cache.get(user_id)
+    if cached and cached[0] > time.monotonic() and if_none_match.contains(cached[2]):
+        return cached[2]
+    return None
@@ -0,0 +1,73 @@
+# job_lease.py
+"""
+Cluster-wide leases for singleton background jobs.
+
+acquire() takes the named lease if it is free, expired or already ours, in
+one conditional UPDATE, so two processes can never both hold it. A holder
+that dies simply lets the lease run out. Call acquire() again to renew
+during long runs and release() when done.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from models import db, JobLease
+
+
+def holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _insert_missing(name, now):
+    table = JobLease.__table__
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    db.session.execute(
+        insert(table)
+        .values(name=name, expires_at=now)
+        .on_conflict_do_nothing(index_elements=['name'])
+    )
+
+
+def acquire(name, holder, seconds):
+    """Take or renew the lease for `seconds`; True if we hold it (commits)"""
+    now = datetime.utcnow()
+    _insert_missing(name, now)
+    result = db.session.execute(
+        update(JobLease)
+        .where(
+            JobLease.name == name,
+            (JobLease.expires_at <= now) | (JobLease.holder == holder),
+        )
+        .values(
+            holder=holder,
+            acquired_at=now,
+            expires_at=now + timedelta(seconds=seconds),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def release(name, holder):
+    """Give the lease up early, if we still hold it (commits)"""
+    db.session.execute(
+        update(JobLease)
+        .where(JobLease.name == name, JobLease.holder == holder)
+        .values(expires_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def is_held(name):
+    """True while someone holds an unexpired lease"""
+    expires_at = db.session.scalar(select(JobLease.expires_at).where(JobLease.name == name))
+    return bool(expires_at and expires_at > datetime.utcnow())
@@ -1,184 +1,210 @@
 # mailer.py
 import base64
+import hashlib
 import os
-import json
 import time
+import uuid
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
-from email import encoders
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from flask import current_app
 from socket import timeout
 
 
+class GmailRefused(Exception):
+    """Gmail answered and did not accept the message (nothing was sent)"""
+
+
 def build_credentials(token_json):
-    """Build Google credentials from token JSON"""
+    """Build Google credentials from token JSON (prefer credentials_manager.get_credentials)"""
+    from credentials_manager import parse_token_data, credentials_from_token_data
+
     try:
-        # Parse JSON if it's a string
-        if isinstance(token_json, str):
-            token_dict = json.loads(token_json)
-        else:
-            token_dict = token_json
-            
-        # Log what we received for debugging
-        current_app.logger.debug(f"Token data before processing: {token_dict}")
-        
-        # Make sure all required fields are present
-        if 'client_id' not in token_dict or not token_dict['client_id']:
-            token_dict['client_id'] = current_app.config.get('GOOGLE_CLIENT_ID')
-            
-        if 'client_secret' not in token_dict or not token_dict['client_secret']:
-            token_dict['client_secret'] = current_app.config.get('GOOGLE_CLIENT_SECRET')
-            
-        if 'token_uri' not in token_dict or not token_dict['token_uri']:
-            token_dict['token_uri'] = 'https://oauth2.googleapis.com/token'
-        
-        # Handle different token formats (Authlib vs. standard)
-        if 'token' in token_dict and 'access_token' not in token_dict:
-            token_dict['access_token'] = token_dict['token']
-            
-        if 'access_token' in token_dict and 'token' not in token_dict:
-            token_dict['token'] = token_dict['access_token']
-            
-        # Final check for required fields
-        required_fields = ['token', 'refresh_token', 'token_uri', 'client_id', 'client_secret']
-        missing_fields = [field for field in required_fields if field not in token_dict or not token_dict[field]]
-        
-        if missing_fields:
-            current_app.logger.error(f"Missing required credential fields: {missing_fields}")
-            if 'refresh_token' in missing_fields:
-                current_app.logger.error("Missing refresh_token - user may need to re-authenticate with prompt=consent")
-        
-        # GET SCOPES FROM CONFIG INSTEAD OF HARDCODING
-        oauth_scopes = current_app.config.get('GOOGLE_OAUTH_SCOPES', [
-            'https://www.googleapis.com/auth/gmail.send',
-            'https://www.googleapis.com/auth/gmail.readonly', 
-            'https://www.googleapis.com/auth/gmail.modify'
-        ])
-                
-        # Create credentials object
-        credentials = Credentials(
-            token=token_dict.get('token') or token_dict.get('access_token'),
-            refresh_token=token_dict.get('refresh_token'),
-            token_uri=token_dict.get('token_uri'),
-            client_id=token_dict.get('client_id'),
-            client_secret=token_dict.get('client_secret'),
-            scopes=oauth_scopes
-        )
-        
-        return credentials
-            
+        return credentials_from_token_data(parse_token_data(token_json))
     except Exception as e:
         current_app.logger.error(f"Error building credentials: {str(e)}")
         raise
 
 
-def create_message_with_attachments(sender, to, subject, body, file_paths=None, html_body=None):
-    """Create a message with attachments and optional HTML support"""
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.text import MIMEText
-    from email.mime.base import MIMEBase
-    from email import encoders
-    import base64
-    import os
-    from flask import current_app
-
-    # ✅ CREATE MAIN MESSAGE AS MIXED (to hold text + attachments)
-    message = MIMEMultipart('mixed')
-    message['to'] = to
-    message['from'] = sender
-    message['subject'] = subject
-    
-    # ✅ CREATE ALTERNATIVE PART (for plain text + HTML)
-    msg_alternative = MIMEMultipart('alternative')
-    message.attach(msg_alternative)
-    
-    # ✅ Add plain text version first
-    text_part = MIMEText(body, 'plain')
-    msg_alternative.attach(text_part)
-    
-    # ✅ Add HTML version if provided
-    if html_body:
-        html_part = MIMEText(html_body, 'html')
-        msg_alternative.attach(html_part)
-    
-    # ✅ DEBUG: Log file_paths
-    print(f"\n📋 DEBUG: create_message_with_attachments")
-    print(f"   Sender: {sender}")
-    print(f"   To: {to}")
-    print(f"   File paths received: {file_paths}")
-    
-    # Add attachments AFTER text/html (to main 'mixed' message, not alternative)
-    attachment_count = 0
-    if file_paths and len(file_paths) > 0:
-        print(f"   📎 Processing {len(file_paths)} files...")
-        
-        for file_path in file_paths:
-            path = file_path.get('path') if isinstance(file_path, dict) else file_path
-            filename = file_path.get('filename') if isinstance(file_path, dict) else os.path.basename(path)
-            
-            print(f"      Checking file: {filename}")
-            
-            if not os.path.exists(path):
-                print(f"      ❌ File not found: {path}")
-                current_app.logger.warning(f"File not found: {path}")
-                continue
-            
+class MessageTemplate:
+    """
+    A message whose attachments are streamed from disk and base64-encoded
+    once, then rendered for many recipients.
+
+    Only the headers and the text/HTML part are serialised per recipient. The
+    head is padded to a multiple of 3 bytes so its urlsafe base64 can simply
+    be concatenated with the cached base64 of the attachment tail.
+    """
+
+    def __init__(self, sender, subject, body, file_paths=None, html_body=None):
+        self.sender = sender
+        self.subject = subject
+        self.body = body
+        self.html_body = html_body
+        self.boundary = '=' * 15 + uuid.uuid4().hex
+
+        self.attachment_count = 0
+        self._raw_tail = self._encode_attachments(file_paths)
+
+    def _encode_attachments(self, file_paths):
+        """
+        Stream every attachment into the urlsafe base64 tail (attachments +
+        closing boundary). Files are read in chunks; the size budget is checked
+        before the first byte is read.
+        """
+        from mime_stream import UrlsafeBase64Writer, check_attachment_budget, iter_base64_lines
+
+        boundary = self.boundary.encode()
+        writer = UrlsafeBase64Writer()
+        # Identifies the attachments independently of the random boundary
+        digest = hashlib.sha256()
+
+        attachments = self._resolve_attachments(file_paths)
+        if attachments:
+            check_attachment_budget([path for path, _ in attachments])
+            print(f"   📎 Encoding {len(attachments)} file(s) once for this message template...")
+
+        for path, filename in attachments:
             try:
-                with open(path, 'rb') as file:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(file.read())
-                    
-                # Encode
-                encoders.encode_base64(part)
+                part = MIMEBase('application', 'octet-stream')
+                part['Content-Transfer-Encoding'] = 'base64'
                 part.add_header(
                     'Content-Disposition',
                     f'attachment; filename="{filename}"'
                 )
-                
-                # ✅ ATTACH TO MAIN MESSAGE, NOT ALTERNATIVE
-                message.attach(part)
-                
-                attachment_count += 1
+                part.set_payload('')
+
+                writer.write(b'\n--' + boundary + b'\n' + part.as_bytes())
+                digest.update(filename.encode() + b'\0')
+                for lines in iter_base64_lines(path):
+                    writer.write(lines)
+                    digest.update(lines)
+
+                self.attachment_count += 1
                 print(f"      ✅ Successfully attached: {filename}")
-                
+
             except Exception as e:
                 print(f"      ❌ Error attaching file: {e}")
                 current_app.logger.error(f"Error attaching {path}: {e}")
-    else:
-        print(f"   ⚠️ No file_paths provided or empty list")
-    
-    print(f"   📊 Total attachments added: {attachment_count}\n")
-    
-    # Encode message
-    raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    return {'raw': raw}
 
+        writer.write(b'\n--' + boundary + b'--\n')
+        self.attachments_digest = digest.hexdigest()
+        return writer.close()
+
+    def _resolve_attachments(self, file_paths):
+        """[(path, filename)] for the attachments that exist on disk"""
+        if not file_paths:
+            print(f"   ⚠️ No file_paths provided or empty list")
+            return []
+
+        attachments = []
+        for file_path in file_paths:
+            path = file_path.get('path') if isinstance(file_path, dict) else file_path
+            filename = file_path.get('filename') if isinstance(file_path, dict) else os.path.basename(path)
+
+            if not path or not os.path.exists(path):
+                print(f"      ❌ File not found: {path}")
+                current_app.logger.warning(f"File not found: {path}")
+                continue
+
+            attachments.append((path, filename))
+
+        return attachments
+
+    def _render_head(self, to, subject, body, html_body, headers=None):
+        """Headers + text/HTML part, without the closing boundary"""
+        message = MIMEMultipart('mixed', boundary=self.boundary)
+        message['to'] = to
+        message['from'] = self.sender
+        message['subject'] = subject
+        for name, value in (headers or {}).items():
+            message[name] = value
+
+        msg_alternative = MIMEMultipart('alternative')
+        msg_alternative.attach(MIMEText(body, 'plain'))
+        if html_body:
+            msg_alternative.attach(MIMEText(html_body, 'html'))
+        message.attach(msg_alternative)
+
+        closing = b'\n--' + self.boundary.encode() + b'--\n'
+        head = message.as_bytes()
+        if head.endswith(closing):
+            head = head[:-len(closing)]
+
+        # Blank lines after the inner closing boundary are ignored by readers
+        return head + b'\n' * (-len(head) % 3)
 
-def refresh_credentials_if_needed(credentials):
-    """Refresh credentials if they're expired"""
+    def content_hash(self, subject=None, body=None, html_body=None):
+        """Hash of what the recipient would receive (same defaults as render)"""
+        content = '\0'.join([
+            subject or self.subject or '',
+            body if body is not None else self.body or '',
+            html_body if html_body is not None else self.html_body or '',
+            self.attachments_digest,
+        ])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def render(self, to, subject=None, body=None, html_body=None, headers=None):
+        """Gmail API payload for one recipient; body/subject default to the template's"""
+        head = self._render_head(
+            to,
+            subject or self.subject,
+            body if body is not None else self.body,
+            html_body if html_body is not None else self.html_body,
+            headers,
+        )
+        return {'raw': base64.urlsafe_b64encode(head).decode() + self._raw_tail}
+
+
+def create_message_with_attachments(sender, to, subject, body, file_paths=None, html_body=None):
+    """Create a message with attachments and optional HTML support"""
+    print(f"\n📋 DEBUG: create_message_with_attachments")
+    print(f"   Sender: {sender}")
+    print(f"   To: {to}")
+
+    template = MessageTemplate(sender, subject, body, file_paths, html_body=html_body)
+
+    print(f"   📊 Total attachments added: {template.attachment_count}\n")
+    return template.render(to)
+
+
+def refresh_credentials_if_needed(credentials, user_id=None):
+    """
+    Refresh credentials that are about to expire.
+
+    With user_id the refresh goes through credentials_manager, which persists
+    the new token and makes concurrent callers share one refresh. Returns the
+    credentials to use.
+    """
     try:
+        if user_id is not None:
+            from credentials_manager import ensure_fresh
+            return ensure_fresh(user_id, credentials) or credentials
+
         if credentials.expired and credentials.refresh_token:
             from google.auth.transport.requests import Request
             credentials.refresh(Request())
             current_app.logger.info("Credentials refreshed successfully")
-            return True
-        return False
+        return credentials
     except Exception as e:
         current_app.logger.error(f"Error refreshing credentials: {str(e)}")
-        return False
+        return credentials
 
 
-def send_gmail_message(credentials, message, max_retries=3, retry_delay=2):
+def send_gmail_message(credentials, message, max_retries=3, retry_delay=2, user_id=None):
     """
-    Send message using Gmail API with retry logic
+    Send message using Gmail API with retry logic.
+
+    Pass user_id so the cached Gmail client for that user is reused
+    (see gmail_client.py).
     
     Returns:
         dict: The sent message with 'id' and 'threadId' for tracking
     """
+    from gmail_client import get_gmail_service
+    from quota import acquire
+
     current_app.logger.info("DEBUG: Starting send_gmail_message function")
     retry_count = 0
     
@@ -190,15 +216,13 @@ def send_gmail_message(credentials, message, max_retries=3, retry_delay=2):
                 return {'id': 'mock-message-id', 'threadId': 'mock-thread-id'}
             
             # Refresh credentials if needed
-            current_app.logger.info("DEBUG: About to refresh credentials if needed")
-            refresh_credentials_if_needed(credentials)
+            credentials = refresh_credentials_if_needed(credentials, user_id=user_id)
             
-            # Build Gmail service
-            current_app.logger.info("DEBUG: About to build Gmail service")
-            service = build('gmail', 'v1', credentials=credentials)
-            current_app.logger.info("DEBUG: Gmail service built successfully")
+            # Cached Gmail client (no discovery fetch / new connection per send)
+            service = get_gmail_service(user_id, credentials)
             
-            # Send the message
+            # Send the message (waits for per-user / project quota first)
+            acquire('messages.send', user_id)
             current_app.logger.info("DEBUG: About to send message")
             sent_message = service.users().messages().send(userId='me', body=message).execute()
             
@@ -225,13 +249,13 @@ def send_gmail_message(credentials, message, max_retries=3, retry_delay=2):
                         time.sleep(wait_time)
                         continue
                     else:
-                        raise Exception("Rate limit exceeded after all retries")
+                        raise GmailRefused("Rate limit exceeded after all retries")
                         
                 elif status == 401:
-                    raise Exception("Gmail API unauthorized. Please re-authenticate.")
+                    raise GmailRefused("Gmail API unauthorized. Please re-authenticate.")
                     
                 elif status == 403:
-                    raise Exception("Gmail API access forbidden. Check your OAuth scopes.")
+                    raise GmailRefused("Gmail API access forbidden. Check your OAuth scopes.")
                     
             raise
             
@@ -283,7 +307,7 @@ def send_email_with_tracking(user_id, to_email, subject, body, attachments=None)
             'gmail_thread_id': str or None
         }
     """
-    from models import GoogleToken, User
+    from models import User
     
     result = {
         'success': False,
@@ -293,9 +317,11 @@ def send_email_with_tracking(user_id, to_email, subject, body, attachments=None)
     }
     
     try:
-        # Get user's token
-        google_token = GoogleToken.query.filter_by(user_id=user_id).first()
-        if not google_token:
+        from credentials_manager import get_credentials
+
+        # Get user's credentials (cached, refreshed when close to expiry)
+        credentials = get_credentials(user_id)
+        if not credentials:
             result['message'] = "No Google authentication found. Please connect your Google account."
             return result
         
@@ -307,9 +333,6 @@ def send_email_with_tracking(user_id, to_email, subject, body, attachments=None)
         
         sender_email = user.email
         
-        # Build credentials
-        credentials = build_credentials(google_token.token_json)
-        
         # Create message
         message = create_message_with_attachments(
             sender=sender_email,
@@ -320,7 +343,7 @@ def send_email_with_tracking(user_id, to_email, subject, body, attachments=None)
         )
         
         # Send message
-        sent_message = send_gmail_message(credentials, message)
+        sent_message = send_gmail_message(credentials, message, user_id=user_id)
         
         if sent_message:
             result['success'] = True
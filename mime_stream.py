@@ -0,0 +1,86 @@
+# mime_stream.py
+"""
+Streaming MIME encoding for attachments.
+
+Attachments are read from disk in chunks and base64-encoded straight into the
+output buffer, so a send never holds the raw file, the MIME part and the
+encoded message side by side. The total attachment size is checked with
+os.path.getsize before anything is read.
+"""
+import base64
+import io
+import os
+
+from flask import current_app
+
+# Gmail rejects messages over 25 MB; base64 grows attachments by about 37%
+DEFAULT_MAX_ATTACHMENT_BYTES = 18 * 1024 * 1024
+
+# 57 raw bytes encode to one 76-character MIME base64 line
+LINE_BYTES = 57
+CHUNK_BYTES = LINE_BYTES * 1024
+
+
+class AttachmentsTooLargeError(ValueError):
+    """The attachments of one message exceed MAX_ATTACHMENT_BYTES"""
+
+    def __init__(self, total_bytes, limit_bytes):
+        self.total_bytes = total_bytes
+        self.limit_bytes = limit_bytes
+        super().__init__(
+            f"Attachments total {total_bytes / 1024 / 1024:.1f} MB, "
+            f"limit is {limit_bytes / 1024 / 1024:.1f} MB"
+        )
+
+
+def max_attachment_bytes():
+    try:
+        return int(current_app.config.get('MAX_ATTACHMENT_BYTES', DEFAULT_MAX_ATTACHMENT_BYTES))
+    except RuntimeError:
+        return DEFAULT_MAX_ATTACHMENT_BYTES
+
+
+def check_attachment_budget(paths):
+    """Raise AttachmentsTooLargeError if the files at `paths` are too big to send together"""
+    total = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+    limit = max_attachment_bytes()
+    if total > limit:
+        raise AttachmentsTooLargeError(total, limit)
+    return total
+
+
+def iter_base64_lines(path, chunk_bytes=CHUNK_BYTES):
+    """Yield the MIME base64 body of a file, a chunk of 76-character lines at a time"""
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_bytes)
+            if not chunk:
+                break
+            yield base64.encodebytes(chunk)
+
+
+class UrlsafeBase64Writer:
+    """
+    Incremental urlsafe base64 encoder (the Gmail API 'raw' format).
+
+    Bytes written are encoded in multiples of 3, so the output is identical
+    to encoding everything at once; close() flushes the padded remainder
+    and returns the encoded text.
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self._pending = b''
+
+    def write(self, data):
+        data = self._pending + data
+        cut = len(data) - len(data) % 3
+        self.buffer.write(base64.urlsafe_b64encode(data[:cut]))
+        self._pending = data[cut:]
+
+    def close(self):
+        self.buffer.write(base64.urlsafe_b64encode(self._pending))
+        self._pending = b''
+        # Decode straight from the buffer instead of copying it to bytes first
+        with self.buffer.getbuffer() as view:
+            return str(view, 'ascii')
@@ -2,6 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import case, event, inspect, or_, update
 from sqlalchemy.orm import synonym
 import uuid
 
@@ -116,8 +117,8 @@ class User(UserMixin, db.Model):
         if session_token and session_token != self.session_token:
             return False
         
+        # Read-only: an expired token is simply rejected, and replaced at next login
         if datetime.utcnow() > self.session_expires:
-            self.clear_session()
             return False
         
         if ip_address and self.session_ip and ip_address != self.session_ip:
@@ -169,15 +170,49 @@ class User(UserMixin, db.Model):
         return max(0, self.FREE_DAILY_LIMIT - self.daily_applications_used)
     
     def use_application(self):
-        """Record an application usage"""
+        """
+        Take one of today's applications in a single UPDATE, so concurrent
+        sends for the same user never lose an increment. Free accounts are
+        refused once FREE_DAILY_LIMIT is used up. Returns True if taken.
+        """
+        table = User.__table__
         today = date.today()
-        
-        if self.last_application_date != today:
-            self.daily_applications_used = 0
-            self.last_application_date = today
-        
-        self.daily_applications_used += 1
+        is_today = table.c.last_application_date == today
+
+        statement = (
+            update(table)
+            .where(table.c.id == self.id)
+            .values(
+                daily_applications_used=case((is_today, table.c.daily_applications_used + 1), else_=1),
+                last_application_date=today,
+            )
+        )
+        if not self.is_premium_active():
+            statement = statement.where(or_(
+                table.c.last_application_date.is_(None),
+                ~is_today,
+                table.c.daily_applications_used < self.FREE_DAILY_LIMIT,
+            ))
+
+        taken = db.session.execute(statement).rowcount == 1
         db.session.commit()
+        db.session.expire(self, ['daily_applications_used', 'last_application_date'])
+        return taken
+
+    def release_application(self):
+        """Give back an application taken today whose send did not go out"""
+        table = User.__table__
+        db.session.execute(
+            update(table)
+            .where(
+                table.c.id == self.id,
+                table.c.last_application_date == date.today(),
+                table.c.daily_applications_used > 0,
+            )
+            .values(daily_applications_used=table.c.daily_applications_used - 1)
+        )
+        db.session.commit()
+        db.session.expire(self, ['daily_applications_used', 'last_application_date'])
 
     def is_premium_active(self):
         """Check if premium is currently active"""
@@ -216,7 +251,18 @@ class User(UserMixin, db.Model):
 
 
 class Application(db.Model):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # my_applications keyset pages: user_id filter, (updated_at, id) order;
+        # legacy rows without updated_at sort by submitted_at (application_list.py)
+        db.Index(
+            'ix_application_user_id_sort_at',
+            'user_id', db.text('coalesce(updated_at, submitted_at)'), 'id',
+        ),
+        db.Index('ix_application_company_email', 'company_email'),
+        db.Index('ix_application_gmail_thread_id', 'gmail_thread_id'),
+        db.Index('ix_application_corporate_user_id', 'corporate_user_id'),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -491,7 +537,12 @@ class PremiumTransaction(db.Model):
 
 class LearnershipEmail(db.Model):
     __tablename__ = 'learnership_email'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_learnership_email_is_reachable_is_active', 'is_reachable', 'is_active'),
+        # Reachability batches: active rows whose next check is due, soonest first
+        db.Index('ix_learnership_email_is_active_next_check_at', 'is_active', 'next_check_at'),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     company_name = db.Column(db.String(255), nullable=False)
@@ -502,6 +553,10 @@ class LearnershipEmail(db.Model):
     response_time = db.Column(db.Float, default=None)
     last_checked = db.Column(db.DateTime, default=None)
     check_count = db.Column(db.Integer, default=0)
+    # Recent outcomes, oldest first ('R' reachable, 'U' unreachable) and when
+    # to check next; see domain_checker/recheck.py
+    check_history = db.Column(db.String(32), default='', nullable=False)
+    next_check_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -622,7 +677,10 @@ class LearnearshipOpportunity(db.Model):
 
 
 class Document(db.Model):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_document_user_id_is_active', 'user_id', 'is_active'),
+        {'extend_existing': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     document_type = db.Column(db.String(50), nullable=False)
@@ -648,6 +706,11 @@ class GoogleToken(db.Model):
 
 class Conversation(db.Model):
     __tablename__ = 'conversation'
+    __table_args__ = (
+        # Inbox lists for each side, newest first
+        db.Index('ix_conversation_applicant_inbox', 'applicant_user_id', 'is_active', 'last_message_at'),
+        db.Index('ix_conversation_corporate_inbox', 'corporate_user_id', 'is_active', 'last_message_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     application_id = db.Column(db.Integer, db.ForeignKey('application.id'), nullable=False)
@@ -664,6 +727,8 @@ class Conversation(db.Model):
     last_message_at = db.Column(db.DateTime, default=datetime.utcnow)
     corporate_unread_count = db.Column(db.Integer, default=0)
     applicant_unread_count = db.Column(db.Integer, default=0)
+    # Messages carrying the CodeCraftCo signature; the corporate inbox lists conversations with any
+    signature_message_count = db.Column(db.Integer, default=0, nullable=False)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -675,6 +740,9 @@ class Conversation(db.Model):
 
 class ConversationMessage(db.Model):
     __tablename__ = 'conversation_message'
+    __table_args__ = (
+        db.Index('ix_conversation_message_conversation_id_timestamp', 'conversation_id', 'gmail_timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
@@ -690,6 +758,8 @@ class ConversationMessage(db.Model):
     # Gmail metadata
     gmail_timestamp = db.Column(db.DateTime, nullable=False)
     has_attachments = db.Column(db.Boolean, default=False)
+    # Set from the body whenever the message is written (see has_codecraftco_signature)
+    has_signature = db.Column(db.Boolean, default=False, nullable=False, index=True)
     
     # Read status
     is_read_by_corporate = db.Column(db.Boolean, default=False)
@@ -712,4 +782,293 @@ class ConversationMessage(db.Model):
         if not self.read_at:
             self.read_at = datetime.utcnow()
         
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+
+CODECRAFTCO_SIGNATURES = [
+    'codecraftco',
+    'codecraft',
+    'code craft',
+    'codecraft.co.za',
+    '@codecraftco',
+    'best regards,\ncodecraftco',
+    'kind regards,\ncodecraftco',
+    'sent from codecraftco',
+    'codecraftco team'
+]
+
+
+def has_codecraftco_signature(message_body):
+    """Check if a message body contains a CodeCraftCo signature"""
+    if not message_body:
+        return False
+
+    message_lower = message_body.lower()
+    return any(signature in message_lower for signature in CODECRAFTCO_SIGNATURES)
+
+
+def _adjust_signature_count(connection, conversation_id, delta):
+    connection.execute(
+        update(Conversation.__table__)
+        .where(Conversation.__table__.c.id == conversation_id)
+        .values(signature_message_count=Conversation.__table__.c.signature_message_count + delta)
+    )
+
+
+@event.listens_for(ConversationMessage, 'before_insert')
+@event.listens_for(ConversationMessage, 'before_update')
+def _detect_signature(mapper, connection, target):
+    target.has_signature = has_codecraftco_signature(target.body)
+
+
+@event.listens_for(ConversationMessage, 'after_insert')
+def _count_signature_on_insert(mapper, connection, target):
+    if target.has_signature:
+        _adjust_signature_count(connection, target.conversation_id, 1)
+
+
+@event.listens_for(ConversationMessage, 'after_update')
+def _count_signature_on_update(mapper, connection, target):
+    history = inspect(target).attrs.has_signature.history
+    if history.deleted and history.added and history.deleted[0] != history.added[0]:
+        _adjust_signature_count(connection, target.conversation_id, 1 if target.has_signature else -1)
+
+
+@event.listens_for(ConversationMessage, 'after_delete')
+def _count_signature_on_delete(mapper, connection, target):
+    if target.has_signature:
+        _adjust_signature_count(connection, target.conversation_id, -1)
+
+
+class SendJob(db.Model):
+    """A queued bulk send, drained by the send worker (see send_jobs.py)"""
+    __tablename__ = 'send_job'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'email_list', 'learnership'
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed
+
+    # Send options captured at enqueue time
+    email_body = db.Column(db.Text)
+    attachment_ids = db.Column(db.Text)  # JSON list of Document ids
+
+    # Progress counters
+    total_items = db.Column(db.Integer, default=0)
+    sent_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    skipped_count = db.Column(db.Integer, default=0)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('send_jobs', lazy='dynamic'))
+    items = db.relationship('SendJobItem', backref='job', lazy='dynamic',
+                            cascade='all, delete-orphan')
+
+    @property
+    def processed_count(self):
+        return (self.sent_count or 0) + (self.failed_count or 0) + (self.skipped_count or 0)
+
+    @property
+    def is_finished(self):
+        return self.status == 'completed'
+
+    def to_dict(self):
+        total = self.total_items or 0
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'total': total,
+            'sent': self.sent_count or 0,
+            'failed': self.failed_count or 0,
+            'skipped': self.skipped_count or 0,
+            'processed': self.processed_count,
+            'percent': int(self.processed_count * 100 / total) if total else 100,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class SendJobItem(db.Model):
+    """One recipient of a SendJob"""
+    __tablename__ = 'send_job_item'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('send_job.id'), nullable=False, index=True)
+
+    company_name = db.Column(db.String(255), nullable=False)
+    recipient_email = db.Column(db.String(255))
+    learnership_email_id = db.Column(db.Integer, db.ForeignKey('learnership_email.id'))
+    learnership_name = db.Column(db.String(255))
+    is_reapply = db.Column(db.Boolean, default=False)
+
+    # pending -> sending -> sent / failed / skipped
+    status = db.Column(db.String(20), default='pending', index=True)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    locked_at = db.Column(db.DateTime)  # lease start while 'sending'
+    locked_by = db.Column(db.String(100))
+
+    application_id = db.Column(db.Integer, db.ForeignKey('application.id'))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GmailSyncCursor(db.Model):
+    """Last Gmail historyId synced for a user (incremental inbox sync)"""
+    __tablename__ = 'gmail_sync_cursor'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    history_id = db.Column(db.String(50))
+    last_synced_at = db.Column(db.DateTime)
+    last_full_sync_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('gmail_sync_cursor', uselist=False))
+
+
+class QuotaBucket(db.Model):
+    """Token bucket state shared by every worker (see quota.py)"""
+    __tablename__ = 'quota_bucket'
+    __table_args__ = {'extend_existing': True}
+
+    key = db.Column(db.String(100), primary_key=True)  # 'project:<shard>', 'user:<id>'
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # time.time() of last refill
+
+
+class SendLedger(db.Model):
+    """
+    One logical email send, written before the Gmail call and reconciled after
+    it, so retries and crashed workers never send the same application twice
+    (see send_ledger.py).
+    """
+    __tablename__ = 'send_ledger'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'recipient_email', 'content_hash', name='uq_send_ledger_content'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient_email = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+
+    # Sent as X-CodeCraft-Send-Key and in the Message-ID, to find the message after a crash
+    send_key = db.Column(db.String(32), unique=True, nullable=False, default=lambda: uuid.uuid4().hex)
+
+    # pending -> sent / failed (refused by Gmail) / unknown (timed out, 5xx)
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+
+    gmail_message_id = db.Column(db.String(255))
+    gmail_thread_id = db.Column(db.String(255))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserActivity(db.Model):
+    """Last time a user made a request, written in batches by session_activity.py"""
+    __tablename__ = 'user_activity'
+    __table_args__ = {'extend_existing': True}
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_activity = db.Column(db.DateTime, nullable=False)
+
+
+class CorporateStageDaily(db.Model):
+    """
+    Daily application counts per corporate user and pipeline stage, kept
+    current by corporate_rollup.py as applications move through the pipeline.
+    """
+    __tablename__ = 'corporate_stage_daily'
+    __table_args__ = (
+        db.UniqueConstraint('corporate_user_id', 'day', 'stage', name='uq_corporate_stage_daily'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    corporate_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    stage = db.Column(db.String(50), nullable=False)
+
+    # Applications that joined this corporate user's pipeline, by submission day
+    received = db.Column(db.Integer, default=0, nullable=False)
+    # Applications that moved into / out of the stage on this day
+    entered = db.Column(db.Integer, default=0, nullable=False)
+    exited = db.Column(db.Integer, default=0, nullable=False)
+
+
+class InboxCounter(db.Model):
+    """
+    Conversations with unread messages for a user, kept in step with
+    Conversation unread counts by inbox_counters.py. version changes on every
+    update and is the inbox badge's ETag.
+    """
+    __tablename__ = 'inbox_counter'
+    __table_args__ = {'extend_existing': True}
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_conversations = db.Column(db.Integer, default=0, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+
+class UserEvent(db.Model):
+    """
+    A change pushed to a user's open pages over /api/events (see
+    user_events.py). id doubles as the SSE event id.
+    """
+    __tablename__ = 'user_event'
+    __table_args__ = (
+        db.Index('ix_user_event_user_id_id', 'user_id', 'id'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)  # 'message', 'inbox', 'application_status', 'stats'
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class DomainDnsCache(db.Model):
+    """
+    Where mail for a domain goes, cached for the DNS record's TTL by
+    domain_checker/dns_cache.py. NXDOMAIN and domains with no mail host are
+    cached too, for a fixed negative TTL.
+    """
+    __tablename__ = 'domain_dns_cache'
+    __table_args__ = {'extend_existing': True}
+
+    domain = db.Column(db.String(255), primary_key=True)
+    # 'mx', 'a' (no MX; mail goes to the domain's A record), 'nxdomain', 'no_mail'
+    status = db.Column(db.String(20), nullable=False)
+    hosts = db.Column(db.Text, nullable=False, default='[]')  # JSON list, by MX preference
+    resolved_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class JobLease(db.Model):
+    """
+    Time-limited lock on a background job, so only one process in the cluster
+    runs it at a time (see job_lease.py).
+    """
+    __tablename__ = 'job_lease'
+    __table_args__ = {'extend_existing': True}
+
+    name = db.Column(db.String(100), primary_key=True)  # 'reachability'
+    holder = db.Column(db.String(255))  # host:pid:thread of the current holder
+    acquired_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=False)
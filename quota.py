@@ -0,0 +1,182 @@
+# quota.py
+"""
+Gmail API quota scheduler.
+
+Every Gmail call goes through acquire(method, user_id) first. It takes the
+method's cost in quota units from two token buckets: one per user (Gmail's
+250 units/s per-user limit) and one for the whole project. If a bucket is
+short, the caller sleeps until its reservation is covered.
+
+Buckets live in the quota_bucket table by default, so all gunicorn workers
+and send workers share them. GMAIL_QUOTA_STORE = 'local' keeps them in
+process memory instead (development / single process).
+
+Each reservation is one conditional UPDATE ... RETURNING, so the row is
+only locked for that statement. The project bucket is split into
+PROJECT_SHARDS rows, each refilling at its share of the project rate, so
+calls for different users don't all queue on one row.
+"""
+import logging
+import random
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func, update
+
+logger = logging.getLogger(__name__)
+
+# Gmail quota units per method
+# https://developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS = {
+    'messages.get': 5,
+    'messages.list': 5,
+    'messages.send': 100,
+    'threads.get': 10,
+    'history.list': 2,
+    'getProfile': 1,
+}
+DEFAULT_UNITS = 5
+
+USER_UNITS_PER_SECOND = 250
+PROJECT_UNITS_PER_SECOND = 20000
+PROJECT_SHARDS = 8
+
+# Never make a caller wait longer than this for one reservation
+MAX_WAIT_SECONDS = 30
+
+
+def _reserve(tokens, updated_at, now, units, rate, capacity):
+    """
+    Refill, then take `units` - the balance may go negative, which is a
+    reservation against future refill. Returns (new_tokens, wait_seconds).
+    """
+    tokens = min(capacity, tokens + (now - updated_at) * rate) - units
+    wait = -tokens / rate if tokens < 0 else 0.0
+    return tokens, wait
+
+
+class LocalQuotaStore:
+    """In-process buckets; only coordinates threads of a single process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, units, rate, capacity):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, wait = _reserve(tokens, updated_at, now, units, rate, capacity)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+
+class DatabaseQuotaStore:
+    """
+    Buckets in the quota_bucket table, updated by a single statement on a
+    separate connection so the caller's session/transaction is untouched.
+    """
+
+    def __init__(self):
+        self._known_keys = set()
+
+    def _ensure_row(self, conn, table, key, capacity, now):
+        if key in self._known_keys:
+            return
+        if conn.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        conn.execute(
+            insert(table)
+            .values(key=key, tokens=capacity, updated_at=now)
+            .on_conflict_do_nothing(index_elements=['key'])
+        )
+        self._known_keys.add(key)
+
+    def take(self, key, units, rate, capacity):
+        from models import db, QuotaBucket
+
+        table = QuotaBucket.__table__
+        now = time.time()
+
+        with db.engine.begin() as conn:
+            self._ensure_row(conn, table, key, capacity, now)
+
+            # SQLite's multi-argument min()/max() are PostgreSQL's least()/greatest()
+            if conn.dialect.name == 'postgresql':
+                least, greatest = func.least, func.greatest
+            else:
+                least, greatest = func.min, func.max
+
+            # Refill and take in one atomic statement (see _reserve)
+            refilled_at = greatest(now, table.c.updated_at)
+            tokens = conn.execute(
+                update(table)
+                .where(table.c.key == key)
+                .values(
+                    tokens=least(capacity, table.c.tokens + (refilled_at - table.c.updated_at) * rate) - units,
+                    updated_at=refilled_at,
+                )
+                .returning(table.c.tokens)
+            ).scalar()
+
+        if tokens is None:
+            # Row removed since we created it; recreate on the next call
+            self._known_keys.discard(key)
+            return 0.0
+        return -tokens / rate if tokens < 0 else 0.0
+
+
+_local_store = LocalQuotaStore()
+_database_store = DatabaseQuotaStore()
+
+
+def _store():
+    try:
+        name = current_app.config.get('GMAIL_QUOTA_STORE', 'database')
+    except RuntimeError:
+        name = 'local'
+    return _database_store if name == 'database' else _local_store
+
+
+def _limits():
+    try:
+        config = current_app.config
+        return (
+            config.get('GMAIL_USER_QUOTA_PER_SECOND', USER_UNITS_PER_SECOND),
+            config.get('GMAIL_PROJECT_QUOTA_PER_SECOND', PROJECT_UNITS_PER_SECOND),
+        )
+    except RuntimeError:
+        return USER_UNITS_PER_SECOND, PROJECT_UNITS_PER_SECOND
+
+
+def acquire(method, user_id=None, count=1):
+    """
+    Block until `count` calls of `method` fit in the user and project quota.
+    Returns the number of seconds waited.
+    """
+    units = QUOTA_UNITS.get(method, DEFAULT_UNITS) * count
+    user_rate, project_rate = _limits()
+
+    shard_rate = project_rate / PROJECT_SHARDS
+    buckets = [(f'project:{random.randrange(PROJECT_SHARDS)}', shard_rate)]
+    if user_id is not None:
+        buckets.append((f'user:{user_id}', user_rate))
+
+    store = _store()
+    wait = 0.0
+    for key, rate in buckets:
+        try:
+            wait = max(wait, store.take(key, units, rate, capacity=rate))
+        except Exception as e:
+            # Never block sending because the quota table is unavailable
+            logger.warning(f"Quota store error for {key}, using local bucket: {e}")
+            wait = max(wait, _local_store.take(key, units, rate, capacity=rate))
+
+    wait = min(wait, MAX_WAIT_SECONDS)
+    if wait > 0:
+        logger.info(f"⏳ Gmail quota: waiting {wait:.2f}s for {count} x {method} (user {user_id})")
+        time.sleep(wait)
+    return wait
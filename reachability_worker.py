@@ -0,0 +1,17 @@
+# reachability_worker.py
+"""
+Standalone worker that checks learnership email reachability.
+
+    python reachability_worker.py
+
+Runs as the `reachability` process in Procfile / render.yaml. Every minute it
+checks the addresses whose next check is due (domain_checker/recheck.py) and
+writes the results back to the learnership_email table. Passes hold a job
+lease, so a second copy only takes over when the first one stops.
+"""
+from app import app
+from domain_checker.email_checker_service import email_checker
+
+
+if __name__ == "__main__":
+    email_checker.run_worker(app)
@@ -0,0 +1,57 @@
+"""
+Create the indexes declared on the models (__table_args__ / index=True) that
+the database doesn't have yet.
+
+db.create_all() only builds indexes for new tables, so tables that already
+existed need this once. On PostgreSQL the indexes are built CONCURRENTLY so
+writes carry on while they build. Safe to re-run.
+
+Afterwards, check the plans with scripts_/check_query_plans.py --database-url.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from app import app, db
+
+
+def add_query_indexes():
+    with app.app_context():
+        print("🔧 ADDING QUERY INDEXES")
+        print("=" * 60)
+
+        engine = db.engine
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        created = 0
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in sorted(table.indexes, key=lambda index: index.name):
+                    if index.name in existing:
+                        continue
+
+                    columns = ", ".join(column.name for column in index.columns)
+                    print(f"📝 {index.name} on {table.name} ({columns})...")
+                    statement = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+                    if engine.dialect.name == 'postgresql':
+                        statement = statement.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+                    conn.execute(text(statement))
+                    created += 1
+
+            if engine.dialect.name == 'postgresql':
+                conn.execute(text("ANALYZE"))
+
+        print(f"✅ Created {created} index(es)")
+
+
+if __name__ == "__main__":
+    add_query_indexes()
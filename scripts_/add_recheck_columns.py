@@ -0,0 +1,73 @@
+"""
+Add learnership_email.check_history and next_check_at, then schedule every
+existing address from what is already known about it.
+
+Checked addresses get their last outcome as history and are due again one
+recheck interval after they were last checked; unchecked addresses are due
+now. Safe to re-run: rows that already have a history are left alone.
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, select, text, update
+
+from app import app, db
+from models import LearnershipEmail
+from domain_checker import recheck
+
+
+def add_recheck_columns():
+    with app.app_context():
+        print("🔧 ADDING RECHECK COLUMNS")
+        print("=" * 60)
+
+        columns = {c['name'] for c in inspect(db.engine).get_columns('learnership_email')}
+
+        with db.engine.begin() as conn:
+            if 'check_history' not in columns:
+                print("📝 Adding learnership_email.check_history...")
+                conn.execute(text("ALTER TABLE learnership_email ADD COLUMN check_history VARCHAR(32) NOT NULL DEFAULT ''"))
+            if 'next_check_at' not in columns:
+                print("📝 Adding learnership_email.next_check_at...")
+                conn.execute(text("ALTER TABLE learnership_email ADD COLUMN next_check_at TIMESTAMP"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_learnership_email_is_active_next_check_at "
+                "ON learnership_email (is_active, next_check_at)"
+            ))
+
+        print("📝 Scheduling existing addresses...")
+        now = datetime.utcnow()
+        rows = db.session.execute(
+            select(
+                LearnershipEmail.id,
+                LearnershipEmail.is_reachable,
+                LearnershipEmail.response_time,
+                LearnershipEmail.last_checked,
+                LearnershipEmail.check_count,
+            ).where(LearnershipEmail.check_history == '')
+        ).all()
+
+        updates = []
+        for row in rows:
+            if row.is_reachable is None or row.last_checked is None:
+                updates.append({'id': row.id, 'next_check_at': now})
+                continue
+            history = recheck.record_outcome('', row.is_reachable)
+            updates.append({
+                'id': row.id,
+                'check_history': history,
+                'next_check_at': recheck.next_check_at(row.last_checked, history, row.check_count, row.response_time),
+            })
+
+        if updates:
+            db.session.execute(update(LearnershipEmail), updates)
+        db.session.commit()
+
+        print(f"✅ Scheduled {len(updates)} address(es)")
+
+
+if __name__ == "__main__":
+    add_recheck_columns()
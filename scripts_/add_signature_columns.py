@@ -0,0 +1,62 @@
+"""
+Add conversation_message.has_signature and conversation.signature_message_count,
+then fill them from existing messages.
+
+New messages set both as they are stored; this covers rows written before
+the columns existed. Safe to re-run.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, inspect, or_, select, text, update
+
+from app import app, db
+from models import Conversation, ConversationMessage, CODECRAFTCO_SIGNATURES
+
+
+def add_signature_columns():
+    with app.app_context():
+        print("🔧 ADDING SIGNATURE COLUMNS")
+        print("=" * 60)
+
+        inspector = inspect(db.engine)
+        message_columns = {c['name'] for c in inspector.get_columns('conversation_message')}
+        conversation_columns = {c['name'] for c in inspector.get_columns('conversation')}
+
+        with db.engine.begin() as conn:
+            if 'has_signature' not in message_columns:
+                print("📝 Adding conversation_message.has_signature...")
+                conn.execute(text("ALTER TABLE conversation_message ADD COLUMN has_signature BOOLEAN NOT NULL DEFAULT FALSE"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_conversation_message_has_signature ON conversation_message (has_signature)"))
+            if 'signature_message_count' not in conversation_columns:
+                print("📝 Adding conversation.signature_message_count...")
+                conn.execute(text("ALTER TABLE conversation ADD COLUMN signature_message_count INTEGER NOT NULL DEFAULT 0"))
+
+        print("📝 Flagging messages with a CodeCraftCo signature...")
+        body = func.lower(ConversationMessage.body)
+        flagged = db.session.execute(
+            update(ConversationMessage)
+            .values(has_signature=or_(*[body.contains(signature, autoescape=True) for signature in CODECRAFTCO_SIGNATURES]))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        print("📝 Counting signature messages per conversation...")
+        counted = db.session.execute(
+            update(Conversation)
+            .values(signature_message_count=select(func.count(ConversationMessage.id))
+                    .where(
+                        ConversationMessage.conversation_id == Conversation.id,
+                        ConversationMessage.has_signature == True,
+                    )
+                    .scalar_subquery())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+
+        print(f"✅ Checked {flagged} message(s) across {counted} conversation(s)")
+
+
+if __name__ == "__main__":
+    add_signature_columns()
@@ -0,0 +1,36 @@
+"""
+Fill in application.updated_at where it is NULL.
+
+my_applications pages by (updated_at, id); rows without updated_at would
+never appear in a page, so give them their submission time instead.
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, update
+
+from app import app, db
+from models import Application
+
+
+def backfill_updated_at():
+    with app.app_context():
+        print("🔧 BACKFILLING application.updated_at")
+        print("=" * 60)
+
+        result = db.session.execute(
+            update(Application)
+            .where(Application.updated_at.is_(None))
+            .values(updated_at=func.coalesce(Application.sent_at, Application.submitted_at, datetime.utcnow()))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        print(f"✅ Updated {result.rowcount} application(s)")
+
+
+if __name__ == "__main__":
+    backfill_updated_at()
@@ -0,0 +1,24 @@
+"""
+Build the corporate_stage_daily rollup from existing applications.
+
+Run once after deploying the rollup table; afterwards it is kept current as
+applications change. Safe to re-run: it replaces the rollup rows it builds.
+Pass a corporate user id to rebuild only that user.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from corporate_rollup import rebuild
+
+
+if __name__ == "__main__":
+    corporate_user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    with app.app_context():
+        print("🔧 REBUILDING corporate_stage_daily")
+        print("=" * 60)
+        rows = rebuild(corporate_user_id)
+        print(f"✅ Wrote {rows} rollup row(s)")
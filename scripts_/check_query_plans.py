@@ -0,0 +1,217 @@
+"""
+EXPLAIN the hot route queries and fail if any of them falls back to a full
+table scan.
+
+    python scripts_/check_query_plans.py
+    python scripts_/check_query_plans.py --database-url postgresql://...
+
+With no URL the models are created in a scratch in-memory SQLite database
+and seeded with a few thousand rows. With a URL the existing database is only
+read. PostgreSQL is checked with enable_seqscan off, so a Seq Scan in the plan
+means no index can serve the query, not that the planner preferred a scan
+for a small table.
+
+Exits with status 1 when a plan regresses, so it can gate a deploy. The
+statements mirror the filters and ordering the routes use; keep them in step
+when a route's query changes.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select, text
+
+from application_list import SORT_AT
+from models import (
+    db, User, Application, Conversation, ConversationMessage, Document,
+    LearnershipEmail, UserEvent,
+)
+
+SEED_USERS = 50
+SEED_APPLICATIONS_PER_USER = 40
+SEED_MESSAGES_PER_CONVERSATION = 5
+
+
+def route_queries():
+    """(name, statement) for each query that must stay on an index"""
+    return [
+        ("my_applications page", select(Application)
+            .where(Application.user_id == 1, SORT_AT.isnot(None))
+            .order_by(SORT_AT.desc(), Application.id.desc())
+            .limit(21)),
+        ("applications sent to an address", select(Application.company_email, func.count(Application.id))
+            .where(Application.company_email.in_(['hr1@example.com', 'hr2@example.com']))
+            .group_by(Application.company_email)),
+        ("application by Gmail thread", select(Application)
+            .where(Application.gmail_thread_id == 'thread-1')),
+        ("corporate pipeline", select(Application)
+            .where(Application.corporate_user_id == 1)),
+        ("applicant inbox", select(Conversation)
+            .where(Conversation.applicant_user_id == 1, Conversation.is_active == True)
+            .order_by(Conversation.last_message_at.desc())),
+        ("corporate inbox", select(Conversation)
+            .where(
+                Conversation.corporate_user_id == 1,
+                Conversation.is_active == True,
+                Conversation.signature_message_count > 0,
+            )
+            .order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+            .limit(25)),
+        ("conversation messages", select(ConversationMessage)
+            .where(ConversationMessage.conversation_id == 1)
+            .order_by(ConversationMessage.gmail_timestamp.asc())),
+        ("active documents", select(Document)
+            .where(Document.user_id == 1, Document.is_active == True)),
+        ("reachable learnerships", select(LearnershipEmail)
+            .where(LearnershipEmail.is_reachable == True, LearnershipEmail.is_active == True)),
+        ("reachability checks due", select(LearnershipEmail.id, LearnershipEmail.email_address)
+            .where(LearnershipEmail.is_active == True, LearnershipEmail.next_check_at <= '2030-01-01')
+            .order_by(LearnershipEmail.next_check_at)
+            .limit(200)),
+        ("user event stream", select(UserEvent.id, UserEvent.kind, UserEvent.payload)
+            .where(UserEvent.user_id == 1, UserEvent.id > 0)
+            .order_by(UserEvent.id)
+            .limit(100)),
+    ]
+
+
+# =============================================================================
+# SEED
+# =============================================================================
+
+def seed(conn):
+    now = datetime.utcnow()
+    users = SEED_USERS
+    conn.execute(insert(User.__table__), [
+        {'id': i, 'email': f'user{i}@example.com', 'role': 'corporate' if i % 10 == 0 else 'user'}
+        for i in range(1, users + 1)
+    ])
+
+    applications, conversations, messages = [], [], []
+    for user_id in range(1, users + 1):
+        for n in range(SEED_APPLICATIONS_PER_USER):
+            app_id = len(applications) + 1
+            applications.append({
+                'id': app_id, 'user_id': user_id,
+                'company_name': f'Company {n}', 'company_email': f'hr{n}@example.com',
+                'gmail_thread_id': f'thread-{app_id}', 'email_status': 'sent',
+                'corporate_user_id': (n % 5 + 1) * 10,
+                'updated_at': now - timedelta(hours=app_id),
+            })
+            if n % 4 == 0:
+                conversation_id = len(conversations) + 1
+                conversations.append({
+                    'id': conversation_id, 'application_id': app_id,
+                    'gmail_thread_id': f'thread-{app_id}', 'subject': f'Re: Company {n}',
+                    'corporate_user_id': (n % 5 + 1) * 10, 'applicant_user_id': user_id,
+                    'last_message_at': now - timedelta(hours=app_id),
+                    'signature_message_count': n % 2,
+                })
+                for m in range(SEED_MESSAGES_PER_CONVERSATION):
+                    messages.append({
+                        'conversation_id': conversation_id,
+                        'gmail_message_id': f'message-{conversation_id}-{m}',
+                        'sender_id': user_id, 'sender_type': 'applicant', 'body': 'Hello',
+                        'gmail_timestamp': now - timedelta(minutes=m),
+                    })
+
+    conn.execute(insert(Application.__table__), applications)
+    conn.execute(insert(Conversation.__table__), conversations)
+    conn.execute(insert(ConversationMessage.__table__), messages)
+    conn.execute(insert(Document.__table__), [
+        {'user_id': user_id, 'document_type': 'cv', 'filename': f'cv{user_id}.pdf', 'is_active': user_id % 3 != 0}
+        for user_id in range(1, users + 1)
+    ])
+    conn.execute(insert(LearnershipEmail.__table__), [
+        {'company_name': f'Company {n}', 'email_address': f'hr{n}@example.com',
+         'is_reachable': n % 4 != 0, 'is_active': n % 10 != 0}
+        for n in range(500)
+    ])
+    conn.execute(insert(UserEvent.__table__), [
+        {'user_id': n % users + 1, 'kind': 'inbox', 'payload': '{}'}
+        for n in range(1000)
+    ])
+
+
+# =============================================================================
+# PLANS
+# =============================================================================
+
+def _sql(conn, statement):
+    return str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def sqlite_full_scans(conn, statement):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + _sql(conn, statement)).all()
+    plan = [row[-1] for row in rows]
+    # "SCAN application" is a full scan; "SEARCH ... USING INDEX" is not
+    return plan, [step for step in plan if re.match(r"SCAN \w+$", step)]
+
+
+def _seq_scans(node):
+    found = [node.get('Relation Name')] if node.get('Node Type') == 'Seq Scan' else []
+    for child in node.get('Plans', ()):
+        found += _seq_scans(child)
+    return found
+
+
+def postgres_full_scans(conn, statement):
+    with conn.begin():
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        raw = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + _sql(conn, statement)).scalar()
+    plan = raw if isinstance(raw, list) else json.loads(raw)
+    root = plan[0]['Plan']
+    return [json.dumps(root)], [f"Seq Scan on {name}" for name in _seq_scans(root)]
+
+
+def check_plans(engine, verbose=False):
+    full_scans = postgres_full_scans if engine.dialect.name == 'postgresql' else sqlite_full_scans
+    failures = 0
+
+    with engine.connect() as conn:
+        for name, statement in route_queries():
+            plan, scans = full_scans(conn, statement)
+            if scans:
+                failures += 1
+                print(f"❌ {name}: {', '.join(scans)}")
+            else:
+                print(f"✅ {name}")
+            if verbose or scans:
+                for step in plan:
+                    print(f"      {step}")
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help="check an existing database instead of a seeded scratch one")
+    parser.add_argument('--verbose', action='store_true', help="print every plan")
+    args = parser.parse_args()
+
+    print("🔍 CHECKING QUERY PLANS")
+    print("=" * 60)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        engine = create_engine("sqlite://")
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            seed(conn)
+
+    failures = check_plans(engine, verbose=args.verbose)
+    total = len(route_queries())
+    if failures:
+        print(f"\n❌ {failures} of {total} queries do a full table scan")
+        sys.exit(1)
+    print(f"\n✅ All {total} queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Recount every inbox_counter row from the conversation table.
+
+Run once after the counters started leaving out archived (inactive)
+conversations, so badges stop including ones counted before. Each row's
+version is bumped, so browsers holding an old badge ETag refetch. Safe to
+re-run.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+
+from app import app, db
+from models import InboxCounter
+from inbox_counters import rebuild
+
+
+def rebuild_inbox_counters():
+    with app.app_context():
+        print("🔧 REBUILDING INBOX COUNTERS")
+        print("=" * 60)
+
+        user_ids = db.session.scalars(select(InboxCounter.user_id)).all()
+        for user_id in user_ids:
+            rebuild(user_id)
+
+        print(f"✅ Recounted {len(user_ids)} inbox counter(s)")
+
+
+if __name__ == "__main__":
+    rebuild_inbox_counters()
@@ -0,0 +1,572 @@
+# send_jobs.py
+"""
+Durable bulk-send queue.
+
+Web requests only enqueue a SendJob with one SendJobItem per recipient and
+return straight away. The worker (send_worker.py) claims pending items with a
+short lease, sends them and records progress on the job, so a recycled web
+worker or a crashed send worker never loses queued applications.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, select, update
+
+from models import db, SendJob, SendJobItem
+
+# A 'sending' item whose lease is older than this is assumed orphaned
+# (worker died mid-send) and is handed out again.
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 2
+CLAIM_BATCH_SIZE = 5
+
+# Message templates per job (as Futures), so a bulk send reads and encodes its
+# attachments once instead of once per recipient.
+MAX_CACHED_TEMPLATES = 4
+_message_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+# =============================================================================
+# ENQUEUE
+# =============================================================================
+
+def enqueue_email_list_job(user, email_entries, reapply_ids=None):
+    """Queue one send per LearnershipEmail entry and return the SendJob"""
+    reapply_ids = {str(x) for x in (reapply_ids or [])}
+
+    job = SendJob(user_id=user.id, kind='email_list', total_items=len(email_entries))
+    db.session.add(job)
+    db.session.flush()
+
+    db.session.add_all([
+        SendJobItem(
+            job_id=job.id,
+            company_name=entry.company_name,
+            recipient_email=entry.email_address,
+            learnership_email_id=entry.id,
+            learnership_name="Email Application",
+            is_reapply=str(entry.id) in reapply_ids,
+        )
+        for entry in email_entries
+    ])
+    db.session.commit()
+
+    print(f"📥 Queued send job #{job.id} with {len(email_entries)} recipient(s) for user {user.id}")
+    return job
+
+
+def enqueue_learnership_job(user, learnerships, applications, attachment_ids=None, email_body=''):
+    """Queue sends for already-created Application rows (one per learnership dict)"""
+    pairs = list(zip(learnerships, applications))
+
+    job = SendJob(
+        user_id=user.id,
+        kind='learnership',
+        email_body=email_body or '',
+        attachment_ids=json.dumps([int(x) for x in (attachment_ids or [])]),
+        total_items=len(pairs),
+    )
+    db.session.add(job)
+    db.session.flush()
+
+    db.session.add_all([
+        SendJobItem(
+            job_id=job.id,
+            company_name=lr.get('company', 'Unknown'),
+            recipient_email=lr.get('apply_email'),
+            learnership_name=lr.get('title', 'Unknown'),
+            application_id=app_row.id,
+        )
+        for lr, app_row in pairs
+    ])
+    db.session.commit()
+
+    print(f"📥 Queued learnership job #{job.id} with {len(pairs)} application(s) for user {user.id}")
+    return job
+
+
+def get_active_jobs(user_id):
+    """Jobs that still have work outstanding, newest first"""
+    return (
+        SendJob.query.filter_by(user_id=user_id)
+        .filter(SendJob.status.in_(['queued', 'running']))
+        .order_by(SendJob.created_at.desc())
+        .all()
+    )
+
+
+# =============================================================================
+# CLAIMING
+# =============================================================================
+
+def _claimable(now):
+    stale_before = now - timedelta(seconds=LEASE_SECONDS)
+    return or_(
+        SendJobItem.status == 'pending',
+        and_(SendJobItem.status == 'sending', SendJobItem.locked_at < stale_before),
+    )
+
+
+def claim_items(worker_id, limit=CLAIM_BATCH_SIZE):
+    """
+    Lease up to `limit` items for this worker and return their ids.
+
+    Candidates are read with SKIP LOCKED on PostgreSQL; the conditional UPDATE
+    makes the claim safe on SQLite too, where FOR UPDATE is not rendered.
+    """
+    now = datetime.utcnow()
+
+    candidate_ids = [
+        row[0] for row in (
+            db.session.query(SendJobItem.id)
+            .filter(_claimable(now))
+            .order_by(SendJobItem.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+    ]
+
+    claimed = []
+    for item_id in candidate_ids:
+        result = db.session.execute(
+            update(SendJobItem)
+            .where(SendJobItem.id == item_id, _claimable(now))
+            .values(
+                status='sending',
+                locked_at=now,
+                locked_by=worker_id,
+                attempts=SendJobItem.attempts + 1,
+            )
+        )
+        if result.rowcount:
+            claimed.append(item_id)
+
+    if claimed:
+        job_ids = [
+            row[0] for row in
+            db.session.query(SendJobItem.job_id).filter(SendJobItem.id.in_(claimed)).distinct()
+        ]
+        db.session.execute(
+            update(SendJob)
+            .where(SendJob.id.in_(job_ids), SendJob.status == 'queued')
+            .values(status='running', started_at=now)
+        )
+
+    db.session.commit()
+    return claimed
+
+
+def _finish_item(item, status, error=None):
+    """Record the outcome of an item and bump its job counters atomically"""
+    counter = {
+        'sent': SendJob.sent_count,
+        'failed': SendJob.failed_count,
+        'skipped': SendJob.skipped_count,
+    }[status]
+
+    item.status = status
+    item.last_error = error
+    item.locked_at = None
+    item.locked_by = None
+
+    db.session.execute(
+        update(SendJob)
+        .where(SendJob.id == item.job_id)
+        .values({counter.key: counter + 1})
+    )
+    db.session.commit()
+
+    _complete_job_if_done(item.job_id)
+
+
+def _complete_job_if_done(job_id):
+    remaining = SendJobItem.query.filter(
+        SendJobItem.job_id == job_id,
+        SendJobItem.status.in_(['pending', 'sending']),
+    ).count()
+
+    if remaining == 0:
+        db.session.execute(
+            update(SendJob)
+            .where(SendJob.id == job_id, SendJob.status != 'completed')
+            .values(status='completed', finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+        with _templates_lock:
+            _message_templates.pop(job_id, None)
+        print(f"🏁 Send job #{job_id} completed")
+
+
+# =============================================================================
+# PROCESSING
+# =============================================================================
+
+def _get_message_template(job, build):
+    """Return the cached MessageTemplate for a job, building it on first use"""
+    # The global lock only hands out one Future per job; the first caller
+    # builds outside it and concurrent items of that job wait on the Future,
+    # so attachments are encoded once without blocking other jobs' lookups
+    with _templates_lock:
+        future = _message_templates.get(job.id)
+        building = future is None
+        if building:
+            future = _message_templates[job.id] = Future()
+            while len(_message_templates) > MAX_CACHED_TEMPLATES:
+                _message_templates.popitem(last=False)
+        else:
+            _message_templates.move_to_end(job.id)
+
+    if building:
+        try:
+            future.set_result(build())
+        except Exception as e:
+            with _templates_lock:
+                if _message_templates.get(job.id) is future:
+                    del _message_templates[job.id]
+            future.set_exception(e)
+    return future.result()
+
+
+def delete_applications_cascade(application_ids):
+    """
+    Delete applications and every row that references them with one
+    set-based statement per table (no commit). Their finished send_ledger
+    entries go too, so applying to the same address again sends a new email.
+    Returns the number deleted.
+    """
+    from models import Application, Conversation, ConversationMessage, CalendarEvent, ApplicationMessage
+    from send_ledger import forget
+    from corporate_rollup import remove_applications
+    from inbox_counters import forget_conversations
+    from stats_service import mark_changed
+
+    application_ids = list(application_ids)
+    if not application_ids:
+        return 0
+
+    conversation_ids = select(Conversation.id).where(Conversation.application_id.in_(application_ids))
+
+    # Bulk deletes skip the ORM events that keep the corporate rollup and inbox counters current
+    remove_applications(application_ids)
+    forget_conversations(db.session.scalars(conversation_ids).all())
+
+    recipients = db.session.execute(
+        select(Application.user_id, Application.company_email)
+        .where(Application.id.in_(application_ids), Application.company_email.isnot(None))
+        .distinct()
+    ).all()
+    owner_ids = db.session.scalars(
+        select(Application.user_id).where(Application.id.in_(application_ids)).distinct()
+    ).all()
+
+    statements = [
+        delete(ConversationMessage).where(ConversationMessage.conversation_id.in_(conversation_ids)),
+        delete(Conversation).where(Conversation.application_id.in_(application_ids)),
+        delete(CalendarEvent).where(CalendarEvent.application_id.in_(application_ids)),
+        delete(ApplicationMessage).where(ApplicationMessage.application_id.in_(application_ids)),
+        update(SendJobItem).where(SendJobItem.application_id.in_(application_ids)).values(application_id=None),
+    ]
+    for statement in statements:
+        db.session.execute(statement.execution_options(synchronize_session=False))
+
+    deleted = db.session.execute(
+        delete(Application)
+        .where(Application.id.in_(application_ids))
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+
+    for user_id, recipient_email in recipients:
+        forget(user_id, recipient_email)
+    mark_changed(owner_ids)
+
+    print(f"   🗑️ Deleted {deleted} application(s) and related records")
+    return deleted
+
+
+def _process_email_list_item(job, item, user):
+    """Send one 'apply via email list' item. Returns (status, error)."""
+    from models import Application
+    from app import build_application_message_template, send_application_email_with_gmail
+    from send_ledger import send_once
+
+    # A previous attempt already sent and recorded this one
+    if item.application_id:
+        previous = db.session.get(Application, item.application_id)
+        if previous and previous.gmail_message_id:
+            return 'sent', None
+
+    existing_ids = db.session.scalars(
+        select(Application.id).where(
+            Application.user_id == user.id,
+            Application.company_email == item.recipient_email
+        )
+    ).all()
+
+    if existing_ids:
+        if not item.is_reapply:
+            print(f"   ⚠️ Already applied to {item.company_name} (skipped)")
+            return 'skipped', 'Already applied'
+
+        print(f"   🔄 Re-applying to {item.company_name}")
+        delete_applications_cascade(existing_ids)
+        db.session.commit()
+
+    # The daily limit is checked again here, one unit per item: several jobs
+    # may have been queued against the same remaining allowance
+    if not user.use_application():
+        return 'skipped', 'Daily application limit reached'
+
+    template = _get_message_template(job, lambda: build_application_message_template(user))
+    try:
+        result = send_once(
+            user.id, item.recipient_email, template.content_hash(),
+            lambda headers: send_application_email_with_gmail(
+                item.recipient_email, item.company_name, user, template=template, headers=headers
+            )
+        )
+    except Exception:
+        user.release_application()
+        raise
+
+    # Only a send that goes out now uses up the unit
+    if result.get('recovered') or not result.get('success'):
+        user.release_application()
+    if result.get('duplicate'):
+        return 'skipped', result['message']
+
+    success = result.get("success", False)
+    message = result.get("message", "")
+    gmail_data = result.get("gmail_data", {})
+
+    application = Application(
+        user_id=user.id,
+        company_name=item.company_name,
+        company_email=item.recipient_email,
+        learnership_name=item.learnership_name or "Email Application",
+        status="submitted" if success else "pending",
+    )
+
+    if success:
+        application.email_status = "sent"
+        application.sent_at = datetime.utcnow()
+        application.gmail_message_id = gmail_data.get("id")
+        application.gmail_thread_id = gmail_data.get("threadId")
+        application.has_response = False
+    else:
+        application.email_status = "failed"
+
+    db.session.add(application)
+    db.session.flush()
+    item.application_id = application.id
+    db.session.commit()
+
+    if success:
+        return 'sent', None
+    return 'failed', message
+
+
+def _process_learnership_item(job, item, user):
+    """Send one learnership application created by apply_learnership."""
+    from models import Application, Document
+    from mailer import MessageTemplate, send_gmail_message
+    from credentials_manager import get_credentials
+    from send_ledger import send_once
+
+    app_row = db.session.get(Application, item.application_id) if item.application_id else None
+    if app_row is None:
+        return 'failed', 'Application record no longer exists'
+
+    if app_row.gmail_message_id:
+        return 'sent', None
+
+    if not item.recipient_email:
+        app_row.status = 'error'
+        db.session.commit()
+        return 'failed', 'Missing apply_email'
+
+    credentials = get_credentials(user.id)
+    if not credentials:
+        app_row.status = 'error'
+        db.session.commit()
+        return 'failed', 'Google authentication required.'
+
+    def build_template():
+        attachment_ids = json.loads(job.attachment_ids or '[]')
+        docs = Document.query.filter(
+            Document.id.in_(attachment_ids),
+            Document.user_id == user.id,
+            Document.is_active == True
+        ).all() if attachment_ids else []
+
+        file_paths = [
+            {'path': doc.file_path, 'filename': doc.original_filename}
+            for doc in docs
+        ]
+        return MessageTemplate(user.email, None, '', file_paths)
+
+    subject = f"Application for {item.learnership_name} – {user.full_name or user.email}"
+    body = f"""Dear Hiring Team at {item.company_name},
+
+I am writing to express my interest in the {item.learnership_name} position at {item.company_name}.
+
+{job.email_body or ''}
+
+Please find my documents attached. I look forward to discussing how my skills and experience align with this opportunity.
+
+Kind regards,
+{user.full_name or user.email}
+{f"Phone: {user.phone}" if user.phone else ''}
+Email: {user.email}
+"""
+
+    def send(headers):
+        message = template.render(item.recipient_email, subject=subject, body=body, headers=headers)
+        sent_message = send_gmail_message(credentials, message, user_id=user.id) or {}
+        return {
+            'success': True,
+            'message': 'Sent',
+            'gmail_data': {'id': sent_message.get('id'), 'threadId': sent_message.get('threadId')},
+        }
+
+    try:
+        template = _get_message_template(job, build_template)
+        result = send_once(
+            user.id, item.recipient_email,
+            template.content_hash(subject=subject, body=body), send
+        )
+    except Exception as e:
+        db.session.rollback()
+        app_row = db.session.get(Application, item.application_id)
+        app_row.status = 'error'
+        db.session.commit()
+        return 'failed', str(e)
+
+    if result.get('duplicate'):
+        return 'skipped', result['message']
+
+    gmail_data = result.get('gmail_data', {})
+    app_row = db.session.get(Application, item.application_id)
+    app_row.status = 'submitted'
+    app_row.email_status = 'sent'
+    app_row.sent_at = datetime.utcnow()
+    app_row.gmail_message_id = gmail_data.get('id')
+    app_row.gmail_thread_id = gmail_data.get('threadId')
+    db.session.commit()
+
+    return 'sent', None
+
+
+PROCESSORS = {
+    'email_list': _process_email_list_item,
+    'learnership': _process_learnership_item,
+}
+
+
+def process_item(item_id):
+    """Run one claimed item to completion (or back to pending for a retry)"""
+    from models import User
+
+    item = db.session.get(SendJobItem, item_id)
+    if item is None or item.status != 'sending':
+        return
+
+    job = item.job
+    print(f"\n📧 Job #{job.id} item #{item.id}: {item.company_name} - {item.recipient_email}")
+
+    if item.attempts > MAX_ATTEMPTS:
+        _finish_item(item, 'failed', f"Gave up after {MAX_ATTEMPTS} attempts")
+        return
+
+    try:
+        user = db.session.get(User, job.user_id)
+        if user is None:
+            _finish_item(item, 'failed', 'User not found')
+            return
+
+        status, error = PROCESSORS[job.kind](job, item, user)
+        print(f"   {'✅' if status == 'sent' else '⚠️'} {status}{f': {error}' if error else ''}")
+        _finish_item(item, status, error)
+
+    except Exception as e:
+        from mime_stream import AttachmentsTooLargeError
+
+        print(f"❌ Error for {item.company_name}: {e}")
+        traceback.print_exc()
+        db.session.rollback()
+
+        item = db.session.get(SendJobItem, item_id)
+        # Oversized attachments will not shrink on retry
+        if item.attempts >= MAX_ATTEMPTS or isinstance(e, AttachmentsTooLargeError):
+            _finish_item(item, 'failed', str(e))
+        else:
+            item.status = 'pending'
+            item.last_error = str(e)
+            item.locked_at = None
+            item.locked_by = None
+            db.session.commit()
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def _item_user_ids(item_ids):
+    rows = (
+        db.session.query(SendJobItem.id, SendJob.user_id)
+        .join(SendJob, SendJob.id == SendJobItem.job_id)
+        .filter(SendJobItem.id.in_(item_ids))
+        .all()
+    )
+    return dict(rows)
+
+
+def run_worker(app, poll_interval=POLL_INTERVAL, batch_size=None, stop_event=None):
+    """
+    Drain send jobs forever (or until stop_event is set).
+
+    Claimed items are sent concurrently on a thread pool, limited per user
+    and overall by send_pool (SEND_WORKERS_PER_USER / SEND_MAX_CONCURRENCY).
+    """
+    from send_pool import max_concurrency, run_in_slot
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    with app.app_context():
+        concurrency = max_concurrency()
+        batch_size = batch_size or max(CLAIM_BATCH_SIZE, concurrency)
+        print(f"📮 Send worker {worker_id} started ({concurrency} concurrent sends)")
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='send-worker') as pool:
+            while not (stop_event and stop_event.is_set()):
+                try:
+                    item_ids = claim_items(worker_id, batch_size)
+                    user_ids = _item_user_ids(item_ids) if item_ids else {}
+                except Exception as e:
+                    print(f"Send worker claim error: {e}")
+                    db.session.rollback()
+                    item_ids = []
+
+                if not item_ids:
+                    db.session.remove()
+                    time.sleep(poll_interval)
+                    continue
+
+                futures = [
+                    pool.submit(run_in_slot, app, user_ids.get(item_id), process_item, item_id)
+                    for item_id in item_ids
+                ]
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Send worker error: {e}")
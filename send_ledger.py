@@ -0,0 +1,220 @@
+# send_ledger.py
+"""
+Idempotent application sends.
+
+Every send is recorded in send_ledger, keyed by (user, recipient, content
+hash), and committed *before* the Gmail call:
+
+    pending --(Gmail accepted)---------> sent
+            --(Gmail refused)----------> failed
+            --(timeout, network, 5xx)--> unknown
+
+The message carries the row's send key in an X-CodeCraft-Send-Key header and
+in its Message-ID. If a worker dies between Gmail accepting the message and
+the ledger update, or the outcome was unknown, the next attempt looks the
+message up in the user's Sent mail by that key and records it instead of
+sending it again. A 'failed' entry never reached Gmail's outbox, so it is
+simply sent again.
+
+A pending entry counts as in flight for IN_FLIGHT_SECONDS, half the send-job
+item lease (send_jobs.LEASE_SECONDS). The window starts when send_once claims
+the attempt, a little after the item was leased, so by the time a stale item
+is handed to another worker its entry has already stopped counting as in
+flight and the new worker takes it over as a crashed attempt.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import delete, or_, update
+
+from mailer import GmailRefused
+from models import db, SendLedger
+from send_jobs import LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SEND_KEY_HEADER = 'X-CodeCraft-Send-Key'
+MESSAGE_ID_DOMAIN = 'codecraft.co.za'
+
+# A pending entry touched more recently than this is another worker mid-send.
+# Must stay well under the item lease, and well over one send (quota wait
+# plus send_gmail_message's retries).
+IN_FLIGHT_SECONDS = LEASE_SECONDS // 2
+
+
+def message_id(send_key):
+    return f"<{send_key}@{MESSAGE_ID_DOMAIN}>"
+
+
+def send_headers(send_key):
+    return {SEND_KEY_HEADER: send_key, 'Message-ID': message_id(send_key)}
+
+
+def refused(error):
+    """True if `error` means Gmail definitely did not send the message"""
+    if isinstance(error, GmailRefused):
+        return True
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return isinstance(error, HttpError) and status is not None and 400 <= int(status) < 500
+
+
+def _result(entry, message, recovered=False):
+    return {
+        'success': True,
+        'message': message,
+        'gmail_data': {'id': entry.gmail_message_id, 'threadId': entry.gmail_thread_id},
+        'recovered': recovered,
+    }
+
+
+def _get_or_create(user_id, recipient_email, content_hash):
+    """The ledger row for this send, inserted if missing (safe against concurrent inserts)"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    db.session.execute(
+        insert(SendLedger.__table__)
+        .values(user_id=user_id, recipient_email=recipient_email, content_hash=content_hash)
+        .on_conflict_do_nothing(index_elements=['user_id', 'recipient_email', 'content_hash'])
+    )
+    return SendLedger.query.filter_by(
+        user_id=user_id,
+        recipient_email=recipient_email,
+        content_hash=content_hash,
+    ).populate_existing().one()
+
+
+def find_sent_message(user_id, entry):
+    """
+    Look for a message this entry already sent. Tries the Message-ID first,
+    then recent Sent mail to the recipient, and only trusts a match whose
+    X-CodeCraft-Send-Key header equals the entry's key.
+    """
+    from credentials_manager import get_credentials
+    from gmail_client import get_gmail_service
+    from quota import acquire
+
+    credentials = get_credentials(user_id)
+    if not credentials:
+        raise Exception("Google authentication required.")
+
+    messages = get_gmail_service(user_id, credentials).users().messages()
+    queries = [
+        f"rfc822msgid:{message_id(entry.send_key)}",
+        f"in:sent to:{entry.recipient_email} newer_than:7d",
+    ]
+
+    for query in queries:
+        acquire('messages.list', user_id)
+        found = messages.list(userId='me', q=query, maxResults=10).execute().get('messages', [])
+
+        for candidate in found:
+            acquire('messages.get', user_id)
+            meta = messages.get(
+                userId='me', id=candidate['id'], format='metadata',
+                metadataHeaders=[SEND_KEY_HEADER]
+            ).execute()
+            headers = meta.get('payload', {}).get('headers', [])
+            if any(h['name'].lower() == SEND_KEY_HEADER.lower() and h['value'] == entry.send_key for h in headers):
+                return meta
+
+    return None
+
+
+def send_once(user_id, recipient_email, content_hash, send):
+    """
+    Send at most once per (user, recipient, content).
+
+    `send(headers)` performs the Gmail send with the given extra headers and
+    returns the usual {'success', 'message', 'gmail_data'} dict, with
+    'refused': True when Gmail definitely did not send it. Returns that
+    dict; 'recovered' is True when an earlier send was found instead, and
+    'duplicate' is True when another worker is sending the same message now.
+    """
+    entry = _get_or_create(user_id, recipient_email, content_hash)
+
+    if entry.status == 'sent':
+        db.session.commit()
+        return _result(entry, "Already sent", recovered=True)
+
+    if entry.attempts:
+        in_flight = entry.updated_at and entry.updated_at > datetime.utcnow() - timedelta(seconds=IN_FLIGHT_SECONDS)
+        if entry.status == 'pending' and in_flight:
+            db.session.commit()
+            return {'success': False, 'duplicate': True, 'message': "Same email is already being sent", 'gmail_data': {}}
+
+        # An earlier attempt may have reached Gmail without being recorded,
+        # unless Gmail refused it outright
+        sent = find_sent_message(user_id, entry) if entry.status != 'failed' else None
+        if sent:
+            entry.status = 'sent'
+            entry.gmail_message_id = sent.get('id')
+            entry.gmail_thread_id = sent.get('threadId')
+            db.session.commit()
+            logger.info(f"♻️ Recovered earlier send {entry.send_key} to {recipient_email}")
+            return _result(entry, "Recovered earlier send", recovered=True)
+
+    # Claim the attempt; losing this race means another worker is on it
+    claimed = db.session.execute(
+        update(SendLedger)
+        .where(SendLedger.id == entry.id, SendLedger.attempts == entry.attempts)
+        .values(status='pending', attempts=SendLedger.attempts + 1, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return {'success': False, 'duplicate': True, 'message': "Same email is already being sent", 'gmail_data': {}}
+
+    try:
+        result = send(send_headers(entry.send_key))
+    except Exception as e:
+        db.session.rollback()
+        _record(entry.id, 'failed' if refused(e) else 'unknown', error=str(e))
+        raise
+
+    gmail_data = result.get('gmail_data') or {}
+    if result.get('success'):
+        _record(entry.id, 'sent', gmail_data=gmail_data)
+    else:
+        _record(entry.id, 'failed' if result.get('refused') else 'unknown', error=result.get('message'))
+    return result
+
+
+def _record(entry_id, status, gmail_data=None, error=None):
+    values = {'status': status, 'last_error': error, 'updated_at': datetime.utcnow()}
+    if gmail_data:
+        values['gmail_message_id'] = gmail_data.get('id')
+        values['gmail_thread_id'] = gmail_data.get('threadId')
+
+    db.session.execute(
+        update(SendLedger)
+        .where(SendLedger.id == entry_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def forget(user_id, recipient_email):
+    """
+    Drop a recipient's ledger entries so a re-application sends again (no
+    commit). A pending entry is dropped too once it is no longer in flight;
+    one that another worker is sending right now is kept.
+    """
+    in_flight_since = datetime.utcnow() - timedelta(seconds=IN_FLIGHT_SECONDS)
+    db.session.execute(
+        delete(SendLedger)
+        .where(
+            SendLedger.user_id == user_id,
+            SendLedger.recipient_email == recipient_email,
+            or_(
+                SendLedger.status != 'pending',
+                SendLedger.updated_at.is_(None),
+                SendLedger.updated_at < in_flight_since,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
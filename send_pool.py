@@ -0,0 +1,99 @@
+# send_pool.py
+"""
+Concurrent send engine.
+
+Bulk sends run on a thread pool instead of one message at a time. Two limits
+apply on top of the Gmail quota pacing in quota.py:
+
+- SEND_WORKERS_PER_USER: how many of one user's messages are in flight at once
+  (shared by every bulk send of that user in this process)
+- SEND_MAX_CONCURRENCY: how many messages this process sends at once in total
+
+Each task runs in its own app context, so it gets its own SQLAlchemy session
+and its own cached Gmail client (gmail_client caches per thread).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS_PER_USER = 4
+DEFAULT_MAX_CONCURRENCY = 16
+
+_lock = threading.Lock()
+_global_slots = None
+_user_slots = {}
+
+
+def _config(name, default):
+    try:
+        return int(current_app.config.get(name, default))
+    except RuntimeError:
+        return default
+
+
+def workers_per_user():
+    return max(1, _config('SEND_WORKERS_PER_USER', DEFAULT_WORKERS_PER_USER))
+
+
+def max_concurrency():
+    return max(1, _config('SEND_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+
+
+def global_slots():
+    """Process-wide cap on concurrent sends"""
+    global _global_slots
+    with _lock:
+        if _global_slots is None:
+            _global_slots = threading.BoundedSemaphore(max_concurrency())
+        return _global_slots
+
+
+def user_slots(user_id):
+    """Per-user cap on concurrent sends"""
+    with _lock:
+        slots = _user_slots.get(user_id)
+        if slots is None:
+            slots = _user_slots[user_id] = threading.BoundedSemaphore(workers_per_user())
+        return slots
+
+
+def run_in_slot(app, user_id, fn, *args):
+    """Call fn(*args) in a fresh app context once a user and a global slot are free"""
+    with user_slots(user_id), global_slots():
+        with app.app_context():
+            return fn(*args)
+
+
+def run_sends(user_id, tasks, send_one):
+    """
+    Call send_one(task) for every task concurrently, bounded by the per-user
+    and global limits. Returns the results in task order; a task that raised
+    gets {'success': False, 'message': <error>}.
+    """
+    if not tasks:
+        return []
+
+    app = current_app._get_current_object()
+    results = [None] * len(tasks)
+    workers = min(workers_per_user(), len(tasks))
+
+    logger.info(f"🚀 Sending {len(tasks)} message(s) for user {user_id} with {workers} worker(s)")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'send-{user_id}') as pool:
+        futures = {
+            pool.submit(run_in_slot, app, user_id, send_one, task): index
+            for index, task in enumerate(tasks)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.error(f"❌ Send task {index} failed: {e}")
+                results[index] = {'success': False, 'message': str(e)}
+
+    return results
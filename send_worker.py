@@ -0,0 +1,15 @@
+# send_worker.py
+"""
+Standalone worker that drains queued send jobs.
+
+    python send_worker.py
+
+Runs as the `worker` process in Procfile / render.yaml. Several copies can run
+side by side; items are leased so each recipient is only sent once.
+"""
+from app import app
+from send_jobs import run_worker
+
+
+if __name__ == "__main__":
+    run_worker(app)
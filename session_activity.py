@@ -0,0 +1,97 @@
+# session_activity.py
+"""
+Per-request activity tracking without per-request database writes.
+
+record_activity() only updates an in-memory map. Whenever ACTIVITY_FLUSH_SECONDS
+have passed, the next call upserts every buffered timestamp into
+user_activity in one batch on its own connection, so the request's session
+is never committed for bookkeeping. Whatever is still buffered is flushed at
+exit.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 60
+
+_lock = threading.Lock()
+_pending = {}  # user_id -> last activity (naive UTC)
+_last_flush = time.monotonic()
+_app = None
+
+
+def _flush_interval():
+    try:
+        return current_app.config.get('ACTIVITY_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+    except RuntimeError:
+        return DEFAULT_FLUSH_SECONDS
+
+
+def record_activity(user_id, when=None):
+    """Buffer a user's activity timestamp; flushes the buffer when it is due"""
+    global _app
+    if _app is None:
+        _app = current_app._get_current_object()
+
+    with _lock:
+        _pending[user_id] = when or datetime.utcnow()
+    flush_activity()
+
+
+def flush_activity(force=False):
+    """Write buffered timestamps if the flush interval has passed. Returns rows written."""
+    global _last_flush
+
+    with _lock:
+        if not _pending or (not force and time.monotonic() - _last_flush < _flush_interval()):
+            return 0
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+
+    try:
+        _write(batch)
+    except Exception as e:
+        logger.warning(f"Could not flush activity for {len(batch)} user(s): {e}")
+        # Put the batch back unless newer activity arrived meanwhile
+        with _lock:
+            for user_id, when in batch.items():
+                _pending.setdefault(user_id, when)
+        return 0
+
+    return len(batch)
+
+
+def _write(batch):
+    from models import db, UserActivity
+
+    table = UserActivity.__table__
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'last_activity': statement.excluded.last_activity},
+    )
+
+    with db.engine.begin() as conn:
+        conn.execute(statement, [
+            {'user_id': user_id, 'last_activity': when}
+            for user_id, when in batch.items()
+        ])
+
+
+@atexit.register
+def _flush_at_exit():
+    if _pending and _app is not None:
+        with _app.app_context():
+            flush_activity(force=True)
@@ -0,0 +1,123 @@
+// Live updates pushed from /api/events (see user_events.py).
+// Pages register handlers instead of polling on timers:
+//
+//     liveEvents.on('message', data => ...);             // new conversation message
+//     liveEvents.on('inbox', data => ...);               // unread counts changed
+//     liveEvents.on('application_status', data => ...);  // email status changed
+//
+// One EventSource is opened per tab, on the first on() call, so pages that
+// register no handlers never open a stream. The browser reconnects by itself
+// and resends the last event id, so nothing is missed when the server
+// recycles the stream. Each open stream holds a server thread, so a tab that
+// stays hidden for HIDDEN_CLOSE_MS closes its stream and reopens it from the
+// last event id when it is shown again.
+//
+// The server only keeps a few streams open per process and answers the rest
+// with a 'busy' event and a long retry. Pages therefore keep their old timer
+// as a fallback, which runs only while no stream is open (busy, failed, or
+// no EventSource support) and stops once a stream sends 'ready':
+//
+//     liveEvents.fallback(updateInboxCounts, 30000);
+const HIDDEN_CLOSE_MS = 30000;
+
+class LiveEvents {
+    constructor(url) {
+        this.url = url;
+        this.eventSource = null;
+        this.handlers = {};
+        this.lastEventId = null;
+        this.hiddenTimer = null;
+        this.fallbacks = [];
+        this.polling = false;
+        document.addEventListener('visibilitychange', () => this.onVisibilityChange());
+    }
+
+    on(kind, handler) {
+        if (!window.EventSource) return;
+
+        if (!this.handlers[kind]) {
+            this.handlers[kind] = [];
+            if (this.eventSource) this.listen(kind);
+        }
+        this.handlers[kind].push(handler);
+        this.connect();
+    }
+
+    fallback(poll, intervalMs) {
+        const entry = { poll, intervalMs, timer: null };
+        this.fallbacks.push(entry);
+        if (this.polling) {
+            entry.timer = setInterval(poll, intervalMs);
+        } else if (!window.EventSource) {
+            this.startPolling();
+        }
+    }
+
+    startPolling() {
+        if (this.polling) return;
+        this.polling = true;
+        this.fallbacks.forEach(entry => {
+            entry.timer = setInterval(entry.poll, entry.intervalMs);
+        });
+    }
+
+    stopPolling() {
+        if (!this.polling) return;
+        this.polling = false;
+        this.fallbacks.forEach(entry => {
+            clearInterval(entry.timer);
+            entry.timer = null;
+        });
+    }
+
+    connect() {
+        if (this.eventSource || document.hidden) return;
+        const url = this.lastEventId
+            ? `${this.url}?last_event_id=${encodeURIComponent(this.lastEventId)}`
+            : this.url;
+        this.eventSource = new EventSource(url);
+        this.eventSource.addEventListener('ready', (event) => {
+            if (event.lastEventId) this.lastEventId = event.lastEventId;
+            this.stopPolling();
+        });
+        // Busy server: poll until the browser's retry gets a stream
+        this.eventSource.addEventListener('busy', () => this.startPolling());
+        this.eventSource.addEventListener('error', () => {
+            if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+                this.startPolling();
+            }
+        });
+        Object.keys(this.handlers).forEach(kind => this.listen(kind));
+    }
+
+    disconnect() {
+        if (!this.eventSource) return;
+        this.eventSource.close();
+        this.eventSource = null;
+    }
+
+    onVisibilityChange() {
+        clearTimeout(this.hiddenTimer);
+        if (document.hidden) {
+            this.hiddenTimer = setTimeout(() => this.disconnect(), HIDDEN_CLOSE_MS);
+        } else if (Object.keys(this.handlers).length) {
+            this.connect();
+        }
+    }
+
+    listen(kind) {
+        this.eventSource.addEventListener(kind, (event) => {
+            if (event.lastEventId) this.lastEventId = event.lastEventId;
+            let data;
+            try {
+                data = JSON.parse(event.data);
+            } catch (error) {
+                console.error('Live event parse error:', error);
+                return;
+            }
+            this.handlers[kind].forEach(handler => handler(data));
+        });
+    }
+}
+
+window.liveEvents = new LiveEvents('/api/events');
@@ -0,0 +1,176 @@
+# stats_service.py
+"""
+Per-user application statistics for the dashboard-style routes.
+
+All counters come from one SELECT over the user's applications with
+conditional aggregates (plus the documents count as a scalar subquery).
+Results are cached per user for CACHE_TTL_SECONDS and dropped as soon as a
+commit touches one of that user's Application or Document rows. Set-based
+UPDATE/DELETE statements on those tables clear the whole cache.
+
+Other processes (the send worker, Gmail sync) can't reach a web worker's
+cache, so every flush that changes a user's rows also writes a 'stats'
+user_event row, and a cached entry is only served while that user's latest
+'stats' event id is the one it was computed under (one indexed lookup).
+Set-based writes don't know their users; callers that do pass them to
+mark_changed(), and any others show up once the TTL runs out.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db, Application, Document, UserEvent
+
+CACHE_TTL_SECONDS = 60
+STATS_EVENT = 'stats'
+
+SENT_EMAIL_STATUSES = ('sent', 'delivered', 'read', 'responded')
+
+_lock = threading.Lock()
+_cache = {}  # user_id -> (expires_at, stats event id, stats)
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def compute_user_stats(user_id):
+    """Run the aggregate query for one user (no caching)"""
+    now = datetime.utcnow()
+
+    documents = (
+        select(func.count(Document.id))
+        .where(Document.user_id == user_id, Document.is_active == True)
+        .scalar_subquery()
+    )
+
+    row = db.session.execute(
+        select(
+            func.count(Application.id).label('total'),
+            _count_if(Application.status == 'pending').label('pending'),
+            _count_if(Application.status == 'submitted').label('submitted'),
+            _count_if(Application.has_response == True).label('responses'),
+            _count_if(Application.email_status == 'responded').label('email_responded'),
+            _count_if(Application.email_status.in_(SENT_EMAIL_STATUSES)).label('email_sent'),
+            # The my_applications "Email Sent" tab (no reply yet)
+            _count_if(Application.email_status.in_(('sent', 'delivered', 'read'))).label('email_sent_no_reply'),
+            _count_if(Application.email_status == 'failed').label('failed_emails'),
+            _count_if(Application.sent_at.isnot(None)).label('sent_emails'),
+            _count_if(Application.gmail_message_id.isnot(None)).label('gmail_tracked'),
+            _count_if(
+                (Application.email_status == 'sent') & (func.coalesce(Application.has_response, False) == False)
+            ).label('pending_responses'),
+            _count_if(Application.submitted_at >= now - timedelta(days=7)).label('created_last_7_days'),
+            # Same window as Application.is_recent(7)
+            _count_if(Application.sent_at > now - timedelta(days=8)).label('sent_last_7_days'),
+            _count_if(
+                Application.gmail_message_id.isnot(None)
+                & (Application.sent_at >= now - timedelta(days=30))
+                & Application.email_status.in_(('sent', 'delivered'))
+            ).label('needs_status_update'),
+            documents.label('documents'),
+        ).where(Application.user_id == user_id)
+    ).one()
+
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+
+def _latest_stats_event(user_id):
+    return db.session.scalar(
+        select(func.max(UserEvent.id))
+        .where(UserEvent.user_id == user_id, UserEvent.kind == STATS_EVENT)
+    ) or 0
+
+
+def get_user_stats(user_id):
+    """Cached stats dict for a user"""
+    now = time.monotonic()
+    marker = _latest_stats_event(user_id)
+    with _lock:
+        cached = _cache.get(user_id)
+    if cached and cached[0] > now and cached[1] == marker:
+        return dict(cached[2])
+
+    stats = compute_user_stats(user_id)
+    with _lock:
+        _cache[user_id] = (now + CACHE_TTL_SECONDS, marker, stats)
+    return dict(stats)
+
+
+def invalidate(user_id=None):
+    """Drop one user's cached stats, or everyone's"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def mark_changed(user_ids):
+    """
+    Record that set-based writes changed these users' rows, so every
+    process drops their cached stats once the session commits. No commit.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+    _write_stats_events(db.session.connection(), user_ids)
+    db.session.info.setdefault('stats_changed_users', set()).update(user_ids)
+
+
+def _write_stats_events(connection, user_ids):
+    connection.execute(insert(UserEvent.__table__), [
+        {'user_id': user_id, 'kind': STATS_EVENT, 'payload': '{}'}
+        for user_id in user_ids
+    ])
+
+
+# =============================================================================
+# INVALIDATION
+# =============================================================================
+
+_TRACKED = (Application, Document)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    flushed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, _TRACKED):
+            # Read the loaded value only; no lazy loads inside a flush
+            user_id = inspect(obj).dict.get('user_id')
+            if user_id is None:
+                session.info['stats_changed_all'] = True
+            else:
+                flushed.add(user_id)
+    if flushed:
+        # Same transaction as the change, so other processes see both together
+        _write_stats_events(session.connection(), flushed)
+        session.info.setdefault('stats_changed_users', set()).update(flushed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    if session.info.pop('stats_changed_all', False):
+        invalidate()
+    for user_id in session.info.pop('stats_changed_users', ()):
+        invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('stats_changed_users', None)
+    session.info.pop('stats_changed_all', None)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_on_bulk_write(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in _TRACKED:
+        # Affected users are unknown; cheap to recompute on next view
+        orm_execute_state.session.info['stats_changed_all'] = True
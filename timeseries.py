@@ -0,0 +1,110 @@
+# timeseries.py
+"""
+Time-series counts in one GROUP BY.
+
+histogram() buckets a datetime column by day or by week (weeks start on
+Monday) with an expression for the connected database, then zero-fills the
+buckets that have no rows. The dialect is read from the engine once, not
+sniffed from DATABASE_URL on every call.
+
+Per-user response histograms for the analytics page are cached for
+CACHE_TTL_SECONDS so reloads don't re-run the query each time.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, Application
+
+CACHE_TTL_SECONDS = 30
+TREND_WEEKS = 10
+
+_dialect = None
+_lock = threading.Lock()
+_cache = {}  # (user_id, name) -> (expires_at, value)
+
+
+def _dialect_name():
+    global _dialect
+    if _dialect is None:
+        _dialect = db.engine.dialect.name
+    return _dialect
+
+
+def bucket(column, unit='day'):
+    """SQL expression for the 'YYYY-MM-DD' start of the day/week containing `column`"""
+    if unit not in ('day', 'week'):
+        raise ValueError(f"Unknown bucket unit: {unit}")
+
+    if _dialect_name() == 'postgresql':
+        return func.to_char(func.date_trunc(unit, column), 'YYYY-MM-DD')
+
+    if unit == 'week':
+        # Forward to Sunday (or stay on it), then back to that week's Monday
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.date(column)
+
+
+def period_start(moment, unit='day'):
+    """Start of the day/week containing `moment`, matching bucket()"""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def histogram(column, start, periods, unit='day', filters=()):
+    """
+    Row counts per day/week for `periods` buckets from `start` (a bucket
+    boundary), oldest first, with empty buckets as 0.
+    """
+    step = timedelta(days=7 if unit == 'week' else 1)
+    end = start + step * periods
+    key = bucket(column, unit)
+
+    rows = db.session.execute(
+        select(key, func.count())
+        .where(column >= start, column < end, *filters)
+        .group_by(key)
+    ).all()
+
+    counts = {str(day)[:10]: count for day, count in rows}
+    return [counts.get((start + step * i).strftime('%Y-%m-%d'), 0) for i in range(periods)]
+
+
+def _cached(user_id, name, compute, fresh=False):
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get((user_id, name))
+    if cached and cached[0] > now and not fresh:
+        return cached[1]
+
+    value = compute()
+    with _lock:
+        _cache[(user_id, name)] = (now + CACHE_TTL_SECONDS, value)
+    return value
+
+
+def _response_filters(user_id):
+    return (Application.user_id == user_id,)
+
+
+def current_week_responses(user_id, fresh=False):
+    """
+    (monday, [responses received Monday..Sunday]) for this week; fresh=True
+    skips the cache, for refreshes prompted by an application_status event
+    """
+    monday = period_start(datetime.utcnow(), 'week')
+    return monday, _cached(user_id, 'current_week', lambda: histogram(
+        Application.response_received_at, monday, 7, 'day', _response_filters(user_id)
+    ), fresh)
+
+
+def weekly_response_trend(user_id, weeks=TREND_WEEKS):
+    """Responses received in each of the last `weeks` weeks, this week last"""
+    first_monday = period_start(datetime.utcnow(), 'week') - timedelta(weeks=weeks - 1)
+    return _cached(user_id, f'weekly_trend_{weeks}', lambda: histogram(
+        Application.response_received_at, first_monday, weeks, 'week', _response_filters(user_id)
+    ))
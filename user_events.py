@@ -0,0 +1,272 @@
+# user_events.py
+"""
+Server-sent events for a user's open pages (GET /api/events).
+
+An after_flush listener writes user_event rows in the same transaction as the
+change, whichever process makes it (a web request, the send worker or a Gmail
+sync):
+
+    message             a conversation message was ingested (each participant)
+    inbox               a conversation's unread count changed for the user
+    application_status  an Application.email_status changed (its owner)
+
+stats_service.py writes 'stats' rows to the same table to expire its cache
+in other processes; streams skip them.
+
+Pages subscribe through static/js/live_events.js instead of polling the JSON
+endpoints on timers.
+
+stream() sends the rows after the browser's Last-Event-ID. Commits in this
+process wake waiting streams straight away; rows written by other processes
+are found by an indexed (user_id, id) check every POLL_SECONDS. Streams end
+after STREAM_SECONDS and the browser reconnects from the last id it saw, so a
+stream never pins a worker thread for long.
+
+Each open stream holds a gunicorn thread, so at most MAX_OPEN_STREAMS run
+in one process; past that a connection gets a 'busy' event and a longer
+retry and closes, leaving the remaining threads for ordinary requests. A
+stream that ends while others were being turned away gets the same answer,
+so the slots rotate. live_events.js runs the page's old polling timers until
+a stream opens, and drops its stream while the tab is hidden.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db, Application, Conversation, ConversationMessage, UserEvent
+
+POLL_SECONDS = 3
+HEARTBEAT_SECONDS = 15
+STREAM_SECONDS = 55
+RETRY_MS = 3000
+BUSY_RETRY_MS = 30000
+MAX_OPEN_STREAMS = 8  # Per process; keep well under gunicorn's --threads
+BATCH_SIZE = 100
+
+RETENTION = timedelta(days=1)
+PRUNE_EVERY_SECONDS = 600
+
+_condition = threading.Condition()
+_stream_slots = threading.BoundedSemaphore(MAX_OPEN_STREAMS)
+_generation = {}  # user_id -> bumped on every commit that wrote events for them
+_last_prune = 0.0
+_last_turned_away = 0.0  # monotonic time a connection last found no free slot
+
+
+# =============================================================================
+# WRITE SIDE
+# =============================================================================
+
+def _message_events(connection, messages):
+    conversation_ids = {message.conversation_id for message in messages}
+    participants = {
+        row.id: (row.corporate_user_id, row.applicant_user_id)
+        for row in connection.execute(
+            select(Conversation.id, Conversation.corporate_user_id, Conversation.applicant_user_id)
+            .where(Conversation.id.in_(conversation_ids))
+        )
+    }
+    rows = []
+    for message in messages:
+        payload = {
+            'conversation_id': message.conversation_id,
+            'message_id': message.id,
+            'sender_type': message.sender_type,
+        }
+        for user_id in set(participants.get(message.conversation_id, ())):
+            if user_id:
+                rows.append((user_id, 'message', payload))
+    return rows
+
+
+def _application_event(application):
+    return (application.user_id, 'application_status', {
+        'id': application.id,
+        'status': application.status,
+        'email_status': application.email_status,
+        'has_response': application.email_status == 'responded',
+        'response_received_at': (
+            application.response_received_at.isoformat() if application.response_received_at else None
+        ),
+    })
+
+
+def _inbox_events(conversations):
+    """An 'inbox' event for each side whose unread count changed (the badge refetches)"""
+    rows = []
+    for conversation in conversations:
+        attrs = inspect(conversation).attrs
+        for user_id, count in (
+            (conversation.corporate_user_id, attrs.corporate_unread_count),
+            (conversation.applicant_user_id, attrs.applicant_unread_count),
+        ):
+            if user_id and count.history.has_changes():
+                rows.append((user_id, 'inbox', {'conversation_id': conversation.id}))
+    return rows
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_events(session, flush_context):
+    # new/dirty and attribute history still describe this flush; ids are assigned
+    messages = [obj for obj in session.new if isinstance(obj, ConversationMessage)]
+    conversations = [
+        obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, Conversation)
+    ]
+    applications = [
+        obj for obj in session.dirty
+        if isinstance(obj, Application) and obj.user_id
+        and inspect(obj).attrs.email_status.history.has_changes()
+    ]
+    if not (messages or conversations or applications):
+        return
+
+    connection = session.connection()
+    rows = _message_events(connection, messages) if messages else []
+    rows += _inbox_events(conversations)
+    rows += [_application_event(application) for application in applications]
+    if not rows:
+        return
+
+    connection.execute(insert(UserEvent.__table__), [
+        {'user_id': user_id, 'kind': kind, 'payload': json.dumps(payload)}
+        for user_id, kind, payload in rows
+    ])
+    session.info.setdefault('user_event_users', set()).update(user_id for user_id, _, _ in rows)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_streams(session):
+    users = session.info.pop('user_event_users', ())
+    if users:
+        with _condition:
+            for user_id in users:
+                _generation[user_id] = _generation.get(user_id, 0) + 1
+            _condition.notify_all()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_events(session):
+    session.info.pop('user_event_users', None)
+
+
+def prune(older_than=RETENTION):
+    """Delete events older than `older_than`; returns rows removed"""
+    result = db.session.execute(
+        delete(UserEvent).where(UserEvent.created_at < datetime.utcnow() - older_than)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _maybe_prune():
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_EVERY_SECONDS:
+        return
+    _last_prune = now
+    try:
+        prune()
+    except Exception as e:
+        db.session.rollback()
+        print(f"User event prune error: {e}")
+
+
+# =============================================================================
+# STREAM
+# =============================================================================
+
+def latest_event_id(user_id):
+    return db.session.scalar(
+        select(func.max(UserEvent.id)).where(UserEvent.user_id == user_id)
+    ) or 0
+
+
+def events_after(user_id, last_event_id, limit=BATCH_SIZE):
+    return db.session.execute(
+        select(UserEvent.id, UserEvent.kind, UserEvent.payload)
+        .where(UserEvent.user_id == user_id, UserEvent.id > last_event_id, UserEvent.kind != 'stats')
+        .order_by(UserEvent.id)
+        .limit(limit)
+    ).all()
+
+
+def _parse_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _wait(user_id, seen, timeout):
+    """Block until a local commit writes events for user_id or timeout; returns the generation"""
+    deadline = time.monotonic() + timeout
+    with _condition:
+        while _generation.get(user_id, 0) == seen:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _condition.wait(remaining)
+        return _generation.get(user_id, 0)
+
+
+def stream(user_id, last_event_id=None):
+    """
+    SSE text for one connection: events after `last_event_id` (the
+    Last-Event-ID header), or only new ones on a first connect.
+    Run inside stream_with_context.
+    """
+    global _last_turned_away
+    if not _stream_slots.acquire(blocking=False):
+        _last_turned_away = time.monotonic()
+        # Too many open streams here: the page polls until a later retry gets a slot
+        yield f"retry: {BUSY_RETRY_MS}\nevent: busy\ndata: {{}}\n\n"
+        return
+    try:
+        yield from _stream(user_id, last_event_id)
+    finally:
+        _stream_slots.release()
+
+
+def _stream(user_id, last_event_id):
+    opened_at = time.monotonic()
+    _maybe_prune()
+
+    last_id = _parse_event_id(last_event_id)
+    if last_id is None:
+        last_id = latest_event_id(user_id)
+    db.session.close()  # Don't hold a pooled connection while idle
+
+    # Sets the browser's Last-Event-ID even if no event arrives before we close;
+    # the 'ready' event lets the page reopen from here after closing a hidden tab
+    yield f"retry: {RETRY_MS}\nid: {last_id}\nevent: ready\ndata: {{}}\n\n"
+
+    generation = _generation.get(user_id, 0)
+    closes_at = time.monotonic() + STREAM_SECONDS
+    quiet_since = time.monotonic()
+
+    while time.monotonic() < closes_at:
+        rows = events_after(user_id, last_id)
+        db.session.close()
+
+        for row in rows:
+            last_id = row.id
+            yield f"id: {row.id}\nevent: {row.kind}\ndata: {row.payload}\n\n"
+
+        if rows:
+            quiet_since = time.monotonic()
+            if len(rows) == BATCH_SIZE:
+                continue
+        elif time.monotonic() - quiet_since >= HEARTBEAT_SECONDS:
+            # Comment line: keeps proxies from timing out, and finds closed tabs
+            quiet_since = time.monotonic()
+            yield ": keepalive\n\n"
+
+        generation = _wait(user_id, generation, POLL_SECONDS)
+
+    if _last_turned_away > opened_at:
+        # Others were turned away meanwhile: back off like them so the slot rotates
+        yield f"retry: {BUSY_RETRY_MS}\nevent: busy\ndata: {{}}\n\n"